@@ -1,7 +1,95 @@
+import io
+import os
+import copy
+import json
+import math
+import time
+import random
+import hashlib
+import warnings
+import tempfile
 import pandas
 import numpy
 import tableschema
 
+from pilot.cache import TTLCache
+from pilot.references import check_references, merge_reference_results
+from pilot.checksums import hash_file, save_checksums, DEFAULT_HASH_ALGORITHMS
+from pilot.summary import (summarize_dataframe, summarize_numeric,
+                           summarize_strings, summarize_rows, merge_summaries,
+                           get_summary_metadata, get_summary_size, to_json,
+                           from_json, SKETCH_ACCURACY)
+from pilot import metrics
+
+# Number of field definitions kept in the main search record. The full set
+# is stored separately as a field table.
+PREVIEW_FIELD_COUNT = 10
+FIELD_TABLE_KEYS = ['name', 'type', 'format', 'count', 'top', 'unique',
+                    'frequency', '25', '50', '75', 'mean', 'mean_ci', 'std',
+                    'min', 'max', 'reference']
+
+
+# Max number of values parsed, or described, at a time when analyzing
+# numeric matrix dataframes. Bounds memory use regardless of frame shape.
+NUMERIC_MATRIX_BLOCK_CELLS = 2 ** 21
+
+# Files smaller than this are sampled by reading every row, larger files by
+# seeking to random offsets.
+SAMPLE_FULL_READ_BYTES = 8 * 2 ** 20
+# z value for 95% confidence intervals on sampled estimates
+SAMPLE_CONFIDENCE = 0.95
+SAMPLE_Z = 1.96
+
+# Analysis results are cached by file path, size and modification time, so
+# files profiled with 'pilot analyze' are not analyzed again on upload.
+ANALYSIS_CACHE_TTL = 30 * 24 * 60 * 60
+analysis_cache = TTLCache('analysis', ANALYSIS_CACHE_TTL)
+# Column summaries are kept with the analysis cache so appended rows can be
+# analyzed on their own (see analyze_appended()), unless they would hold
+# more values than this.
+ANALYSIS_STATE_MAX_VALUES = 10 ** 6
+
+# Field definition types mapped to the dtypes used to read them back in.
+# Dates aren't hinted, so the parser recognizes them again the same way.
+FIELD_TYPE_DTYPES = {
+    'float64': 'float64',
+    'string': 'string',
+}
+
+
+def get_dtype_hints(field_definitions):
+    """
+    Build a dtype map for read_dataframe() from the field definitions of a
+    previous analysis, so re-analyzing a new version of the same dataframe
+    can skip type inference.
+    """
+    return {f['name']: FIELD_TYPE_DTYPES[f['type']]
+            for f in field_definitions or []
+            if f.get('type') in FIELD_TYPE_DTYPES}
+
+
+def read_dataframe(filename, dtypes=None):
+    """
+    Read a tab separated dataframe. Uses the multithreaded pyarrow parser
+    with Arrow backed columns if pyarrow is installed, otherwise falls back
+    to the default pandas parser. If dtype hints don't match the data, the
+    file is read again with types inferred.
+    :param filename: Path to the dataframe
+    :param dtypes: Optional dict of column names to dtypes, as returned by
+    get_dtype_hints()
+    """
+    try:
+        import pyarrow  # noqa: F401
+        kwargs = {'engine': 'pyarrow', 'dtype_backend': 'pyarrow'}
+    except ImportError:
+        kwargs = {}
+    if dtypes:
+        try:
+            return pandas.read_csv(filename, sep='\t', dtype=dtypes, **kwargs)
+        except (ValueError, TypeError):
+            pass
+    return pandas.read_csv(filename, sep='\t', **kwargs)
+
 
 def get_preview_byte_count(filename, num_rows=11):
     """Count and return number of bytes for the first 11 rows in the given
@@ -25,7 +113,7 @@ def get_pandas_field_metadata(pandas_col_metadata, field_name):
         'name': field_name,
         'type': 'string' if str(pmeta.dtype) == 'object' else str(pmeta.dtype),
         'count': int(pmeta['count']),
-        'top': pmeta['top'],
+        'top': pmeta.get('top', numpy.nan),
 
         # string statistics
         'unique': pmeta.get('unique', numpy.nan),
@@ -40,15 +128,26 @@ def get_pandas_field_metadata(pandas_col_metadata, field_name):
         'min': pmeta.get('min', numpy.nan),
         'max': pmeta.get('max', numpy.nan),
     }
+    return clean_field_metadata(metadata)
+
 
+def clean_field_metadata(metadata):
+    """Strip NAN values from field metadata, and coerce numpy and pandas
+    types into regular ints and floats. Dates are kept as ISO strings."""
     # Remove all NAN values
-    cleaned_metadata = {k: v for k, v in metadata.items()
-                        if isinstance(v, str) or not numpy.isnan(v)}
+    cleaned_metadata = {}
+    for k, v in metadata.items():
+        if hasattr(v, 'isoformat'):
+            # Date columns, which the pyarrow parser recognizes
+            v = v.isoformat()
+        if isinstance(v, str) or not pandas.isna(v):
+            cleaned_metadata[k] = v
 
     # Pandas has special types for things. Coerce them to be regular
     # ints and floats
     for name in ['25', '50', '75', 'mean', 'std', 'min', 'max']:
-        if name in cleaned_metadata:
+        if name in cleaned_metadata and \
+                not isinstance(cleaned_metadata[name], str):
             cleaned_metadata[name] = float(cleaned_metadata[name])
     for name in ['count', 'unique', 'frequency']:
         if name in cleaned_metadata:
@@ -56,6 +155,342 @@ def get_pandas_field_metadata(pandas_col_metadata, field_name):
     return cleaned_metadata
 
 
+def get_numeric_stats(values):
+    """
+    Compute the same statistics as pandas describe() for every column of a
+    2D float array at once, using nan-aware NumPy reductions along axis 0.
+    Returns a dict of statistic names to arrays with one value per column.
+    """
+    counts = (~numpy.isnan(values)).sum(axis=0)
+    stats = {'count': counts}
+    if values.size:
+        # All-NAN columns produce NAN stats (and warnings), which are
+        # stripped later like any other missing statistic.
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            stats['mean'] = numpy.nanmean(values, axis=0)
+            stats['std'] = numpy.nanstd(values, axis=0, ddof=1)
+        # Sorting pushes NANs to the end of each column, so min, max and
+        # the (linearly interpolated) percentiles can be read off directly
+        # instead of calling nanpercentile column by column.
+        ordered = numpy.sort(values, axis=0)
+        last = numpy.maximum(counts - 1, 0)
+        for name, q in [('min', 0), ('25', .25), ('50', .5), ('75', .75),
+                        ('max', 1)]:
+            pos = last * q
+            low = numpy.floor(pos).astype(int)
+            high = numpy.ceil(pos).astype(int)
+            low_v = numpy.take_along_axis(ordered, low[None, :], 0)[0]
+            high_v = numpy.take_along_axis(ordered, high[None, :], 0)[0]
+            stat = low_v + (high_v - low_v) * (pos - low)
+            stat[counts == 0] = numpy.nan
+            stats[name] = stat
+    return stats
+
+
+def get_stats_field_metadata(names, stats):
+    """Turn stats from get_numeric_stats() into a list of field metadata"""
+    field_metadata = []
+    for col, name in enumerate(names):
+        metadata = {'name': name, 'type': 'float64'}
+        metadata.update({k: v[col] for k, v in stats.items()})
+        field_metadata.append(clean_field_metadata(metadata))
+    return field_metadata
+
+
+def get_numeric_field_metadata(numeric_df):
+    """
+    Describe every column of an all-numeric dataframe at once, instead of
+    describing each column separately. Returns a list of field metadata in
+    the same order as the columns.
+    """
+    values = numeric_df.to_numpy(dtype=numpy.float64, na_value=numpy.nan)
+    return get_stats_field_metadata(numeric_df.columns,
+                                    get_numeric_stats(values))
+
+
+def is_numeric_matrix(filename, sample_rows=100):
+    """
+    Check whether a dataframe looks like a numeric matrix: an optional ID
+    column followed only by numeric columns. Only the first sample_rows are
+    checked, read_numeric_matrix() will raise a ValueError if a later row
+    doesn't fit.
+    """
+    sample = pandas.read_csv(filename, sep='\t', nrows=sample_rows)
+    dtypes = list(sample.dtypes)
+    return len(dtypes) > 1 and all(pandas.api.types.is_numeric_dtype(dt)
+                                   for dt in dtypes[1:])
+
+
+def iter_numeric_chunks(filename, names, has_id, dtype, chunk_rows):
+    """
+    Parse a numeric matrix dataframe chunk by chunk, yielding tuples of
+    (ID column values or None, 2D array of the numeric block). Uses the
+    pyarrow streaming CSV reader if it is installed, otherwise pandas.
+    """
+    numeric_names = names[1:] if has_id else names
+    try:
+        from pyarrow import csv, float64, string
+    except ImportError:
+        csv = None
+
+    if csv:
+        column_types = {name: float64() for name in numeric_names}
+        if has_id:
+            column_types[names[0]] = string()
+        # Rough estimate of bytes per row, to keep blocks near chunk_rows
+        block_size = max(chunk_rows * len(names) * 8, 1 << 20)
+        reader = csv.open_csv(
+            filename,
+            read_options=csv.ReadOptions(block_size=block_size),
+            parse_options=csv.ParseOptions(delimiter='\t'),
+            convert_options=csv.ConvertOptions(column_types=column_types))
+        for batch in reader:
+            columns = batch.columns[1:] if has_id else batch.columns
+            block = numpy.empty((batch.num_rows, len(columns)), dtype=dtype)
+            for col, values in enumerate(columns):
+                block[:, col] = values.to_numpy(zero_copy_only=False)
+            ids = batch.column(0).to_pandas() if has_id else None
+            yield ids, block
+        return
+
+    dtypes = {name: dtype for name in numeric_names}
+    if has_id:
+        dtypes[names[0]] = 'object'
+    for chunk in pandas.read_csv(filename, sep='\t', dtype=dtypes,
+                                 chunksize=chunk_rows):
+        ids = chunk.iloc[:, 0] if has_id else None
+        numeric = chunk.iloc[:, 1:] if has_id else chunk
+        yield ids, numeric.to_numpy(dtype=dtype, na_value=numpy.nan)
+
+
+def read_numeric_matrix(filename, cache, dtype=numpy.float64,
+                        block_cells=NUMERIC_MATRIX_BLOCK_CELLS):
+    """
+    Stream the numeric block of a numeric matrix dataframe into a binary
+    cache file, and return it memory mapped so the whole matrix never needs
+    to fit in memory at once. The first column is kept separately if it
+    isn't numeric.
+    :param filename: Path to the dataframe
+    :param cache: Open binary file to hold the numeric block
+    :param dtype: numpy.float64, or numpy.float32 to halve the cache size
+    :param block_cells: Max number of values to parse at a time
+    :return: tuple of (numeric column names, memmap of shape (rows, cols),
+    pandas Series of the ID column or None if the first column is numeric)
+    """
+    sample = pandas.read_csv(filename, sep='\t', nrows=100)
+    names = list(sample.columns)
+    has_id = not pandas.api.types.is_numeric_dtype(sample.dtypes.iloc[0])
+    numeric_names = names[1:] if has_id else names
+    chunk_rows = max(1, block_cells // len(names))
+    id_chunks, nrows = [], 0
+    for ids, block in iter_numeric_chunks(filename, names, has_id, dtype,
+                                          chunk_rows):
+        if has_id:
+            id_chunks.append(ids)
+        cache.write(block.tobytes())
+        nrows += len(block)
+    cache.flush()
+    shape = (nrows, len(numeric_names))
+    matrix = numpy.memmap(cache, dtype=dtype, mode='r', shape=shape) \
+        if nrows and numeric_names else numpy.empty(shape, dtype=dtype)
+    ids = None
+    if has_id:
+        ids = pandas.concat(id_chunks) if id_chunks else \
+            pandas.Series([], dtype='object')
+        ids = ids.rename(names[0])
+    return numeric_names, matrix, ids
+
+
+def get_numeric_matrix_metadata(filename, dtype=numpy.float64,
+                                block_cells=NUMERIC_MATRIX_BLOCK_CELLS,
+                                summaries=None):
+    """
+    Fast path for describing numeric matrix dataframes (see
+    is_numeric_matrix()). The numeric block is parsed straight into a memory
+    mapped float array, and statistics are computed over blocks of columns
+    holding at most block_cells values. Returns a tuple of (dict of column
+    names to field metadata, number of rows).
+    If a dict is given as summaries, it is filled with column summaries
+    (see pilot.summary).
+    """
+    with tempfile.TemporaryFile() as cache:
+        names, matrix, ids = read_numeric_matrix(filename, cache, dtype,
+                                                 block_cells)
+        pandas_info = {}
+        if ids is not None:
+            id_info = ids.to_frame().describe(include='all')
+            pandas_info[ids.name] = get_pandas_field_metadata(id_info,
+                                                              ids.name)
+            if summaries is not None:
+                summaries[ids.name] = summarize_strings(ids)
+        block_cols = max(1, block_cells // max(matrix.shape[0], 1))
+        for start in range(0, len(names), block_cols):
+            block = numpy.array(matrix[:, start:start + block_cols],
+                                dtype=numpy.float64)
+            block_names = names[start:start + block_cols]
+            pandas_info.update(zip(block_names, get_stats_field_metadata(
+                block_names, get_numeric_stats(block))))
+            if summaries is not None:
+                summaries.update((name, summarize_numeric(block[:, col]))
+                                 for col, name in enumerate(block_names))
+        nrows = matrix.shape[0]
+        del matrix
+    return pandas_info, nrows
+
+
+def describe_dataframe(df):
+    """Describe all columns in a dataframe, returning a dict of column names
+    to field metadata."""
+    numeric_df = df.select_dtypes(include='number')
+    pandas_info = {name: metadata for name, metadata in zip(
+        numeric_df.columns, get_numeric_field_metadata(numeric_df))}
+    other_df = df.drop(columns=numeric_df.columns)
+    if len(other_df.columns):
+        other_info = other_df.describe(include='all')
+        pandas_info.update({name: get_pandas_field_metadata(other_info, name)
+                            for name in other_df.columns})
+        for name in other_df.columns:
+            # Dates are described like numbers, with ISO string statistics
+            if pandas.api.types.is_datetime64_any_dtype(other_df[name]):
+                pandas_info[name]['type'] = 'date'
+    return pandas_info
+
+
+def reservoir_sample_lines(fileobj, sample_size, rand):
+    """Sample lines from fileobj in one streaming pass (Algorithm R).
+    Returns a tuple of (sampled lines, total number of lines)."""
+    sample, total = [], 0
+    for total, line in enumerate(fileobj, 1):
+        if len(sample) < sample_size:
+            sample.append(line)
+        else:
+            slot = rand.randrange(total)
+            if slot < sample_size:
+                sample[slot] = line
+    return sample, total
+
+
+def offset_sample_lines(fileobj, start, end, sample_size, rand):
+    """
+    Sample lines by seeking to random byte offsets between start and end,
+    and resyncing on the next newline. Lines are found at most once, so
+    fewer than sample_size lines may be returned. Reads only the sampled
+    lines, no matter how large the file is.
+    """
+    offsets = sorted(rand.randrange(start, end) for _ in range(sample_size))
+    sample, seen = [], set()
+    for offset in offsets:
+        fileobj.seek(max(offset - 1, start))
+        if offset > start:
+            # Discard the (possibly partial) line we landed in. Landing right
+            # after a newline means the next line is whole.
+            fileobj.readline()
+        line_start = fileobj.tell()
+        line = fileobj.readline()
+        if line and line_start not in seen:
+            seen.add(line_start)
+            sample.append(line)
+    return sample
+
+
+def estimate_row_count(data_bytes, line_lengths):
+    """Estimate the number of rows from the total bytes of data and the
+    lengths of sampled lines. Returns a tuple of (estimate, (low, high)) where
+    (low, high) is a SAMPLE_CONFIDENCE confidence interval."""
+    lengths = numpy.array(line_lengths, dtype=numpy.float64)
+    mean = lengths.mean()
+    stderr = lengths.std(ddof=1) / math.sqrt(len(lengths)) \
+        if len(lengths) > 1 else 0
+    estimate = int(round(data_bytes / mean))
+    low = int(data_bytes // (mean + SAMPLE_Z * stderr))
+    high = int(math.ceil(data_bytes / max(mean - SAMPLE_Z * stderr, 1)))
+    return estimate, (low, high)
+
+
+def get_sampled_metadata(filename, sample_size, seed=None):
+    """
+    Approximate the field metadata of a dataframe from a random sample of
+    sample_size rows, instead of scanning the whole file. Small files are
+    reservoir sampled in one pass, larger files are sampled at random byte
+    offsets. Counts and frequencies are scaled up to the estimated number of
+    rows, and means get a 'mean_ci' confidence interval. Unique values are
+    only counted within the sample.
+    :return: tuple of (dict of column names to field metadata, estimated
+    number of rows, dict describing the sample, tableschema fields inferred
+    from the sample)
+    """
+    rand = random.Random(seed)
+    file_size = os.path.getsize(filename)
+    with open(filename, 'rb') as fh:
+        header = fh.readline()
+        if file_size <= SAMPLE_FULL_READ_BYTES:
+            sample, numrows = reservoir_sample_lines(fh, sample_size, rand)
+            method, rows_ci = 'reservoir', (numrows, numrows)
+        else:
+            sample = offset_sample_lines(fh, len(header), file_size,
+                                         sample_size, rand)
+            method = 'offset'
+            numrows, rows_ci = estimate_row_count(file_size - len(header),
+                                                  [len(s) for s in sample])
+
+    data = header + b''.join(sample)
+    df = pandas.read_csv(io.BytesIO(data), sep='\t')
+    pandas_info = describe_dataframe(df)
+    # Infer the schema from the sample too, the whole file may be large
+    fields = (get_numeric_matrix_fields({name: pandas_info[name]
+                                         for name in df.columns}) or
+              infer_fields(io.BytesIO(data), format='tsv'))
+    scale = numrows / len(df.index) if len(df.index) else 0
+    for metadata in pandas_info.values():
+        for name in ['count', 'frequency']:
+            if name in metadata:
+                metadata[name] = int(round(metadata[name] * scale))
+        if 'mean' in metadata and 'std' in metadata:
+            margin = SAMPLE_Z * metadata['std'] / math.sqrt(len(df.index))
+            metadata['mean_ci'] = [metadata['mean'] - margin,
+                                   metadata['mean'] + margin]
+    sampled = {
+        'method': method,
+        'sample_size': len(df.index),
+        'confidence': SAMPLE_CONFIDENCE,
+        'numrows_ci': list(rows_ci),
+    }
+    return pandas_info, numrows, sampled, fields
+
+
+def get_field_table(column_metadata):
+    """
+    Pack a list of field definitions into a compact columnar form, where
+    each key maps to a list with one value per field (or None if a field does
+    not have it). Keys no field uses are left out entirely.
+    Example: {'name': ['a', 'b'], 'type': ['float64', 'string'], ...}
+    """
+    keys = [k for k in FIELD_TABLE_KEYS
+            if any(k in column for column in column_metadata)]
+    return {k: [column.get(k) for column in column_metadata] for k in keys}
+
+
+def unpack_field_table(field_table):
+    """Reverse of get_field_table(), returns a list of field definitions"""
+    return [{k: values[i] for k, values in field_table.items()
+             if values[i] is not None}
+            for i in range(len(field_table['name']))]
+
+
+def dump_field_table(field_table):
+    """Serialize a field table as JSON Lines, one field definition per line,
+    for the field table file stored next to a dataframe"""
+    return ''.join(json.dumps(field) + '\n'
+                   for field in unpack_field_table(field_table))
+
+
+def load_field_table(lines):
+    """Reverse of dump_field_table(), from an iterable of lines"""
+    return get_field_table([json.loads(line) for line in lines
+                            if line.strip()])
+
+
 def get_foreign_key(foreign_keys, column):
     if not foreign_keys:
         return{'reference': None}
@@ -63,28 +498,64 @@ def get_foreign_key(foreign_keys, column):
     return {'reference': ref}
 
 
-def analyze_dataframe(filename, foreign_keys=None):
-    # Pandas analysis
-    df = pandas.read_csv(filename, sep='\t')
-    pandas_info = df.describe(include='all')
-    # Tableschema analysis
-    ts_info = tableschema.Schema(tableschema.infer(filename)).descriptor
+def add_reference_checks(column_metadata, filename, reference_indexes,
+                         dataframe=None):
+    """Check foreign key columns and add the match results to each field's
+    'reference' metadata"""
+    checks = check_references(filename, reference_indexes, dataframe)
+    for field in column_metadata:
+        if field.get('reference') and field['name'] in checks:
+            field['reference'] = dict(field['reference'],
+                                      **checks[field['name']])
+
+
+def get_numeric_matrix_fields(pandas_info):
+    """
+    The tableschema fields of a numeric matrix (see is_numeric_matrix()),
+    built from its pandas metadata instead of inferring them from the file,
+    which is slow for wide matrices.
+    :return: list of fields, or None if pandas_info isn't a numeric matrix
+    """
+    types = [info.get('type') for info in pandas_info.values()]
+    if len(types) < 2 or not all(t == 'float64' for t in types[1:]):
+        return None
+    return [{'name': name,
+             'type': 'string' if info.get('type') == 'string' else 'number',
+             'format': 'default'}
+            for name, info in pandas_info.items()]
 
+
+def infer_fields(source, **options):
+    """Infer tableschema fields from a filename or file object. Options are
+    passed to tableschema.infer()."""
+    return tableschema.Schema(
+        tableschema.infer(source, **options)).descriptor['fields']
+
+
+def get_column_metadata(filename, pandas_info, foreign_keys=None,
+                        fields=None):
+    """Combine the tableschema fields of a dataframe with its pandas
+    metadata and foreign keys. Fields are inferred from the file unless
+    given."""
+    if fields is None:
+        fields = infer_fields(filename)
     column_metadata = []
-    for column in ts_info['fields'][:10]:
+    for column in fields:
         df_metadata = column.copy()
-        col_name = column['name']
-        df_metadata.update(get_pandas_field_metadata(pandas_info, col_name))
+        df_metadata.update(pandas_info.get(column['name'], {}))
         df_metadata.update(get_foreign_key(foreign_keys, column))
         column_metadata.append(df_metadata)
+    return column_metadata
+
 
+def get_dataframe_metadata(filename, column_metadata, numrows, numcols,
+                           sampled=None, approximate=None):
     dataframe_metadata = {
         'name': 'Data Dictionary',
-        # df.shape[0] seems to have issues determining rows
-        'numrows': len(df.index),
-        'numcols': df.shape[1],
+        'numrows': numrows,
+        'numcols': numcols,
         'previewbytes': get_preview_byte_count(filename),
-        'field_definitions': column_metadata,
+        'field_definitions': column_metadata[:PREVIEW_FIELD_COUNT],
         'labels': {
             'name': 'Column Name',
             'type': 'Data Type',
@@ -95,6 +566,7 @@ def analyze_dataframe(filename, foreign_keys=None):
             '75': '75th Percentile',
             'std': 'Standard Deviation',
             'mean': 'Mean Value',
+            'mean_ci': 'Confidence Interval of the Mean (sampled only)',
             'min': 'Minimum Value',
             'max': 'Maximum Value',
             'unique': 'Unique Values',
@@ -103,4 +575,239 @@ def analyze_dataframe(filename, foreign_keys=None):
             'reference': 'Link to resource definition'
         }
     }
+    if sampled:
+        dataframe_metadata['sampled'] = sampled
+    if approximate:
+        dataframe_metadata['approximate'] = approximate
+    if len(column_metadata) > PREVIEW_FIELD_COUNT:
+        dataframe_metadata['field_table'] = get_field_table(column_metadata)
+    return dataframe_metadata
+
+
+def analyze_dataframe(filename, foreign_keys=None, dtypes=None,
+                      sample_size=None, reference_indexes=None,
+                      summaries=None):
+    """
+    Analyze every column in a dataframe. The first PREVIEW_FIELD_COUNT
+    columns are listed in 'field_definitions', and if there are more columns
+    than that, all of them are included in 'field_table' (see
+    get_field_table()). dtypes are optional hints passed to read_dataframe().
+    If sample_size is given, metadata is estimated from that many rows and
+    marked with 'sampled' (see get_sampled_metadata()).
+    If reference_indexes are given (see pilot.references), foreign key
+    columns are checked against them and the results added to each field's
+    'reference'. Every row is checked, even when sampling.
+    If a dict is given as summaries, it is filled with mergeable column
+    summaries (see pilot.summary) when every row is analyzed.
+    """
+    start = time.monotonic()
+    # Pandas analysis
+    pandas_info, sampled, df, fields = None, None, None, None
+    if sample_size:
+        pandas_info, numrows, sampled, fields = get_sampled_metadata(
+            filename, sample_size)
+    elif is_numeric_matrix(filename):
+        try:
+            pandas_info, numrows = get_numeric_matrix_metadata(
+                filename, summaries=summaries)
+            fields = get_numeric_matrix_fields(pandas_info)
+        except ValueError:
+            # A row past the sample didn't fit the numeric layout
+            pandas_info = None
+    if pandas_info is None:
+        df = read_dataframe(filename, dtypes)
+        pandas_info = describe_dataframe(df)
+        # df.shape[0] seems to have issues determining rows
+        numrows = len(df.index)
+        if summaries is not None:
+            summaries.update(summarize_dataframe(df) or {})
+    # Tableschema analysis
+    column_metadata = get_column_metadata(filename, pandas_info, foreign_keys,
+                                          fields)
+    if reference_indexes:
+        add_reference_checks(column_metadata, filename, reference_indexes, df)
+
+    dataframe_metadata = get_dataframe_metadata(
+        filename, column_metadata, numrows, len(pandas_info), sampled)
+    mode = 'sampled' if sampled else 'full'
+    metrics.inc('pilot_analysis_rows_total', numrows, mode=mode)
+    metrics.observe_rate('pilot_analysis_rows_per_second', numrows,
+                         time.monotonic() - start, mode=mode)
     return dataframe_metadata
+
+
+def get_reference_results(metadata, reference_indexes):
+    """The reference check results in dataframe metadata, with the checksum
+    of the reference table each column was checked against"""
+    fields = (unpack_field_table(metadata['field_table'])
+              if 'field_table' in metadata else metadata['field_definitions'])
+    return {f['name']: dict(f['reference'],
+                            checksum=reference_indexes[f['name']].checksum)
+            for f in fields if f['name'] in (reference_indexes or {}) and
+            'checked' in (f.get('reference') or {})}
+
+
+def get_analysis_state(filename, metadata, summaries, reference_indexes=None,
+                       digests=None):
+    """
+    State kept from the analysis of a dataframe, to analyze appended rows on
+    their own later (see analyze_appended()). The whole file is hashed to
+    detect appends, and the checksums are saved for the upload manifest.
+    :return: dict, or None if the dataframe couldn't be fully summarized
+    """
+    if len(summaries) != metadata['numcols'] or \
+            not all(summaries.values()) or \
+            get_summary_size(summaries) > ANALYSIS_STATE_MAX_VALUES:
+        return None
+    size = os.path.getsize(filename)
+    if digests is None:
+        digests, _ = hash_file(filename, DEFAULT_HASH_ALGORITHMS)
+        save_checksums(filename, digests)
+    with open(filename, 'rb') as fh:
+        fh.seek(max(size - 1, 0))
+        complete_lines = fh.read(1) == b'\n'
+    return {
+        'size': size,
+        'sha256': digests['sha256'],
+        'complete_lines': complete_lines,
+        'numrows': metadata['numrows'],
+        'summaries': to_json(summaries),
+        'references': get_reference_results(metadata, reference_indexes),
+    }
+
+
+def analyze_appended(filename, state, foreign_keys=None,
+                     reference_indexes=None):
+    """
+    Analyze a dataframe which was analyzed before (see get_analysis_state())
+    and has only had rows appended since. The file's prefix is verified
+    against the sha256 of the previous version, then only the appended rows
+    are parsed, and their summaries merged into the previous ones. Means,
+    standard deviations and counts are exact, percentiles are estimated
+    within pilot.summary.SKETCH_ACCURACY, which is recorded in the metadata
+    under 'approximate'.
+    :return: tuple of (metadata, new state), or None if the file changed in
+    any other way
+    """
+    start = time.monotonic()
+    summaries = from_json(state['summaries'])
+    if not state['complete_lines'] or \
+            os.path.getsize(filename) < state['size']:
+        return None
+    digests, prefix = hash_file(filename, DEFAULT_HASH_ALGORITHMS,
+                                checkpoint=state['size'])
+    save_checksums(filename, digests)
+    if not prefix or prefix['sha256'] != state['sha256']:
+        return None
+    with open(filename, 'rb') as fh:
+        header = fh.readline()
+        fh.seek(state['size'])
+        tail = fh.read()
+    # Strings are parsed as in the file, then numbers converted per column
+    # the same way they were the first time.
+    try:
+        tail_df = pandas.read_csv(io.BytesIO(header + tail), sep='\t',
+                                  dtype=str)
+        tail_summaries = summarize_rows(tail_df, summaries)
+    except (ValueError, TypeError):
+        return None
+    merged = {name: merge_summaries(summary, tail_summaries[name])
+              for name, summary in summaries.items()}
+    if not all(merged.values()):
+        return None
+    pandas_info = {name: clean_field_metadata(get_summary_metadata(name, s))
+                   for name, s in merged.items()}
+    numrows = state['numrows'] + len(tail_df.index)
+    column_metadata = get_column_metadata(
+        filename, pandas_info, foreign_keys,
+        get_numeric_matrix_fields(pandas_info))
+
+    if reference_indexes:
+        # Tables which haven't changed only need the new rows checked
+        previous = state.get('references', {})
+        unchanged = {col: idx for col, idx in reference_indexes.items()
+                     if previous.get(col, {}).get('checksum') == idx.checksum}
+        checks = {col: merge_reference_results(previous[col], result)
+                  for col, result in check_references(
+                      filename, unchanged, tail_df).items()}
+        changed = {col: idx for col, idx in reference_indexes.items()
+                   if col not in unchanged}
+        if changed:
+            checks.update(check_references(filename, changed))
+        for field in column_metadata:
+            if field.get('reference') and field['name'] in checks:
+                field['reference'] = dict(field['reference'],
+                                          **checks[field['name']])
+
+    approximate = {'fields': ['25', '50', '75'], 'method': 'sketch',
+                   'relative_error': SKETCH_ACCURACY}
+    metadata = get_dataframe_metadata(filename, column_metadata, numrows,
+                                      len(pandas_info),
+                                      approximate=approximate)
+    metrics.inc('pilot_analysis_rows_total', len(tail_df.index),
+                mode='appended')
+    metrics.observe_rate('pilot_analysis_rows_per_second',
+                         len(tail_df.index), time.monotonic() - start,
+                         mode='appended')
+    return metadata, get_analysis_state(filename, metadata, merged,
+                                        reference_indexes, digests)
+
+
+def get_analysis_cache_key(filename, foreign_keys=None, sample_size=None,
+                           reference_indexes=None, dtypes=None):
+    stat = os.stat(filename)
+    fkeys = json.dumps(foreign_keys, sort_keys=True).encode('utf-8')
+    key = [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns,
+           hashlib.sha1(fkeys).hexdigest(), sample_size or 0]
+    if reference_indexes:
+        # Reference checks are redone when a reference table changes
+        key.append(sorted((col, idx.checksum)
+                          for col, idx in reference_indexes.items()))
+    if dtypes:
+        # Hints which don't match the data change how columns are read
+        key.append({'dtypes': sorted((col, str(dtype))
+                                     for col, dtype in dtypes.items())})
+    return json.dumps(key)
+
+
+def get_analysis_state_key(filename):
+    return json.dumps(['state', os.path.abspath(filename)])
+
+
+def analyze_dataframe_cached(filename, foreign_keys=None, dtypes=None,
+                             sample_size=None, cache=analysis_cache,
+                             reference_indexes=None):
+    """
+    Same as analyze_dataframe(), but re-uses the result of an earlier
+    analysis of the same, unmodified file from cache. If rows were only
+    appended to the file since it was last fully analyzed, only the new rows
+    are analyzed (see analyze_appended()).
+    """
+    key = get_analysis_cache_key(filename, foreign_keys, sample_size,
+                                 reference_indexes, dtypes)
+    metadata = cache.get(key)
+    if metadata is None and sample_size:
+        metadata = analyze_dataframe(filename, foreign_keys, dtypes,
+                                     sample_size, reference_indexes)
+        cache.set(key, metadata)
+    elif metadata is None:
+        state_key = get_analysis_state_key(filename)
+        state = cache.get(state_key)
+        result = state and analyze_appended(filename, state, foreign_keys,
+                                            reference_indexes)
+        if result:
+            metadata, state = result
+        else:
+            summaries = {}
+            metadata = analyze_dataframe(filename, foreign_keys, dtypes,
+                                         sample_size, reference_indexes,
+                                         summaries)
+            state = get_analysis_state(filename, metadata, summaries,
+                                       reference_indexes)
+        if state:
+            cache.set(state_key, state)
+        else:
+            cache.invalidate(state_key)
+        cache.set(key, metadata)
+    # Callers are free to modify the result, without changing the cache
+    return copy.deepcopy(metadata)
@@ -0,0 +1,84 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_MAX_WORKERS = 4
+# Requests per second
+DEFAULT_RATE_LIMIT = 10
+
+
+class RateLimiter(object):
+    """
+    A token bucket allowing `rate` calls per second on average, in bursts of
+    up to `burst` calls. A single limiter may be shared by any number of
+    threads.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE_LIMIT, burst=1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Take a token now, and if the bucket is empty, wait until the
+            # token we took would have been refilled.
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+def submit_all(executor, func, items, limiter=None):
+    """
+    Submit func(item) to executor for every item.
+    :param executor: A concurrent.futures Executor
+    :param func: Function taking a single item
+    :param items: iterable of items to process
+    :param limiter: An optional RateLimiter, shared by all calls
+    :return: dict of future to the item it was submitted with, in item order
+    """
+    def call(item):
+        if limiter:
+            limiter.wait()
+        return func(item)
+    return {executor.submit(call, item): item for item in items}
+
+
+def iter_results(futures):
+    """
+    Yield a tuple of (item, result, exception) for each future as it
+    completes. Exceptions are never raised, so one bad item does not stop the
+    rest of the batch.
+    :param futures: dict of future to item, as returned by submit_all
+    """
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result(), None
+        except Exception as e:
+            yield futures[future], None, e
+
+
+def run_concurrently(func, items, max_workers=DEFAULT_MAX_WORKERS,
+                     rate_limit=None):
+    """
+    Call func(item) for every item on a thread pool, yielding a tuple of
+    (item, result, exception) as each call completes.
+    :param func: Function taking a single item
+    :param items: iterable of items to process
+    :param max_workers: Number of threads to run calls on
+    :param rate_limit: Max calls started per second, or None for no limit
+    """
+    limiter = RateLimiter(rate_limit) if rate_limit else None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = submit_all(executor, func, items, limiter)
+        for result in iter_results(futures):
+            yield result
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+CACHE_DIR = os.environ.get('PILOT_CACHE_DIR',
+                           os.path.expanduser('~/.pilot1_cache'))
+# How often, in seconds, set() removes expired files from disk
+PRUNE_INTERVAL = 60 * 60
+
+
+class TTLCache(object):
+    """
+    A short lived cache for JSON serializable values. Values are kept in
+    memory, and also written to disk under cache_dir/<namespace> (by default
+    CACHE_DIR, set with the PILOT_CACHE_DIR environment variable) so separate
+    pilot processes can share them. Entries older than ttl seconds are
+    ignored, and their files removed when they are read, or by the next
+    prune() at most PRUNE_INTERVAL seconds later. Safe to share between
+    threads.
+    """
+
+    def __init__(self, namespace, ttl, cache_dir=None, persist=True):
+        self.ttl = ttl
+        self.path = os.path.join(cache_dir or CACHE_DIR, namespace)
+        self.persist = persist
+        self.memory = {}
+        self.lock = threading.Lock()
+        self.last_prune = 0
+
+    def _filename(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, '{}.json'.format(digest))
+
+    def _load(self, key):
+        try:
+            with open(self._filename(key)) as fh:
+                item = json.load(fh)
+            return item if item.get('key') == key else None
+        except (OSError, ValueError):
+            return None
+
+    def _expired(self, item):
+        return time.time() - item['time'] > self.ttl
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.memory.get(key)
+            if item is not None and self._expired(item):
+                # Another process may have stored a newer value on disk
+                del self.memory[key]
+                item = None
+        if item is None and self.persist:
+            item = self._load(key)
+            if item is not None and self._expired(item):
+                self._remove(key)
+                item = None
+        if item is None:
+            return default
+        with self.lock:
+            self.memory[key] = item
+        return item['value']
+
+    def set(self, key, value):
+        item = {'key': key, 'time': time.time(), 'value': value}
+        with self.lock:
+            self.memory[key] = item
+        if self.persist:
+            os.makedirs(self.path, exist_ok=True)
+            filename = self._filename(key)
+            # Write then rename, so other processes never see partial files
+            tmp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+            with open(tmp_filename, 'w') as fh:
+                json.dump(item, fh)
+            os.replace(tmp_filename, filename)
+            if time.time() - self.last_prune > PRUNE_INTERVAL:
+                self.prune()
+
+    def prune(self):
+        """Remove files of expired entries, and any temporary files left
+        behind by interrupted writes"""
+        self.last_prune = time.time()
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        for name in names:
+            filename = os.path.join(self.path, name)
+            try:
+                if self.last_prune - os.path.getmtime(filename) > self.ttl:
+                    os.remove(filename)
+            except OSError:
+                pass
+
+    def invalidate(self, key):
+        with self.lock:
+            self.memory.pop(key, None)
+        if self.persist:
+            self._remove(key)
+
+    def _remove(self, key):
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
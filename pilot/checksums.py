@@ -0,0 +1,176 @@
+"""
+File checksums, computed for several algorithms in a single read of the file
+and cached by file path, size and modification time. Analysis of appended
+dataframes reads the whole file anyway to verify its prefix, so it saves the
+checksums it computes along the way for the upload manifest.
+
+Large files can also get block hashes: the sha256 of each fixed size block,
+hashed in parallel, plus a Merkle root over them. Downloads use them to find
+and re-fetch only the blocks which are corrupt.
+"""
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from pilot.cache import TTLCache
+from pilot import metrics
+
+DEFAULT_HASH_ALGORITHMS = ['sha256', 'md5']
+HASH_BLOCK_SIZE = 2 ** 20
+CHECKSUM_CACHE_TTL = 30 * 24 * 60 * 60
+checksum_cache = TTLCache('checksums', CHECKSUM_CACHE_TTL)
+# Size of each block for block hashes. A 50 GB file has 800 blocks, so its
+# hash list stays well within search record limits.
+BLOCK_SIZE = 64 * 2 ** 20
+# hashlib releases the GIL while hashing, so threads hash blocks on all cores
+BLOCK_HASH_WORKERS = os.cpu_count() or 4
+
+
+def get_checksum_cache_key(filename, algorithm):
+    stat = os.stat(filename)
+    return json.dumps([os.path.abspath(filename), stat.st_size,
+                       stat.st_mtime_ns, algorithm])
+
+
+def hash_file(filename, algorithms=DEFAULT_HASH_ALGORITHMS, checkpoint=None,
+              block_size=HASH_BLOCK_SIZE):
+    """
+    Hash a file with several algorithms in one pass.
+    :param checkpoint: Also return the digests of the first checkpoint bytes
+    :return: tuple of (dict of algorithm to hex digest, dict of algorithm to
+    hex digest of the first checkpoint bytes, or None if the file is shorter
+    or no checkpoint was given)
+    """
+    hashers = {alg: hashlib.new(alg) for alg in algorithms}
+    start, size, at_checkpoint = time.monotonic(), 0, None
+    with open(filename, 'rb') as fh:
+        while True:
+            if checkpoint is not None and size == checkpoint:
+                at_checkpoint = {alg: h.copy().hexdigest()
+                                 for alg, h in hashers.items()}
+            limit = block_size
+            if checkpoint is not None and size < checkpoint:
+                limit = min(block_size, checkpoint - size)
+            buf = fh.read(limit)
+            if not buf:
+                break
+            for hasher in hashers.values():
+                hasher.update(buf)
+            size += len(buf)
+    duration = time.monotonic() - start
+    for alg in algorithms:
+        metrics.inc('pilot_hash_bytes_total', size, algorithm=alg)
+        metrics.observe_rate('pilot_hash_mb_per_second', size / 2 ** 20,
+                             duration, algorithm=alg)
+    digests = {alg: h.hexdigest() for alg, h in hashers.items()}
+    return digests, at_checkpoint
+
+
+def save_checksums(filename, digests, cache=checksum_cache):
+    for alg, digest in digests.items():
+        cache.set(get_checksum_cache_key(filename, alg), digest)
+
+
+def get_checksums(filename, algorithms=DEFAULT_HASH_ALGORITHMS,
+                  cache=checksum_cache):
+    """Checksums of a file for each algorithm, from cache where possible.
+    Any missing are computed together in one read of the file."""
+    digests = {alg: cache.get(get_checksum_cache_key(filename, alg))
+               for alg in algorithms}
+    missing = [alg for alg, digest in digests.items() if digest is None]
+    if missing:
+        computed, _ = hash_file(filename, missing)
+        save_checksums(filename, computed, cache)
+        digests.update(computed)
+    return digests
+
+
+def get_blocks(length, block_size=BLOCK_SIZE):
+    """(offset, size) of each block of a file of the given length"""
+    return [(offset, min(block_size, length - offset))
+            for offset in range(0, length, block_size)]
+
+
+def hash_block(filename, offset, size, read_size=HASH_BLOCK_SIZE):
+    """sha256 of size bytes of a file starting at offset. A file which ends
+    early hashes only what is there."""
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as fh:
+        fh.seek(offset)
+        while size > 0:
+            buf = fh.read(min(read_size, size))
+            if not buf:
+                break
+            sha.update(buf)
+            size -= len(buf)
+    return sha.hexdigest()
+
+
+def hash_blocks(filename, block_size=BLOCK_SIZE, workers=BLOCK_HASH_WORKERS,
+                length=None):
+    """
+    Hash each block of a file in parallel.
+    :param length: Hash blocks up to this length instead of the file's size,
+    to compare a partial or damaged copy against a manifest
+    :return: list of sha256 hex digests, one per block
+    """
+    length = os.path.getsize(filename) if length is None else length
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = list(executor.map(lambda block: hash_block(filename, *block),
+                                   get_blocks(length, block_size)))
+    metrics.inc('pilot_hash_bytes_total', length, algorithm='sha256-blocks')
+    metrics.observe_rate('pilot_hash_mb_per_second', length / 2 ** 20,
+                         time.monotonic() - start, algorithm='sha256-blocks')
+    return hashes
+
+
+def get_merkle_root(block_hashes):
+    """
+    Merkle root of a list of sha256 hex digests. Leaves and inner nodes are
+    hashed with different prefix bytes, as in RFC 6962, so one can't be
+    passed off as the other. An odd node at the end of a level is carried up
+    unchanged.
+    """
+    level = [hashlib.sha256(b'\x00' + bytes.fromhex(h)).digest()
+             for h in block_hashes]
+    if not level:
+        return hashlib.sha256(b'').hexdigest()
+    while len(level) > 1:
+        parents = [hashlib.sha256(b'\x01' + level[i] + level[i + 1]).digest()
+                   for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return level[0].hex()
+
+
+def get_block_manifest(filename, block_size=BLOCK_SIZE,
+                       workers=BLOCK_HASH_WORKERS, cache=checksum_cache):
+    """
+    Block hashes for the 'blocks' field of a file manifest.
+    :return: dict with the block 'size', the 'sha256' of each block, and
+    their 'merkle_root'
+    """
+    key = get_checksum_cache_key(filename, 'sha256-blocks-{}'.format(
+        block_size))
+    hashes = cache.get(key)
+    if hashes is None:
+        hashes = hash_blocks(filename, block_size, workers)
+        cache.set(key, hashes)
+    return {'size': block_size, 'sha256': hashes,
+            'merkle_root': get_merkle_root(hashes)}
+
+
+def find_bad_blocks(filename, blocks, length, workers=BLOCK_HASH_WORKERS):
+    """
+    Compare a local copy of a file against the 'blocks' of its manifest.
+    :param length: Expected length of the file
+    :return: list of (offset, size) of each block which doesn't match
+    """
+    hashes = hash_blocks(filename, blocks['size'], workers, length)
+    return [block for block, actual, expected in zip(
+            get_blocks(length, blocks['size']), hashes, blocks['sha256'])
+            if actual != expected]
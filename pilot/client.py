@@ -6,6 +6,33 @@ import urllib
 from globus_sdk import AuthClient, SearchClient, TransferClient
 from fair_research_login import (NativeClient, LoadError)
 from pilot.config import config
+from concurrent.futures import ThreadPoolExecutor
+from pilot.cache import TTLCache
+from pilot.exc import PilotClientException
+from pilot.search import (FIELD_TABLE_ENTRY_ID, scrape_metadata,
+                          get_field_table_name)
+from pilot.analysis import dump_field_table, load_field_table
+from pilot.batch import submit_all, DEFAULT_MAX_WORKERS, DEFAULT_RATE_LIMIT
+from pilot.retry import RequestPolicy
+from pilot.tokens import TokenManager
+from pilot import metrics
+
+SYNC_LEVELS = ['exists', 'size', 'mtime', 'checksum']
+DEFAULT_SYNC_LEVEL = 'checksum'
+# Globus Transfer can handle large tasks, but smaller tasks are easier to
+# retry and track.
+DEFAULT_MAX_TRANSFER_ITEMS = 1000
+# Directory listings are cached briefly, so batch operations over the same
+# directory (even in separate pilot processes) only list it once.
+LS_CACHE_TTL = 60
+LS_PAGE_SIZE = 1000
+LS_CACHED_FIELDS = ['name', 'type', 'size', 'last_modified']
+# Services with their own circuit breaker, by client type
+API_SERVICES = [(SearchClient, 'search'), (TransferClient, 'transfer'),
+                (AuthClient, 'auth')]
+# Globus Search won't return results past this offset. Full scans use the
+# scroll API instead.
+SEARCH_MAX_RESULTS = 10000
 
 
 class PilotClient(NativeClient):
@@ -27,14 +54,37 @@ class PilotClient(NativeClient):
     SEARCH_INDEX_TEST = 'e0849c9b-b709-46f3-be21-80893fc1db84'
     GROUP = 'd99b3400-33e7-11e9-8857-0af4690c7c7e'
 
-    def __init__(self):
+    PENDING_SEARCH_TASK_STATES = ['PENDING', 'PROGRESS']
+    FINISHED_TRANSFER_TASK_STATES = ['SUCCEEDED', 'FAILED']
+
+    def __init__(self, executor=None, max_workers=DEFAULT_MAX_WORKERS,
+                 rate_limit=DEFAULT_RATE_LIMIT):
+        """
+        :param executor: A concurrent.futures Executor for the *_many batch
+        methods. By default, a thread pool of max_workers is created the first
+        time one is needed.
+        :param max_workers: Size of the default thread pool
+        :param rate_limit: Max Globus requests started per second, shared by
+        all threads using this client, or None for no limit
+        """
         super().__init__(client_id=self.CLIENT_ID,
                          token_storage=config,
                          default_scopes=self.DEFAULT_SCOPES,
                          app_name=self.APP_NAME)
+        self._gsearch = None
+        self._gtransfer = None
+        self.ls_cache = TTLCache('ls', LS_CACHE_TTL)
+        self._executor = executor
+        self.max_workers = max_workers
+        self.policy = RequestPolicy(rate_limit)
+        self.token_manager = TokenManager(self)
 
     def login(self, *args, **kwargs):
         super().login(*args, **kwargs)
+        # Drop any tokens loaded before login
+        self.token_manager.stop()
+        self._gsearch = None
+        self._gtransfer = None
         if not config.get_user_info():
             ac_authorizer = self.get_authorizers()['auth.globus.org']
             auth_cli = AuthClient(authorizer=ac_authorizer)
@@ -42,8 +92,11 @@ class PilotClient(NativeClient):
             config.save_user_info(user_info.data)
 
     def logout(self):
+        self.token_manager.stop()
         super().logout()
         config.clear()
+        self._gsearch = None
+        self._gtransfer = None
 
     def is_logged_in(self):
         try:
@@ -52,32 +105,127 @@ class PilotClient(NativeClient):
         except LoadError:
             return False
 
+    def get_authorizers(self, requested_scopes=None):
+        """
+        Authorizers for all tokens, refreshed ahead of expiry in the
+        background by the client's TokenManager. See pilot.tokens.
+        """
+        if requested_scopes:
+            return super().get_authorizers(requested_scopes=requested_scopes)
+        return self.token_manager.get_authorizers()
+
     @property
     def gsearch(self):
-        authorizer = self.get_authorizers()['search.api.globus.org']
-        return SearchClient(authorizer=authorizer)
+        # Re-use the client so batch operations share one connection pool
+        if self._gsearch is None:
+            authorizer = self.get_authorizers()['search.api.globus.org']
+            self._gsearch = SearchClient(authorizer=authorizer)
+        return self._gsearch
 
     @property
     def gtransfer(self):
-        authorizer = self.get_authorizers()['transfer.api.globus.org']
-        return TransferClient(authorizer=authorizer)
+        if self._gtransfer is None:
+            authorizer = self.get_authorizers()['transfer.api.globus.org']
+            self._gtransfer = TransferClient(authorizer=authorizer)
+        return self._gtransfer
+
+    def call_api(self, func, *args, idempotent=True, **kwargs):
+        """
+        Make a Globus API call under the client's request policy, which rate
+        limits, retries and circuit breaks all calls, with a circuit breaker
+        for each service. See pilot.retry.RequestPolicy. Searches, listings
+        and task lookups are idempotent. So are ingests, which replace the
+        same entries if repeated, and transfer submissions, which carry a
+        submission id. Deleting a single entry or subject is not: if a
+        failed attempt took effect, the retry fails with NotFound.
+        """
+        owner = getattr(func, '__self__', None)
+        service = next((name for cls, name in API_SERVICES
+                        if isinstance(owner, cls)), None)
+        return self.policy.call(func, *args, idempotent=idempotent,
+                                service=service, **kwargs)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def shutdown(self, wait=True):
+        """Shut down the executor used by batch methods."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
 
     @property
     def http_headers(self):
-        petrel = self.load_tokens()['petrel_https_server']['access_token']
+        petrel = self.token_manager.get_access_token('petrel_https_server')
         return {'Authorization': 'Bearer {}'.format(petrel)}
 
-    def ls(self, dataframe, directory, test):
-        tauth = self.get_authorizers()['transfer.api.globus.org']
-        tc = globus_sdk.TransferClient(authorizer=tauth)
+    def iter_ls(self, directory, test, page_size=LS_PAGE_SIZE, **params):
+        """
+        Stream the entries of a directory listing on the Pilot endpoint,
+        fetching one page at a time. Extra params, such as a Transfer 'filter',
+        are passed to operation_ls.
+        """
         path = self.get_path('', directory, test)
-        r = tc.operation_ls(self.ENDPOINT, path=path)
-        if not dataframe:
-            return [f['name'] for f in r['DATA'] if f['type'] == 'dir']
-        else:
+        offset = 0
+        while True:
+            r = self.call_api(self.gtransfer.operation_ls, self.ENDPOINT,
+                              path=path, offset=offset, limit=page_size,
+                              **params)
             for f in r['DATA']:
-                if f['name'] == dataframe:
-                    return f
+                yield f
+            offset += len(r['DATA'])
+            if len(r['DATA']) < page_size:
+                return
+
+    def ls_dir(self, directory, test):
+        """
+        Return the listing for a whole directory as a dict of file names to
+        entries. Listings are cached for LS_CACHE_TTL seconds, so batch
+        operations over the same directory only list it once.
+        """
+        path = self.get_path('', directory, test)
+        listing = self.ls_cache.get(path)
+        if listing is None:
+            listing = {f['name']: {k: f.get(k) for k in LS_CACHED_FIELDS}
+                       for f in self.iter_ls(directory, test)}
+            self.ls_cache.set(path, listing)
+        return listing
+
+    def ls(self, dataframe, directory, test):
+        """
+        If dataframe is empty, list the directories within directory.
+        Otherwise, return the listing entry for dataframe, or None if it
+        doesn't exist. Single files are looked up with a name filter, unless
+        the whole directory listing is already cached. Names with commas
+        can't be filtered on, so the whole directory is listed for those.
+        """
+        if not dataframe:
+            return [f['name'] for f in self.iter_ls(directory, test,
+                                                    filter='type:dir')]
+        listing = self.ls_cache.get(self.get_path('', directory, test))
+        if listing is not None:
+            return listing.get(dataframe)
+        if ',' in dataframe:
+            return self.ls_dir(directory, test).get(dataframe)
+        key = self.get_path(dataframe, directory, test)
+        cached = self.ls_cache.get(key)
+        if cached is not None:
+            return cached['entry']
+        entry = None
+        for f in self.iter_ls(directory, test,
+                              filter='name:{}'.format(dataframe)):
+            if f['name'] == dataframe:
+                entry = {k: f.get(k) for k in LS_CACHED_FIELDS}
+        self.ls_cache.set(key, {'entry': entry})
+        return entry
+
+    def invalidate_ls(self, filename, directory, test):
+        """Drop cached listings which a change to filename makes stale"""
+        self.ls_cache.invalidate(self.get_path('', directory, test))
+        self.ls_cache.invalidate(self.get_path(filename, directory, test))
 
     def get_index(self, test=False):
         return self.SEARCH_INDEX_TEST if test else self.SEARCH_INDEX
@@ -113,14 +261,247 @@ class PilotClient(NativeClient):
         else:
             return self.get_globus_url(dataframe, directory, test)
 
+    def get_relocations(self, test):
+        """
+        (old prefix, new prefix) pairs moving urls and subjects from the test
+        location to production, or from production to test if test is False.
+        See pilot.search.relocate_record().
+        """
+        return [(self.get_globus_http_url('', '', test),
+                 self.get_globus_http_url('', '', not test)),
+                (self.get_subject_url('', '', test),
+                 self.get_subject_url('', '', not test))]
+
     def get_search_entry(self, basename, directory, test=False, old=False):
         subject = self.get_subject_url(basename, directory, test, old)
         try:
-            entry = self.gsearch.get_subject(self.get_index(test), subject)
-            return entry['content'][0]
+            entry = self.call_api(self.gsearch.get_subject,
+                                  self.get_index(test), subject)
+            return self.get_metadata_content(entry['content'])
+        except globus_sdk.exc.SearchAPIError:
+            return None
+
+    def describe_many(self, paths, test=False):
+        """
+        Fetch search entries for many dataframes at once. Iterate over the
+        results with pilot.batch.iter_results() to handle per-item errors.
+        :param paths: iterable of remote dataframe paths, ex: 'foo/bar.tsv'
+        :param test: Use the test index instead?
+        :return: dict of future to path. Each future resolves to the same
+        result as get_search_entry()
+        """
+        def describe(path):
+            return self.get_search_entry(os.path.basename(path),
+                                         os.path.dirname(path), test)
+        return submit_all(self.executor, describe, paths)
+
+    def scrape_many(self, dataframes, destination, test=False,
+                    skip_analysis=False, sample_size=None, executor=None,
+                    reference_indexes=None, block_size=None):
+        """
+        Scrape metadata for many local dataframes at once. No Globus requests
+        are made, so these are not rate limited.
+        :param dataframes: iterable of local dataframe paths
+        :param destination: Remote directory the dataframes will be stored in
+        :param test: Generate urls for the test location?
+        :param skip_analysis: Skip analyzing dataframe contents?
+        :param sample_size: Sample rows instead of reading whole dataframes
+        :param executor: Use a different executor, such as a process pool for
+        large dataframes
+        :param reference_indexes: Check foreign keys against these, see
+        pilot.references
+        :param block_size: Add block hashes of this size to file manifests
+        :return: dict of future to dataframe. Each future resolves to the same
+        result as pilot.search.scrape_metadata()
+        """
+        def scrape(dataframe):
+            url = self.get_globus_http_url(os.path.basename(dataframe),
+                                           destination, test)
+            return scrape_metadata(dataframe, url, skip_analysis, test,
+                                   sample_size=sample_size,
+                                   reference_indexes=reference_indexes,
+                                   block_size=block_size)
+        return submit_all(executor or self.executor, scrape, dataframes)
+
+    def ingest_many(self, gmeta_entries, test=False):
+        """
+        Ingest many gmeta entries at once, waiting on each ingest task.
+        :param gmeta_entries: iterable of gmeta entries, as from gen_gmeta()
+        :param test: Use the test index instead?
+        :return: dict of future to the index of its entry in gmeta_entries,
+        since entries are not hashable. Each future resolves to True, or
+        raises if ingest failed.
+        """
+        entries = list(gmeta_entries)
+        return submit_all(self.executor,
+                          lambda idx: self.ingest_entry(entries[idx], test),
+                          range(len(entries)))
+
+    def ingest_indexes(self, gmetas):
+        """
+        Ingest into the test and production indexes at once.
+        :param gmetas: dict of test flag to the gmeta entry to ingest in
+        that index, ex: {True: test_gmeta, False: prod_gmeta}
+        :return: dict of future to test flag. Each future resolves to True,
+        or raises if ingest failed.
+        """
+        return submit_all(self.executor,
+                          lambda test: self.ingest_entry(gmetas[test], test),
+                          list(gmetas))
+
+    @staticmethod
+    def get_metadata_content(contents):
+        """Pick the main metadata out of a subject's entry contents, skipping
+        any field table entry left by older versions."""
+        for content in contents:
+            if FIELD_TABLE_ENTRY_ID not in content:
+                return content
+
+    def get_field_table_url(self, basename, directory, test=False):
+        return self.get_globus_http_url(get_field_table_name(basename),
+                                        directory, test)
+
+    def get_field_table(self, basename, directory, test=False):
+        """
+        Fetch the full field table for a dataframe from the file stored next
+        to it, or None if the dataframe was narrow enough not to need one.
+        Records from older versions keep it in a separate search entry.
+        """
+        url = self.get_field_table_url(basename, directory, test)
+        response = requests.get(url, headers=self.http_headers)
+        if response.status_code == 200:
+            return load_field_table(response.text.splitlines())
+        subject = self.get_subject_url(basename, directory, test)
+        try:
+            entry = self.call_api(self.gsearch.get_entry,
+                                  self.get_index(test), subject,
+                                  entry_id=FIELD_TABLE_ENTRY_ID)
+            return entry['content'][0][FIELD_TABLE_ENTRY_ID]
         except globus_sdk.exc.SearchAPIError:
             return None
 
+    def upload_field_table(self, field_table, basename, directory,
+                           test=False):
+        """Store the full field table of a dataframe in a JSON Lines file
+        next to it on the endpoint, see get_field_table()"""
+        url = self.get_field_table_url(basename, directory, test)
+        data = dump_field_table(field_table).encode('utf-8')
+        resp = requests.put(url, headers=self.http_headers, data=data,
+                            allow_redirects=False)
+        self.invalidate_ls(get_field_table_name(basename), directory, test)
+        return resp
+
+    def iter_search_pages(self, query_doc, test=False, limit=None,
+                          page_size=100):
+        """
+        Page through a structured Globus Search query, yielding each page of
+        results as it is fetched. Search can only page through the first
+        SEARCH_MAX_RESULTS results, if more are asked for a
+        PilotClientException is raised after yielding those.
+        :param query_doc: A GSearchRequest document, ex: {'q': '*'}. Offset
+        and limit are set for each page.
+        :param test: Use the test index instead?
+        :param limit: Max number of results to fetch, or None for all
+        :param page_size: Number of results to fetch per request
+        """
+        offset = 0
+        while limit is None or offset < limit:
+            size = page_size if limit is None else min(page_size,
+                                                       limit - offset)
+            if offset + size > SEARCH_MAX_RESULTS:
+                size = SEARCH_MAX_RESULTS - offset
+            if size <= 0:
+                raise PilotClientException(
+                    "Search results past the first {} can't be paged "
+                    'through, narrow the query'.format(SEARCH_MAX_RESULTS))
+            query_doc = dict(query_doc, offset=offset, limit=size)
+            results = self.call_api(self.gsearch.post_search,
+                                    self.get_index(test), query_doc)
+            yield results
+            offset += results['count']
+            if not results['count'] or offset >= results['total']:
+                return
+
+    def iter_search_entries(self, test=False, query='*', page_size=100,
+                            filters=None):
+        """
+        Scroll through all search results for query, yielding each gmeta
+        result ({'subject': ..., 'content': [...]}) as it is fetched. Unlike
+        iter_search_pages(), this isn't limited to SEARCH_MAX_RESULTS.
+        :param test: Use the test index instead?
+        :param query: A Globus Search query string
+        :param page_size: Number of results to fetch per request
+        :param filters: Optional list of Globus Search filters
+        """
+        path = '/v1/index/{}/scroll'.format(self.get_index(test))
+        query_doc = {'q': query, 'limit': page_size}
+        if filters:
+            query_doc['filters'] = filters
+        while True:
+            page = self.call_api(self.gsearch.post, path,
+                                 json_body=query_doc)
+            for result in page['gmeta']:
+                yield result
+            if not page.get('has_next_page') or not page['gmeta']:
+                return
+            query_doc = dict(query_doc, marker=page['marker'])
+
+    def get_prefix_filter(self, directory, test=False):
+        """
+        A Globus Search filter matching records for dataframes under
+        directory, by the urls of their files. Records are matched by the
+        search service, so only they are fetched.
+        """
+        prefix = self.get_globus_http_url('', directory, test)
+        return {'type': 'like', 'field_name': 'files.url',
+                'value': '{}/*'.format(prefix.rstrip('/'))}
+
+    def get_subjects_by_prefix(self, directory, test=False):
+        """Return all search subjects for dataframes under directory"""
+        filters = [self.get_prefix_filter(directory, test)]
+        return [r['subject'] for r in self.iter_search_entries(
+                test, filters=filters)]
+
+    def wait_for_tasks(self, task_ids, interval=.5, max_interval=5,
+                       timeout=None):
+        """
+        Wait on many Globus Search tasks at once, polling each pending task
+        until it leaves the pending states. The wait between polling rounds
+        grows from interval up to max_interval, so long tasks are not polled
+        constantly.
+        :param task_ids: Iterable of search task ids
+        :param interval: Seconds to wait after the first polling round
+        :param max_interval: Max seconds to wait between polling rounds
+        :param timeout: Raise PilotClientException if tasks are still pending
+        after this many seconds. Wait forever if None.
+        :return: dict of task_id to final task state
+        """
+        sc = self.gsearch
+        states = {tid: None for tid in task_ids}
+        pending = list(states.keys())
+        started = time.monotonic()
+        with metrics.timed('pilot_task_wait_seconds'):
+            self._poll_tasks(sc, states, pending, started, interval,
+                             max_interval, timeout)
+        return states
+
+    def _poll_tasks(self, sc, states, pending, started, interval,
+                    max_interval, timeout):
+        while pending:
+            for task_id in pending:
+                task = self.call_api(sc.get_task, task_id)
+                states[task_id] = task['state']
+            pending = [tid for tid in pending
+                       if states[tid] in self.PENDING_SEARCH_TASK_STATES]
+            if pending:
+                if timeout is not None and \
+                        time.monotonic() - started > timeout:
+                    raise PilotClientException(
+                        'Timed out waiting on search tasks: {}'.format(
+                            ', '.join(pending)))
+                time.sleep(interval)
+                interval = min(interval * 1.5, max_interval)
+
     def ingest_entry(self, gmeta_entry, test=False):
         """
         Ingest a complete gmeta_entry into search. If test is true, the test
@@ -131,12 +512,11 @@ class PilotClient(NativeClient):
         :param test: Use the test index instead?
         :return: True on success Raises exception on fail
         """
-        sc = self.gsearch
-        result = sc.ingest(self.get_index(test), gmeta_entry)
-        pending_states = ['PENDING', 'PROGRESS']
-        while sc.get_task(result['task_id'])['state'] in pending_states:
-            time.sleep(.5)
-        if sc.get_task(result['task_id'])['state'] != 'SUCCESS':
+        with metrics.timed('pilot_ingest_seconds'):
+            result = self.call_api(self.gsearch.ingest, self.get_index(test),
+                                   gmeta_entry)
+            states = self.wait_for_tasks([result['task_id']])
+        if states[result['task_id']] != 'SUCCESS':
             # sc.delete_entry(self.SEARCH_INDEX_TEST, subject)
             raise Exception('Failed to ingest search subject')
         return True
@@ -160,13 +540,182 @@ class PilotClient(NativeClient):
         :param full_subject: Delete the whole subject and all its entries
         :return:
         """
-        index = self.get_index(test)
         subject = self.get_subject_url(dataframe, directory, test)
+        return self.delete_subject_entry(subject, test, entry_id=entry_id,
+                                         full_subject=full_subject)
 
+    def delete_subject_entry(self, subject, test, entry_id=None,
+                             full_subject=False):
+        """
+        Same as delete_entry, but takes the search subject directly.
+        :param subject: Full search subject url
+        :param test: Delete on the test index
+        :param entry_id: Single entry within the subject to delete.
+        :param full_subject: Delete the whole subject and all its entries
+        :return: Globus Search response
+        """
+        index = self.get_index(test)
         if full_subject:
-            return self.gsearch.delete_subject(index, subject)
+            return self.call_api(self.gsearch.delete_subject, index, subject,
+                                 idempotent=False)
         else:
-            return self.gsearch.delete_entry(index, subject, entry_id=entry_id)
+            return self.call_api(self.gsearch.delete_entry, index, subject,
+                                 entry_id=entry_id, idempotent=False)
+
+    def delete_by_query(self, query, test, filters=None):
+        """
+        Delete every entry matching query (and filters, if given) with a
+        single Globus Search delete-by-query task. Returns the task id.
+        """
+        query_doc = {'q': query, 'advanced': True}
+        if filters:
+            query_doc['filters'] = filters
+        result = self.call_api(self.gsearch.delete_by_query,
+                               self.get_index(test), query_doc)
+        return result['task_id']
+
+    def delete_by_prefix(self, directory, test):
+        """
+        Delete the records of every dataframe under directory with a single
+        delete-by-query task, see get_prefix_filter(). Returns the task id.
+        """
+        return self.delete_by_query('*', test, filters=[
+            self.get_prefix_filter(directory, test)])
+
+    def submit_transfers(self, source_endpoint, destination_endpoint, items,
+                         max_items=DEFAULT_MAX_TRANSFER_ITEMS, **options):
+        """
+        Submit Globus Transfer tasks for any number of items, with at most
+        max_items items per task.
+        :param items: list of dicts of TransferData.add_item() arguments
+        :param options: Extra TransferData options, such as sync_level
+        :return: list of (transfer result, items in the task) tuples, one for
+        each submitted task
+        """
+        tc = self.gtransfer
+        results = []
+        for start in range(0, len(items), max_items):
+            batch = items[start:start + max_items]
+            tdata = globus_sdk.TransferData(
+                tc, source_endpoint, destination_endpoint,
+                notify_on_succeeded=False, **options)
+            for item in batch:
+                tdata.add_item(**item)
+            with metrics.timed('pilot_transfer_submit_seconds'):
+                results.append((self.call_api(tc.submit_transfer, tdata),
+                                batch))
+        return results
+
+    def transfer_files(self, items, test=False, sync_level=DEFAULT_SYNC_LEVEL,
+                       max_items=DEFAULT_MAX_TRANSFER_ITEMS):
+        """
+        Transfer local files to the Pilot endpoint using the local Globus
+        Connect Personal endpoint. Files are grouped into as few tasks as
+        possible, with at most max_items files per task.
+        :param items: list of (local_path, filename, directory) tuples
+        :param test: Transfer to the test location?
+        :param sync_level: One of SYNC_LEVELS. Lower levels avoid checksumming
+        whole files on both endpoints.
+        :param max_items: Max number of files in a single transfer task
+        :return: list of (transfer result, items in the task) tuples, one for
+        each submitted task, where items are in the same form as given
+        """
+        local_ep = globus_sdk.LocalGlobusConnectPersonal().endpoint_id
+        if not local_ep:
+            raise PilotClientException('No local GCP client found')
+        transfer_items = [
+            {'source_path': local_path,
+             'destination_path': self.get_path(filename, directory, test)}
+            for local_path, filename, directory in items
+        ]
+        submitted = self.submit_transfers(
+            local_ep, self.ENDPOINT, transfer_items, max_items,
+            label='{} Transfer'.format(self.APP_NAME),
+            sync_level=sync_level, encrypt_data=True)
+        for _, filename, directory in items:
+            self.invalidate_ls(filename, directory, test)
+        # Tasks hold consecutive runs of the items, in order
+        remaining = iter(items)
+        return [(result, [next(remaining) for _ in batch])
+                for result, batch in submitted]
+
+    def copy_files(self, items, max_items=DEFAULT_MAX_TRANSFER_ITEMS):
+        """
+        Copy files between locations on the Pilot endpoint, such as from the
+        test location to production. Files already identical at the
+        destination are skipped.
+        :param items: list of (source path, destination path) tuples
+        :param max_items: Max number of files in a single transfer task
+        :return: list of (transfer result, items in the task) tuples, one for
+        each submitted task, where items are in the same form as given
+        """
+        transfer_items = [{'source_path': source, 'destination_path': dest}
+                          for source, dest in items]
+        submitted = self.submit_transfers(
+            self.ENDPOINT, self.ENDPOINT, transfer_items, max_items,
+            label='{} Copy'.format(self.APP_NAME), sync_level='checksum')
+        remaining = iter(items)
+        return [(result, [next(remaining) for _ in batch])
+                for result, batch in submitted]
+
+    def wait_for_transfers(self, task_ids, interval=2, max_interval=60,
+                           timeout=None):
+        """
+        Wait on Globus Transfer tasks until each one succeeds or fails,
+        polling less often the longer they run, like wait_for_tasks().
+        :param task_ids: Iterable of transfer task ids
+        :param timeout: Raise PilotClientException if tasks are still running
+        after this many seconds. Wait forever if None.
+        :return: dict of task_id to final task status
+        """
+        statuses = {tid: None for tid in task_ids}
+        pending = list(statuses.keys())
+        started = time.monotonic()
+        while pending:
+            for task_id in pending:
+                task = self.call_api(self.gtransfer.get_task, task_id)
+                statuses[task_id] = task['status']
+            pending = [tid for tid in pending if statuses[tid] not in
+                       self.FINISHED_TRANSFER_TASK_STATES]
+            if pending:
+                if timeout is not None and \
+                        time.monotonic() - started > timeout:
+                    raise PilotClientException(
+                        'Timed out waiting on transfer tasks: {}'.format(
+                            ', '.join(pending)))
+                time.sleep(interval)
+                interval = min(interval * 1.5, max_interval)
+        return statuses
+
+    def verify_checksums(self, items, destination_endpoint, destination_dir,
+                         max_items=DEFAULT_MAX_TRANSFER_ITEMS):
+        """
+        Verify files on the Pilot endpoint against known checksums, without
+        downloading them here. Files are checksum-synced to a directory on
+        another endpoint, and Globus checks each source file against its
+        known checksum. Tasks with mismatched files fail with checksum
+        faults.
+        :param items: list of (path, checksum_algorithm, checksum) tuples,
+        where path is the full path on the Pilot endpoint and the algorithm is
+        a Globus name, such as 'SHA256' or 'MD5'
+        :param destination_endpoint: Endpoint to sync files to
+        :param destination_dir: Directory on destination_endpoint. Files keep
+        their Pilot paths beneath it, so later runs only copy changed files.
+        :return: list of transfer results, one for each submitted task
+        """
+        transfer_items = [
+            {'source_path': path,
+             'destination_path': os.path.join(destination_dir,
+                                              path.lstrip('/')),
+             'external_checksum': checksum,
+             'checksum_algorithm': algorithm}
+            for path, algorithm, checksum in items
+        ]
+        submitted = self.submit_transfers(
+            self.ENDPOINT, destination_endpoint, transfer_items, max_items,
+            label='{} Verify'.format(self.APP_NAME),
+            sync_level='checksum', verify_checksum=True)
+        return [result for result, _ in submitted]
 
     def upload(self, dataframe, destination, test=False):
         filename = os.path.basename(dataframe)
@@ -176,4 +725,5 @@ class PilotClient(NativeClient):
             # Get the user info as JSON
             resp = requests.put(
                 url, headers=self.http_headers, data=fh, allow_redirects=False)
-            return resp
+        self.invalidate_ls(filename, destination, test)
+        return resp
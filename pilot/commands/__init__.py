@@ -1,5 +1,13 @@
 from pilot.client import PilotClient
 
 
+_pilot_client = None
+
+
 def get_pilot_client():
-    return PilotClient()
+    """Return the pilot client shared by all commands in this process, so
+    long lived processes re-use its connections and caches."""
+    global _pilot_client
+    if _pilot_client is None:
+        _pilot_client = PilotClient()
+    return _pilot_client
@@ -0,0 +1,149 @@
+import os
+import json
+import click
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from pilot.search import get_foreign_keys
+from pilot.references import load_reference_indexes, REFERENCE_DIR_ENV
+from pilot.analysis import (analyze_dataframe, analyze_dataframe_cached,
+                            unpack_field_table, FIELD_TABLE_KEYS)
+
+OUTPUT_FORMATS = ['jsonl', 'parquet']
+# Field table keys written to parquet as text, all others are numeric
+PARQUET_TEXT_KEYS = ['name', 'type', 'format', 'top', 'mean_ci', 'reference']
+
+
+def limit_memory(max_bytes):
+    """
+    Cap the address space of a worker process, so a dataframe too large to
+    analyze raises MemoryError for that file instead of exhausting the
+    machine. Not supported on all platforms, where this does nothing.
+    """
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def analyze_file(filename, foreign_keys, sample_size, use_cache,
+                 reference_dir=None):
+    """Analyze a single dataframe in a worker process. Returns a dict
+    with either 'field_metadata' or an 'error'."""
+    try:
+        # Indexes are loaded once per worker, and shared by its files
+        reference_indexes = (load_reference_indexes(foreign_keys,
+                                                    reference_dir)
+                             if reference_dir else None)
+        analyze = analyze_dataframe_cached if use_cache else analyze_dataframe
+        metadata = analyze(filename, foreign_keys, sample_size=sample_size,
+                           reference_indexes=reference_indexes)
+        return {'filename': filename, 'field_metadata': metadata}
+    except MemoryError:
+        return {'filename': filename, 'error': 'Ran out of memory'}
+    except Exception as e:
+        return {'filename': filename, 'error': '{}: {}'.format(
+            type(e).__name__, e)}
+
+
+def get_field_rows(result):
+    """Flatten an analyze_file() result into one row per field"""
+    metadata = result['field_metadata']
+    if 'field_table' in metadata:
+        fields = unpack_field_table(metadata['field_table'])
+    else:
+        fields = metadata['field_definitions']
+    rows = []
+    for field in fields:
+        row = {'filename': result['filename'],
+               'numrows': metadata['numrows'],
+               'numcols': metadata['numcols'],
+               'sampled': 'sampled' in metadata}
+        for key in FIELD_TABLE_KEYS:
+            value = field.get(key)
+            if key in PARQUET_TEXT_KEYS:
+                if isinstance(value, (dict, list)):
+                    value = json.dumps(value)
+                row[key] = None if value is None else str(value)
+            else:
+                row[key] = None if value is None else float(value)
+        rows.append(row)
+    return rows
+
+
+def write_parquet(rows, output):
+    import pandas
+    columns = ['filename', 'numrows', 'numcols', 'sampled'] + FIELD_TABLE_KEYS
+    pandas.DataFrame(rows, columns=columns).to_parquet(output, index=False)
+
+
+@click.command(help='Analyze local dataframes without uploading them. No '
+               'login is required. Results are also cached, so uploading '
+               'the same unmodified files does not analyze them again.')
+@click.argument('dataframes', nargs=-1, required=True,
+                type=click.Path(exists=True, dir_okay=False))
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help='Write results to a file instead of stdout')
+@click.option('--format', 'output_format', type=click.Choice(OUTPUT_FORMATS),
+              default='jsonl', help='jsonl writes one line of field metadata '
+              'per dataframe. parquet writes one row per field, and requires '
+              '--output and pyarrow.')
+@click.option('--workers', type=int, default=os.cpu_count(),
+              help='Number of dataframes analyzed at once')
+@click.option('--max-memory', type=int, default=None,
+              help='Max memory per worker in MB')
+@click.option('--sample', 'sample_size', type=click.IntRange(min=1),
+              help='Estimate metadata from a sample of this many rows')
+@click.option('--no-cache', is_flag=True, default=False,
+              help='Analyze every dataframe, even if cached')
+@click.option('--test', is_flag=True, default=False,
+              help='Reference foreign keys in the test location')
+@click.option('--references', 'reference_dir',
+              type=click.Path(exists=True, file_okay=False),
+              envvar=REFERENCE_DIR_ENV,
+              help='Local directory of reference tables to check foreign '
+                   'keys against, laid out like the Pilot endpoint, ex: '
+                   'DIR/metadata/drugs.tsv')
+def analyze(dataframes, output, output_format, workers, max_memory,
+            sample_size, no_cache, test, reference_dir):
+    if output_format == 'parquet' and not output:
+        raise click.UsageError('--output is required for parquet')
+    foreign_keys = get_foreign_keys(test=test)
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=limit_memory if max_memory else None,
+        initargs=(max_memory * 2 ** 20,) if max_memory else ())
+    failed, rows = 0, []
+    out = open(output, 'w') if output and output_format == 'jsonl' else None
+    try:
+        with executor:
+            futures = {executor.submit(analyze_file, df, foreign_keys,
+                                       sample_size, not no_cache,
+                                       reference_dir): df
+                       for df in dataframes}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    # A worker was killed, usually by the OS for memory
+                    result = {'filename': futures[future],
+                              'error': 'Worker process died'}
+                if 'error' in result:
+                    failed += 1
+                    click.secho('{}: {}'.format(result['filename'],
+                                                result['error']),
+                                fg='red', err=True)
+                elif output_format == 'parquet':
+                    rows.extend(get_field_rows(result))
+                else:
+                    click.echo(json.dumps(result), file=out)
+    finally:
+        if out:
+            out.close()
+    if output_format == 'parquet':
+        write_parquet(rows, output)
+    if output:
+        click.secho('Analyzed {} of {} dataframes'.format(
+            len(dataframes) - failed, len(dataframes)),
+            fg='red' if failed else 'green')
@@ -1,14 +1,18 @@
 import click
 
+from pilot import daemon, metrics
 from pilot.version import __version__
 from pilot.commands.auth import auth_commands
-from pilot.commands.search import search_commands, delete
-from pilot.commands.transfer import transfer_commands, status_commands
+from pilot.commands.analysis import analyze_commands
+from pilot.commands.search import (search_commands, delete, import_commands,
+                                   promote_commands)
+from pilot.commands.transfer import (transfer_commands, status_commands,
+                                     verify_commands)
 
 
 @click.group()
 def cli():
-    pass
+    metrics.flush_at_exit()
 
 
 @click.command(help='Show version and exit')
@@ -16,6 +20,17 @@ def version():
     click.echo(__version__)
 
 
+@click.command(help='Run a long lived pilot server. While it runs, the '
+                    '{} commands are sent to it instead of starting a new '
+                    'process each time.'.format(
+                        ', '.join(daemon.FORWARDED_COMMANDS)))
+@click.option('--socket', 'socket_path', default=daemon.SOCKET_PATH,
+              type=click.Path(), help='Unix socket to listen on')
+def serve(socket_path):
+    click.echo('Serving on {}'.format(socket_path))
+    daemon.serve(socket_path)
+
+
 cli.add_command(auth_commands.login)
 cli.add_command(auth_commands.logout)
 cli.add_command(auth_commands.whoami)
@@ -23,9 +38,15 @@ cli.add_command(auth_commands.whoami)
 cli.add_command(search_commands.list_command)
 cli.add_command(search_commands.describe)
 cli.add_command(delete.delete_command)
+cli.add_command(import_commands.import_command)
+cli.add_command(promote_commands.promote)
 
 cli.add_command(transfer_commands.upload)
 cli.add_command(transfer_commands.download)
 cli.add_command(status_commands.status)
+cli.add_command(verify_commands.verify)
+
+cli.add_command(analyze_commands.analyze)
 
 cli.add_command(version)
+cli.add_command(serve)
@@ -2,13 +2,37 @@ import click
 import os
 import globus_sdk
 
-from pilot.client import PilotClient
+import pilot
+from pilot.batch import run_concurrently, DEFAULT_MAX_WORKERS
 
 
-@click.command(name='delete', help='Delete a search entry')
-@click.argument('path', type=click.Path())
-@click.option('--entry-id', default='metadata', help=('Delete a specific entry'
-              ' within the search subject, or "null" for a null entry id.'))
+def get_subjects(pc, paths, test):
+    subjects = {}
+    for path in paths:
+        fname, dirname = os.path.basename(path), os.path.dirname(path)
+        subjects[pc.get_subject_url(fname, dirname, test)] = path
+    return subjects
+
+
+def wait_for_delete_task(pc, task_id, description):
+    state = pc.wait_for_tasks([task_id])[task_id]
+    color = 'green' if state == 'SUCCESS' else 'red'
+    click.secho('{} finished: {}'.format(description, state), fg=color)
+
+
+@click.command(name='delete', help='Delete search entries. Accepts any number '
+               'of paths, a file of paths, a directory prefix or a query.')
+@click.argument('paths', nargs=-1, type=click.Path())
+@click.option('-f', '--from-file', 'paths_file', type=click.File('r'),
+              help='Read newline separated paths from a file, or "-" for '
+                   'stdin')
+@click.option('--prefix', help='Delete all entries under this directory with '
+              'a single delete-by-query task')
+@click.option('--query', help='Delete all entries matching this Globus Search '
+              'query with a single delete-by-query task')
+@click.option('--entry-id', help='Delete a specific entry within the search '
+              'subject, or "null" for a null entry id. Defaults to '
+              '"metadata".')
 @click.option('--subject', default=False, help=('Delete the entire subject '
               'comprising all of its associated entry ids'))
 @click.option('--test', is_flag=True, default=False)
@@ -16,29 +40,102 @@ from pilot.client import PilotClient
               help="Show report, but don't actually delete entry/file")
 @click.option('--delete-data', 'delete_data', default=False,
               help='Output as JSON.')
-@click.option('--yes', is_flag=True)
-def delete_command(path, entry_id, subject, test, dry_run, delete_data, yes):
-    pc = PilotClient()
+@click.option('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+              help='Number of concurrent delete requests. Requests are still '
+                   'rate limited by the client.')
+@click.option('--yes', is_flag=True,
+              help='Skip confirmation when deleting more than one entry')
+def delete_command(paths, paths_file, prefix, query, entry_id, subject, test,
+                   dry_run, delete_data, workers, yes):
+    pc = pilot.commands.get_pilot_client()
     if not pc.is_logged_in():
         click.echo('You are not logged in.')
         return
 
-    fname, dirname = os.path.basename(path), os.path.dirname(path)
+    if (prefix or query) and (entry_id is not None or subject):
+        raise click.UsageError('--entry-id and --subject can\'t be used with '
+                               '--prefix or --query, which delete whole '
+                               'records')
+    if entry_id is None:
+        entry_id = 'metadata'
+
+    if query:
+        if dry_run:
+            click.secho('Dry Run (No Delete Performed)')
+            click.secho('Delete By Query: {}'.format(query))
+            return
+        if not yes:
+            click.confirm('Delete all entries matching "{}"?'.format(query),
+                          abort=True)
+        task_id = pc.delete_by_query(query, test)
+        wait_for_delete_task(pc, task_id, 'Delete by query')
+        return
+
+    paths = list(paths)
+    if paths_file:
+        paths += [line.strip() for line in paths_file if line.strip()]
+    subjects = get_subjects(pc, paths, test)
+    if not subjects and not prefix:
+        click.echo('Nothing to delete.')
+        return
 
-    sub_url = pc.get_subject_url(fname, dirname, test)
     if dry_run:
         click.secho('Dry Run (No Delete Performed)')
-        click.secho('Search Entry: {}'.format(sub_url))
-        click.secho('File: {}'.format(pc.get_path(fname, dirname, test)))
+        for sub_url, path in subjects.items():
+            fname, dirname = os.path.basename(path), os.path.dirname(path)
+            click.secho('Search Entry: {}'.format(sub_url))
+            click.secho('File: {}'.format(pc.get_path(fname, dirname, test)))
+        if prefix:
+            for sub_url in pc.get_subjects_by_prefix(prefix, test):
+                click.secho('Search Entry: {}'.format(sub_url))
         return
 
-    try:
-        pc.delete_entry(fname, dirname, test, entry_id=entry_id,
-                        full_subject=subject)
-        click.secho('Removed {} Successfully'.format(path), fg='green')
-    except globus_sdk.exc.SearchAPIError as se:
-        if se.code == 'NotFound.Generic':
-            click.secho('{} does not exist, or cannot be found at your '
-                        'permission level.'.format(path), fg='yellow')
-        else:
-            click.secho(str(se))
+    if prefix:
+        if not yes:
+            click.confirm('Delete all entries under "{}"?'.format(prefix),
+                          abort=True)
+        task_id = pc.delete_by_prefix(prefix, test)
+        wait_for_delete_task(pc, task_id, 'Delete by prefix')
+        if not subjects:
+            return
+
+    if len(subjects) > 1 and not yes:
+        click.confirm('Delete {} entries?'.format(len(subjects)), abort=True)
+
+    def delete(sub_url):
+        return pc.delete_subject_entry(sub_url, test, entry_id=entry_id,
+                                       full_subject=subject)
+
+    results = run_concurrently(delete, subjects, max_workers=workers)
+    task_ids, removed, missing, errors = [], [], [], []
+    with click.progressbar(results, length=len(subjects),
+                           label='Deleting entries') as bar:
+        for sub_url, result, error in bar:
+            path = subjects[sub_url]
+            if error is None:
+                removed.append(path)
+                if result and result.get('task_id'):
+                    task_ids.append(result['task_id'])
+            elif isinstance(error, globus_sdk.exc.SearchAPIError) and \
+                    error.code == 'NotFound.Generic':
+                missing.append(path)
+            else:
+                errors.append((path, error))
+
+    if task_ids:
+        states = pc.wait_for_tasks(task_ids)
+        failed = [t for t, s in states.items() if s != 'SUCCESS']
+        if failed:
+            click.secho('{} delete tasks did not succeed: {}'.format(
+                len(failed), ', '.join(failed)), fg='red')
+
+    for path in missing:
+        click.secho('{} does not exist, or cannot be found at your '
+                    'permission level.'.format(path), fg='yellow')
+    for path, error in errors:
+        click.secho('{}: {}'.format(path, error), fg='red')
+    if len(subjects) == 1 and removed:
+        click.secho('Removed {} Successfully'.format(removed[0]), fg='green')
+    elif removed:
+        click.secho('Removed {} of {} entries Successfully'.format(
+            len(removed), len(subjects)), fg='green')
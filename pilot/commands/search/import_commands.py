@@ -0,0 +1,93 @@
+import os
+import click
+import jsonschema
+
+import pilot
+from pilot.search import get_creator_name, gen_gmeta_entry, gen_gmeta_list
+from pilot.importer import (read_value_files, iter_sheet, gen_record,
+                            validate_record, iter_batches, Checkpoint,
+                            VALUE_FILES, DEFAULT_BATCH_BYTES,
+                            CHECKPOINT_SUFFIX)
+
+
+@click.command(name='import', help='Import a catalog of dataframes already on '
+               'the Pilot endpoint into search. SHEET is a tab separated '
+               'metadata sheet with one row per dataframe. Checksums, sizes '
+               'and shapes are read from {} next to it, if present.'.format(
+                   ', '.join(VALUE_FILES.values())))
+@click.argument('sheet', type=click.Path(exists=True, dir_okay=False))
+@click.option('--catalog-dir', type=click.Path(exists=True, file_okay=False),
+              help='Directory holding the value files, if not next to SHEET')
+@click.option('--checkpoint', type=click.Path(dir_okay=False),
+              help='File recording imported dataframes, so an interrupted '
+                   'import resumes where it left off. Defaults to '
+                   'SHEET{}'.format(CHECKPOINT_SUFFIX))
+@click.option('--restart', is_flag=True, default=False,
+              help='Ignore the checkpoint and import everything again')
+@click.option('--creator', help='Datacite creator for every record. Defaults '
+              'to the logged in user')
+@click.option('--batch-bytes', type=int, default=DEFAULT_BATCH_BYTES,
+              help='Max size of each ingest request')
+@click.option('--test', is_flag=True, default=False)
+@click.option('--dry-run', is_flag=True, default=False,
+              help="Validate records and show batches, but don't ingest")
+def import_command(sheet, catalog_dir, checkpoint, restart, creator,
+                   batch_bytes, test, dry_run):
+    pc = pilot.commands.get_pilot_client()
+    if not pc.is_logged_in():
+        click.echo('You are not logged in.')
+        return
+
+    values = read_value_files(catalog_dir or os.path.dirname(sheet) or '.')
+    progress = Checkpoint(checkpoint or sheet + CHECKPOINT_SUFFIX)
+    if restart and not dry_run:
+        progress.clear()
+    elif len(progress):
+        click.echo('Resuming, skipping {} imported dataframes'.format(
+            len(progress)))
+    creator = creator or get_creator_name()
+    invalid = []
+
+    def iter_entries():
+        for row in iter_sheet(sheet):
+            location = row['location']
+            if not location or (location in progress and not restart):
+                continue
+            fname, dirname = (os.path.basename(location),
+                              os.path.dirname(location))
+            url = pc.get_globus_http_url(fname, dirname, test)
+            record = gen_record(row, values, url, creator)
+            try:
+                validate_record(record)
+            except jsonschema.exceptions.ValidationError as ve:
+                invalid.append((location, ve.message))
+                continue
+            subject = pc.get_subject_url(fname, dirname, test)
+            yield location, gen_gmeta_entry(subject, pc.GROUP, record)
+
+    imported, failed = 0, 0
+    if dry_run:
+        click.secho('Dry Run (No Ingest Performed)')
+    for batch in iter_batches(iter_entries(), batch_bytes):
+        locations = [location for location, _ in batch]
+        if dry_run:
+            click.echo('Batch of {} entries: {} ... {}'.format(
+                len(batch), locations[0], locations[-1]))
+            continue
+        try:
+            pc.ingest_entry(gen_gmeta_list([e for _, e in batch]), test)
+            progress.add(locations)
+            imported += len(batch)
+            click.echo('Imported {} entries'.format(imported))
+        except Exception as e:
+            failed += len(batch)
+            click.secho('Failed to import {} entries ({} ... {}): {}'.format(
+                len(batch), locations[0], locations[-1], e), fg='red')
+
+    for location, message in invalid:
+        click.secho('Skipped invalid record {}: {}'.format(location, message),
+                    fg='yellow')
+    if not dry_run:
+        color = 'red' if failed else 'green'
+        click.secho('Import finished: {} imported, {} failed, {} invalid'
+                    ''.format(imported, failed, len(invalid)), fg=color)
@@ -0,0 +1,191 @@
+import os
+import click
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import pilot
+from urllib.parse import urlparse
+from pilot.diff import get_content_hash
+from pilot.importer import iter_batches, DEFAULT_BATCH_BYTES
+from pilot.search import (gen_gmeta_entry, gen_gmeta_list, relocate,
+                          relocate_record, relocate_field_table,
+                          FIELD_TABLE_ENTRY_ID)
+
+
+def get_promoted_location(pc, subject):
+    """The (filename, directory) of a test subject, or None if the subject is
+    not under the test location"""
+    base = pc.get_subject_url('', '', True)
+    if not subject.startswith(base):
+        return None
+    location = subject[len(base):]
+    return os.path.basename(location), os.path.dirname(location)
+
+
+def get_legacy_field_table(result):
+    """The field table of a test search result, if it was stored in a
+    separate search entry by an older version"""
+    for content in result['content']:
+        if FIELD_TABLE_ENTRY_ID in content:
+            return content[FIELD_TABLE_ENTRY_ID]
+
+
+def get_promoted_files(pc, content):
+    """(test path, production path) of every file in a test record"""
+    paths = [(pc.get_path('', '', True), pc.get_path('', '', False))]
+    files = []
+    for manifest in content.get('files') or []:
+        path = urlparse(manifest.get('url', '')).path
+        if path.startswith(paths[0][0]):
+            files.append((path, relocate(path, paths)))
+    return files
+
+
+@click.command(help='Copy search records from the test index to production '
+               'in bulk. Nothing is re-analyzed and data files are left '
+               'alone: file urls and references in each record are moved to '
+               'production, and field tables are stored next to them. Use '
+               '--copy-files if the data files are not in production yet.')
+@click.option('--prefix', help='Only promote records for dataframes under '
+              'this directory')
+@click.option('-u', '--update/--no-update', default=False,
+              help='Overwrite production records which differ from test')
+@click.option('--copy-files', is_flag=True, default=False,
+              help='Also copy data files to production with a Globus '
+              'transfer. Records are only ingested after their files are '
+              'copied successfully.')
+@click.option('--batch-bytes', type=int, default=DEFAULT_BATCH_BYTES,
+              help='Max size of each ingest request')
+@click.option('--dry-run', is_flag=True, default=False,
+              help="Show what would be promoted, but don't ingest")
+def promote(prefix, update, copy_files, batch_bytes, dry_run):
+    pc = pilot.commands.get_pilot_client()
+    if not pc.is_logged_in():
+        click.echo('You are not logged in.')
+        return
+
+    relocations = pc.get_relocations(True)
+    test_filters, prod_filters = None, None
+    if prefix:
+        test_filters = [pc.get_prefix_filter(prefix, True)]
+        prod_filters = [pc.get_prefix_filter(prefix, False)]
+    # One scan of production, so records already promoted are skipped
+    # without fetching them one at a time.
+    prod_hashes = {
+        r['subject']: get_content_hash(pc.get_metadata_content(r['content']))
+        for r in pc.iter_search_entries(test=False, filters=prod_filters)
+    }
+    skipped, unchanged, promoted, failed = [], 0, [], set()
+    # Data files to copy, keyed by the subject of the record they belong to
+    files = {}
+
+    def iter_entries():
+        nonlocal unchanged
+        for result in pc.iter_search_entries(test=True, filters=test_filters):
+            location = get_promoted_location(pc, result['subject'])
+            content = pc.get_metadata_content(result['content'])
+            if not location or not content:
+                continue
+            filename, directory = location
+            subject = pc.get_subject_url(filename, directory, False)
+            legacy_table = get_legacy_field_table(result)
+            field_metadata = content.get('field_metadata') or {}
+            if legacy_table:
+                # Promoted records store it next to the data like new ones
+                content = dict(content, field_metadata=dict(
+                    field_metadata, field_table_url=pc.get_field_table_url(
+                        filename, directory, True)))
+            record = relocate_record(content, relocations)
+            prev_hash = prod_hashes.get(subject)
+            if prev_hash == get_content_hash(record):
+                unchanged += 1
+                continue
+            if prev_hash and not update:
+                skipped.append(subject)
+                continue
+            if not dry_run and (legacy_table or
+                                'field_table_url' in field_metadata):
+                field_table = legacy_table or pc.get_field_table(
+                    filename, directory, True)
+                response = field_table and pc.upload_field_table(
+                    relocate_field_table(field_table, relocations), filename,
+                    directory, False)
+                if not field_table or response.status_code != 200:
+                    failed.add(subject)
+                    click.secho('Failed to store the field table for {}'
+                                ''.format(subject), fg='red')
+                    continue
+            promoted.append(subject)
+            if copy_files:
+                files[subject] = get_promoted_files(pc, content)
+            yield subject, gen_gmeta_entry(subject, pc.GROUP, record)
+
+    def promote_batch(batch, owners):
+        """Copy the data files of a batch, then ingest the records whose
+        files arrived. owners maps each (test path, production path) to the
+        subject of its record. Returns the copy tasks and the subjects not
+        ingested because their files failed to copy."""
+        tasks, copy_failed = [], set()
+        if owners:
+            tasks = pc.copy_files(list(owners))
+            statuses = pc.wait_for_transfers([t['task_id'] for t, _ in tasks])
+            copy_failed = {owners[paths] for task, items in tasks
+                           if statuses[task['task_id']] != 'SUCCEEDED'
+                           for paths in items}
+        entries = [e for s, e in batch if s not in copy_failed]
+        if entries:
+            pc.ingest_entry(gen_gmeta_list(entries), False)
+        return tasks, copy_failed
+
+    def collect(futures):
+        for future in futures:
+            subjects = pending.pop(future)
+            if future.exception() is not None:
+                failed.update(subjects)
+                click.secho('Failed to promote {} records ({} ... {}): {}'
+                            ''.format(len(subjects), subjects[0],
+                                      subjects[-1], future.exception()),
+                            fg='red')
+                continue
+            tasks, copy_failed = future.result()
+            for task, items in tasks:
+                dest = items[0][1]
+                short_path = dest if len(items) == 1 else \
+                    '{} (+{} more)'.format(dest, len(items) - 1)
+                pilot.config.config.add_transfer_log(task, short_path)
+                click.echo('Copied {} files to production: {}'.format(
+                    len(items), task['task_id']))
+            for subject in sorted(copy_failed):
+                click.secho('Failed to copy the files of {}, it was not '
+                            'promoted'.format(subject), fg='red')
+            failed.update(copy_failed)
+
+    # Batches are ingested as they are built, a few at a time, so the test
+    # index is never held in memory.
+    pending = {}
+    if dry_run:
+        click.secho('Dry Run (No Ingest Performed)')
+        for _ in iter_entries():
+            pass
+        for subject in promoted:
+            click.echo('Would promote {}'.format(subject))
+        if copy_files:
+            click.echo('Would copy {} files to production'.format(
+                sum(len(paths) for paths in files.values())))
+    else:
+        for batch in iter_batches(iter_entries(), batch_bytes):
+            if len(pending) >= pc.max_workers:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            owners = {paths: subject for subject, _ in batch
+                      for paths in files.pop(subject, [])}
+            future = pc.executor.submit(promote_batch, batch, owners)
+            pending[future] = sorted({s for s, _ in batch})
+        collect(wait(pending).done)
+
+    for subject in skipped:
+        click.secho('Skipped {}, it differs in production. Use -u to '
+                    'overwrite it.'.format(subject), fg='yellow')
+    click.secho('{} records {}promoted, {} failed, {} already up to date, {} '
+                'skipped'.format(len(set(promoted) - failed),
+                                 'would be ' if dry_run else '', len(failed),
+                                 unchanged, len(skipped)),
+                fg='red' if failed else 'green')
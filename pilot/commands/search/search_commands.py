@@ -3,10 +3,23 @@ import urllib
 import json
 import datetime
 import click
-import globus_sdk
+import pilot
 from pilot.client import PilotClient
+from pilot.analysis import unpack_field_table
 
 PORTAL_DETAIL_PAGE_PREFIX = 'https://petreldata.net/nci-pilot1/detail/'
+# Short names for fields that can be filtered with 'pilot list --filter'
+LIST_FILTER_FIELDS = {
+    'data_type': 'ncipilot.data_type',
+    'dataframe_type': 'ncipilot.dataframe_type',
+    'mime_type': 'files.mime_type',
+    'creator': 'dc.creators.creatorName',
+    'version': 'dc.version',
+}
+LIST_FACETS = [
+    {'name': 'Data Type', 'field_name': 'ncipilot.data_type'},
+    {'name': 'Dataframe Type', 'field_name': 'ncipilot.dataframe_type'},
+]
 
 
 def get_single_file_rfm(result):
@@ -62,28 +75,75 @@ def fetch_format(columns, search_entry, fmt_func, list_fmt_func):
     return '\n'.join(formatted_rows)
 
 
+def gen_list_query(query, filters, since):
+    """
+    Compile list command options into a structured Globus Search query.
+    :param query: Free text query, or None for everything
+    :param filters: list of (field, value) tuples. Short field names in
+    LIST_FILTER_FIELDS are expanded, anything else is used as is.
+    :param since: datetime, only match records with a date after this
+    """
+    values = {}
+    for field, value in filters:
+        field_name = LIST_FILTER_FIELDS.get(field, field)
+        values.setdefault(field_name, []).append(value)
+    search_filters = [{'type': 'match_any', 'field_name': field_name,
+                       'values': vals} for field_name, vals in values.items()]
+    if since:
+        search_filters.append({
+            'type': 'range',
+            'field_name': 'dc.dates.date',
+            'values': [{'from': since.strftime('%Y-%m-%d %H:%M:%S'),
+                        'to': '*'}]
+        })
+    return {'q': query or '*', 'filters': search_filters}
+
+
+def parse_filter(ctx, param, value):
+    filters = []
+    for item in value:
+        field, sep, fvalue = item.partition('=')
+        if not sep or not field or not fvalue:
+            raise click.BadParameter('Must be in the form FIELD=VALUE')
+        filters.append((field, fvalue))
+    return filters
+
+
 @click.command(name='list', help='List known records in Globus Search')
+@click.argument('query', required=False)
 @click.option('--test/--no-test', default=False,
               help='Look for entry on test index/endpoint path.')
 @click.option('--json/--no-json', 'output_json', default=False,
-              help='Output as JSON.')
+              help='Output as JSON, shaped like a single Globus Search '
+                   'result with the results of every page in gmeta.')
 @click.option('--limit', type=int, default=100,
               help='Limit returned results to the number provided')
-def list_command(test, output_json, limit):
+@click.option('--filter', 'filters', multiple=True, callback=parse_filter,
+              help='Only list records where FIELD=VALUE. FIELD may be one of '
+                   '{} or a full search field name. May be given more than '
+                   'once.'.format(', '.join(LIST_FILTER_FIELDS)))
+@click.option('--data-type', help='Shorthand for --filter data_type=VALUE')
+@click.option('--dataframe-type',
+              help='Shorthand for --filter dataframe_type=VALUE')
+@click.option('--since', type=click.DateTime(),
+              help='Only list records created or updated since this date')
+@click.option('--facets/--no-facets', default=False,
+              help='Show counts of records for each data and dataframe type')
+def list_command(query, test, output_json, limit, filters, data_type,
+                 dataframe_type, since, facets):
     # Should require login if there are publicly visible records
-    pc = PilotClient()
+    pc = pilot.commands.get_pilot_client()
     if not pc.is_logged_in():
         click.echo('You are not logged in.')
         return
 
-    search_authorizer = pc.get_authorizers()['search.api.globus.org']
-    sc = globus_sdk.SearchClient(authorizer=search_authorizer)
-    # TO DO: iterate instead of upping limit
-    search_results = sc.search(index_id=pc.get_index(test), q='*', limit=limit)
-
-    if output_json:
-        click.echo(json.dumps(search_results.data, indent=4))
-        return
+    if data_type:
+        filters.append(('data_type', data_type))
+    if dataframe_type:
+        filters.append(('dataframe_type', dataframe_type))
+    query_doc = gen_list_query(query, filters, since)
+    if facets:
+        query_doc['facets'] = LIST_FACETS
 
     fmt = '{:21.20}{:11.10}{:10.9}{:7.6}{:7.6}{:7.6}{}'
     columns = [
@@ -96,25 +156,67 @@ def list_command(test, output_json, limit):
         ('Filename', get_identifier),
     ]
 
-    # Build row data
-    rows = []
-    for result in search_results['gmeta']:
-        content = result['content'][0]
-        if content.get('testing'):
-            content = content['testing']
-        row = []
-        for _, function in columns:
-            try:
-                row.append(function(content))
-            except Exception:
-                row.append('')
-                # raise
-        rows.append(row)
+    # Rows are built page by page, so full records are never all held
+    # in memory at once.
+    rows, facet_results, total, json_result = [], [], 0, None
+    for page in pc.iter_search_pages(query_doc, test, limit=limit):
+        total = page['total']
+        facet_results = page.get('facet_results') or facet_results
+        if output_json:
+            # Pages are merged into the first one, so scripts see the same
+            # shape as a single search response
+            if json_result is None:
+                json_result = dict(getattr(page, 'data', page), gmeta=[])
+            json_result['gmeta'].extend(page['gmeta'])
+            continue
+        for result in page['gmeta']:
+            content = pc.get_metadata_content(result['content'])
+            if not content:
+                continue
+            if content.get('testing'):
+                content = content['testing']
+            row = []
+            for _, function in columns:
+                try:
+                    row.append(function(content))
+                except Exception:
+                    row.append('')
+                    # raise
+            rows.append(row)
+
+    if output_json:
+        json_result = json_result or {'gmeta': [], 'offset': 0, 'total': 0}
+        json_result.update(count=len(json_result['gmeta']),
+                           has_next_page=total > len(json_result['gmeta']))
+        click.echo(json.dumps(json_result, indent=4))
+        return
 
     formatted_rows = [fmt.format(*r) for r in rows]
     header = fmt.format(*[c[0] for c in columns])
     output = '{}\n{}'.format(header, '\n'.join(formatted_rows))
     click.echo(output)
+    if total > len(rows):
+        click.echo('Showing {} of {} records'.format(len(rows), total))
+    for facet in facet_results:
+        click.echo('\n{}'.format(facet['name']))
+        for bucket in facet.get('buckets', []):
+            value = str(bucket['value'])
+            click.echo('{:31.30}{}'.format(value, bucket['count']))
+
+
+def get_sampled(result):
+    sampled = result['field_metadata']['sampled']
+    low, high = sampled['numrows_ci']
+    return ['{} rows, {} method'.format(sampled['sample_size'],
+                                        sampled['method']),
+            'Rows {:.0%} CI: {}-{}'.format(sampled['confidence'], low, high)]
+
+
+def get_approximate(result):
+    approximate = result['field_metadata']['approximate']
+    return '{} percentiles within {:.0%} ({})'.format(
+        ', '.join(approximate['fields']), approximate['relative_error'],
+        approximate['method'])
 
 
 def get_dates(result):
@@ -132,8 +234,10 @@ def get_dates(result):
               help='Look for entry on test index/endpoint path.')
 @click.option('--json/--no-json', 'output_json', default=False,
               help='Output as JSON.')
-def describe(path, test, output_json):
-    pc = PilotClient()
+@click.option('--all-fields', is_flag=True, default=False,
+              help='Show metadata for every field, not only the first few.')
+def describe(path, test, output_json, all_fields):
+    pc = pilot.commands.get_pilot_client()
     if not pc.is_logged_in():
         click.echo('You are not logged in.')
         return
@@ -149,6 +253,12 @@ def describe(path, test, output_json):
         click.echo('Unable to find entry')
         return
 
+    if all_fields:
+        field_table = pc.get_field_table(fname, dirname, test)
+        if field_table:
+            entry['field_metadata']['field_definitions'] = \
+                unpack_field_table(field_table)
+
     if output_json:
         click.echo(json.dumps(entry, indent=4))
         return
@@ -164,6 +274,8 @@ def describe(path, test, output_json):
         ('Dataframe', lambda r: r['ncipilot']['dataframe_type']),
         ('Rows', lambda r: str(r['field_metadata']['numrows'])),
         ('Columns', lambda r: str(r['field_metadata']['numcols'])),
+        ('Sampled', get_sampled),
+        ('Approximate', get_approximate),
         ('Formats', lambda r: r['dc']['formats']),
         ('Version', lambda r: r['dc']['version']),
         ('Size', get_size),
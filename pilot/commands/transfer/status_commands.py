@@ -1,50 +1,194 @@
+import time
 import click
+import numpy
 
-from pilot.config import config
-from pilot.client import PilotClient
-import globus_sdk
+import pilot
+from pilot import progress
 
 PENDING_TASK_STATES = ['Accepted', 'ACTIVE', 'INACTIVE']
+# Max task ids in a single task_list filter
+TASK_LIST_BATCH_SIZE = 100
+STATS_PERIODS = {'day': '%Y-%m-%d', 'week': '%G-W%V', 'month': '%Y-%m'}
+STATS_PERCENTILES = [10, 50, 90]
+
+
+def get_task_stats(task_doc):
+    """Pull the throughput fields stored in the transfer log from a Globus
+    Transfer task document"""
+    stats = {f: task_doc.get(f) for f in
+             pilot.config.Config.TRANSFER_STAT_FIELDS}
+    if stats['completion_time']:
+        stats['completion_time'] = pilot.config.parse_timestamp(
+            stats['completion_time'])
+    return stats
+
+
+def fetch_task_documents(task_ids):
+    """
+    Fetch Globus Transfer task documents, with one task_list call per
+    TASK_LIST_BATCH_SIZE tasks instead of one call per task.
+    :return: dict of task_id to task document
+    """
+    pc = pilot.commands.get_pilot_client()
+    tc = pc.gtransfer
+    task_ids = list(task_ids)
+    documents = {}
+    for idx in range(0, len(task_ids), TASK_LIST_BATCH_SIZE):
+        batch = task_ids[idx:idx + TASK_LIST_BATCH_SIZE]
+        tasks = pc.call_api(tc.task_list, num_results=len(batch),
+                            filter='task_id:{}'.format(','.join(batch)))
+        documents.update({t.data['task_id']: t.data for t in tasks.data})
+    return documents
 
 
 def update_tasks(transfer_tasks):
     """
-    Update pending Globus Transfer tasks, and save the resulting status to
-    the config. transfer tasks is a list of dicts as returned by
-    config.get_transfer_log()
+    Update Globus Transfer tasks, and save the resulting status and
+    throughput stats to the config. transfer tasks is a list of dicts as
+    returned by config.get_transfer_log()
 
     User must be logged in!
     """
-    pc = PilotClient()
-    auth = pc.get_authorizers()['transfer.api.globus.org']
-    tc = globus_sdk.TransferClient(authorizer=auth)
-    statuses = {r.data['task_id']: r.data['status'] for r in
-                tc.task_list(num_results=100).data}
+    documents = fetch_task_documents(t['task_id'] for t in transfer_tasks)
+    updates = {}
     for task in transfer_tasks:
-        status = statuses.get(task['task_id'])
-        if not status:
+        doc = documents.get(task['task_id'])
+        if not doc:
             click.secho('Unable to update status for {}'.format(task['id']),
                         fg='yellow')
-        else:
-            config.update_transfer_log(task['task_id'], status)
+            continue
+        updates[task['task_id']] = {'status': doc['status']}
+        if doc['status'] not in PENDING_TASK_STATES:
+            updates[task['task_id']].update(get_task_stats(doc))
+    pilot.config.config.update_transfer_logs(updates)
+
+
+def percentile_rows(tlogs, period):
+    """
+    Summarize finished transfers by the period they completed in.
+    :return: list of rows, one per period, oldest first
+    """
+    groups = {}
+    for tlog in tlogs:
+        if tlog.get('completion_time') is None:
+            continue
+        key = tlog['completion_time'].strftime(STATS_PERIODS[period])
+        groups.setdefault(key, []).append(tlog)
+    rows = []
+    for key in sorted(groups):
+        logs = groups[key]
+        mb_per_second = [t.get('effective_bytes_per_second', 0) / 10 ** 6
+                         for t in logs]
+        percentiles = numpy.percentile(mb_per_second, STATS_PERCENTILES)
+        rows.append([
+            key, len(logs),
+            sum(t.get('bytes_transferred', 0) for t in logs) / 10 ** 6,
+        ] + list(percentiles) + [sum(t.get('faults', 0) for t in logs)])
+    return rows
+
+
+def print_stats(tlogs, period):
+    rows = percentile_rows(tlogs, period)
+    if not rows:
+        click.echo('No finished transfers with stats to summarize')
+        return
+    fmt = '{:12.11}{:>7}{:>12}' + '{:>10}' * len(STATS_PERCENTILES) + '{:>8}'
+    click.echo(fmt.format('Period', 'Tasks', 'MB', *[
+        'p{} MB/s'.format(p) for p in STATS_PERCENTILES], 'Faults'))
+    for row in rows:
+        values = ['{:.1f}'.format(v) for v in row[2:-1]]
+        click.echo(fmt.format(row[0], str(row[1]), *values, str(row[-1])))
+
+
+def follow_tasks(task_ids):
+    """
+    Print new events and aggregate progress for transfer tasks until they
+    all finish. Logged tasks have their final status and stats saved.
+    """
+    tracker = progress.TransferProgress(task_ids)
+    while True:
+        documents = fetch_task_documents(tracker.pending_task_ids)
+        missing = set(tracker.pending_task_ids) - set(documents)
+        if missing:
+            raise click.ClickException('Unable to find transfer tasks: '
+                                       '{}'.format(', '.join(sorted(missing))))
+        pc = pilot.commands.get_pilot_client()
+        for task_id in tracker.update(documents):
+            for event in progress.fetch_new_events(pc, task_id,
+                                                   tracker.events[task_id]):
+                click.echo(progress.format_event(task_id, event))
+            if task_id in documents:
+                doc = documents[task_id]
+                click.echo('{} {} {} ({} of {} files)'.format(
+                    task_id[:8], doc['status'],
+                    progress.format_bytes(doc.get('bytes_transferred', 0)),
+                    doc.get('files_transferred', 0), doc.get('files', 0)))
+        click.secho('{} tasks, {} done, {}/s, ETA {}'.format(
+            len(task_ids), len(task_ids) - len(tracker.pending_task_ids),
+            progress.format_bytes(tracker.rate or 0),
+            progress.format_duration(tracker.get_eta())), fg='green')
+        if tracker.finished:
+            break
+        time.sleep(tracker.interval)
+
+    logged = {t['task_id'] for t in pilot.config.config.get_transfer_log()}
+    pilot.config.config.update_transfer_logs({
+        tid: dict(get_task_stats(doc), status=doc['status'])
+        for tid, doc in tracker.tasks.items() if tid in logged})
+    failed = [tid for tid, doc in tracker.tasks.items()
+              if doc['status'] != 'SUCCEEDED']
+    if failed:
+        raise click.ClickException('Transfers failed: {}'.format(
+            ', '.join(failed)))
 
 
-@click.command(help='Check status of transfers')
-# @click.argument('task', required=False)
+@click.command(help='Check status of transfers. With --follow, track TASKS '
+               '(default: all pending logged tasks) until they finish.')
+@click.argument('tasks', nargs=-1)
+@click.option('--follow', is_flag=True, default=False,
+              help='Print live progress, rate and ETA until tasks finish')
 @click.option('-n', 'number', type=int, default=10,
               help='Number of tasks to list')
-def status(number):
-
+@click.option('--stats', is_flag=True, default=False,
+              help='Summarize transfer throughput percentiles over all '
+                   'logged transfers instead of listing tasks')
+@click.option('--period', type=click.Choice(sorted(STATS_PERIODS)),
+              default='week', help='Period to group --stats by')
+def status(tasks, follow, number, stats, period):
+    config = pilot.config.config
+    if follow:
+        tasks = tasks or [t['task_id'] for t in config.get_transfer_log()
+                          if t['status'] in PENDING_TASK_STATES]
+        if not tasks:
+            click.echo('No pending transfers to follow.')
+            return
+        try:
+            follow_tasks(list(tasks))
+        except KeyboardInterrupt:
+            pass
+        return
+    elif tasks:
+        raise click.UsageError('TASKS can only be given with --follow')
     ordered_tlogs = []
     tlog_order = ['id', 'dataframe', 'status', 'start_time', 'task_id']
     # Fetch a limmited set of logs by the most recent entries
-    tlogs = config.get_transfer_log()[:number]
+    tlogs = config.get_transfer_log()
+    if not stats:
+        tlogs = tlogs[:number]
 
-    pending_tasks = [t for t in tlogs if t['status'] in PENDING_TASK_STATES]
-    if pending_tasks:
+    # Tasks logged before stats were kept are fetched once to fill them in
+    stale_tasks = [t for t in tlogs if t['status'] in PENDING_TASK_STATES or
+                   (stats and 'completion_time' not in t)]
+    if stale_tasks:
         click.secho('Updating tasks...', fg='green')
-        update_tasks(pending_tasks)
-        tlogs = config.get_transfer_log()[:number]
+        update_tasks(stale_tasks)
+        tlogs = config.get_transfer_log()
+        if not stats:
+            tlogs = tlogs[:number]
+
+    if stats:
+        print_stats(tlogs, period)
+        return
 
     for tlog in tlogs:
         tlog['id'] = str(tlog['id'])
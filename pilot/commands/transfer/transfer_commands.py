@@ -4,19 +4,198 @@ import click
 import globus_sdk
 import datetime
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import pilot
+from pilot.client import (SYNC_LEVELS, DEFAULT_SYNC_LEVEL,
+                          DEFAULT_MAX_TRANSFER_ITEMS)
 from pilot.search import (scrape_metadata, update_metadata, gen_gmeta,
-                          files_modified)
+                          files_modified, pop_field_table, get_foreign_keys,
+                          relocate_record, relocate_field_table)
+from pilot.batch import iter_results, DEFAULT_MAX_WORKERS
+from pilot.checksums import (find_bad_blocks, hash_block, get_merkle_root,
+                             BLOCK_SIZE)
+from pilot.references import (load_reference_indexes, fetch_reference_indexes,
+                              REFERENCE_DIR_ENV)
+from pilot.analysis import get_dtype_hints, unpack_field_table
+from pilot.diff import get_content_hash, diff, format_diff
+from pilot import metrics
 from pilot.exc import RequiredUploadFields
 from jsonschema.exceptions import ValidationError
 
 
-@click.command(help='Upload dataframe to location on Globus and categorize it '
-                    'in search')
-@click.argument('dataframe',
-                type=click.Path(exists=True, file_okay=True, dir_okay=False,
-                                readable=True, resolve_path=True),)
-@click.argument('destination', type=click.Path(), required=False)
+def parse_analyze_mode(ctx, param, value):
+    """Click callback for --analyze. Returns the number of rows to sample,
+    0 for a full analysis, or None to skip analysis."""
+    if value == 'full':
+        return 0
+    if value == 'none':
+        return None
+    mode, _, size = value.partition(':')
+    if mode == 'sample' and size.isdigit() and int(size) > 0:
+        return int(size)
+    raise click.BadParameter('Must be "full", "none" or "sample:N"')
+
+
+def get_previous_dtypes(pc, prev_metadata, filename, destination, test):
+    """Get dtype hints from the field metadata of a previous version, so it
+    doesn't need to be inferred again."""
+    field_metadata = (prev_metadata or {}).get('field_metadata')
+    if not field_metadata:
+        return None
+    fields = field_metadata.get('field_definitions', [])
+    if field_metadata.get('numcols', 0) > len(fields):
+        field_table = pc.get_field_table(filename, destination, test)
+        if field_table:
+            fields = unpack_field_table(field_table)
+    return get_dtype_hints(fields)
+
+
+def get_index_name(test):
+    return 'test' if test else 'production'
+
+
+def ingest_both_indexes(pc, gmetas):
+    """Ingest already validated gmetas, a dict of test flag to gmeta, into
+    the test and production indexes concurrently."""
+    errors = []
+    for index_test, _, exc in iter_results(pc.ingest_indexes(gmetas)):
+        index = get_index_name(index_test)
+        if exc is not None:
+            click.secho('Failed to ingest into the {} index: {}'.format(
+                index, exc), fg='red')
+            errors.append(exc)
+        else:
+            click.echo('Ingested into the {} index'.format(index))
+    if errors:
+        raise errors[0]
+
+
+def upload_dataframe(pc, dataframe, destination, user_metadata, update,
+                     test, dry_run, verbose, no_analyze, sample_size=None,
+                     both_indexes=False, reference_indexes=None,
+                     block_size=None):
+    """
+    Scrape, validate and ingest a search record for a single dataframe.
+    Returns the locations the dataframe still needs to be moved to, as a
+    list of test flags. If both_indexes is set, records for the test and
+    production locations are built from the same scrape, each from its own
+    previous record and pointing to its own files, and each index is only
+    updated if its record changed. If block_size is set, block hashes are
+    added to the file manifest.
+    """
+    filename = os.path.basename(dataframe)
+    locations = [test, not test] if both_indexes else [test]
+    prev_records = {t: pc.get_search_entry(filename, destination, t)
+                    for t in locations}
+
+    url = pc.get_globus_http_url(filename, destination, test)
+    dtypes = None
+    if not no_analyze and not sample_size:
+        dtypes = get_previous_dtypes(pc, prev_records[test], filename,
+                                     destination, test)
+    scraped = scrape_metadata(dataframe, url, no_analyze, test, dtypes,
+                              sample_size, reference_indexes, block_size)
+    field_table = pop_field_table(scraped)
+    if field_table:
+        scraped['field_metadata']['field_table_url'] = \
+            pc.get_field_table_url(filename, destination, test)
+    scrapes = {test: (scraped, field_table)}
+    if both_indexes:
+        relocations = pc.get_relocations(test)
+        scrapes[not test] = (relocate_record(scraped, relocations),
+                             relocate_field_table(field_table, relocations))
+
+    records, gmetas = {}, {}
+    try:
+        for t in locations:
+            records[t] = update_metadata(scrapes[t][0], prev_records[t],
+                                         user_metadata)
+            gmetas[t] = gen_gmeta(pc.get_subject_url(filename, destination, t),
+                                  pc.GROUP, records[t])
+    except (RequiredUploadFields, ValidationError) as e:
+        click.secho('Error Validating Metadata: {}'.format(e), fg='red')
+        return []
+
+    remote_matches, changed = {}, []
+    for t in locations:
+        remote = pc.ls(filename, destination, t)
+        length = records[t]['files'][0]['length']
+        remote_matches[t] = bool(remote) and remote.get('size') == length
+        if get_content_hash(records[t]) != get_content_hash(prev_records[t]):
+            changed.append(t)
+    if not changed and all(remote_matches.values()):
+        click.secho('Files and search entry are an exact match. No update '
+                    'necessary.', fg='green')
+        return []
+
+    existing = [prev for prev in prev_records.values() if prev]
+    if existing and not update:
+        last_updated = existing[0]['dc']['dates'][-1]['date']
+        dt = datetime.datetime.strptime(last_updated, '%Y-%m-%dT%H:%M:%S.%fZ')
+        click.echo('Existing record found for {}, specify -u to update.\n'
+                   'Last updated: {: %A, %b %d, %Y}'
+                   ''.format(filename, dt))
+        return []
+
+    if dry_run:
+        click.echo('Success! (Dry Run -- No changes made.)')
+        for t in locations:
+            prev_metadata, new_metadata = prev_records[t], records[t]
+            if both_indexes:
+                click.secho('{} index:'.format(get_index_name(t).title()),
+                            bold=True)
+            click.echo('Pre-existing record: {}'.format(
+                'yes' if prev_metadata else 'no'))
+            click.echo('Version: {}'.format(new_metadata['dc']['version']))
+            click.echo('Search Subject: {}\nURL: {}'.format(
+                gmetas[t]['ingest_data']['gmeta'][0]['subject'],
+                new_metadata['files'][0]['url']
+            ))
+            if verbose and prev_metadata:
+                click.echo('Changes to the search record:')
+                click.echo(format_diff(diff(prev_metadata, new_metadata)) or
+                           'None')
+            elif verbose:
+                click.echo('Ingesting the following data:')
+                click.echo(json.dumps(new_metadata, indent=2))
+        return []
+
+    if changed:
+        for t in changed:
+            if not scrapes[t][1]:
+                continue
+            # Stored first, so the record never points to a missing table
+            response = pc.upload_field_table(scrapes[t][1], filename,
+                                             destination, t)
+            if response.status_code != 200:
+                click.secho('Failed to store the field table, status code: '
+                            '{}'.format(response.status_code), fg='red')
+                return []
+        click.echo('Ingesting record into search...')
+        if both_indexes:
+            for t in locations:
+                if t not in changed:
+                    click.echo('The {} index is already up to date'.format(
+                        get_index_name(t)))
+            ingest_both_indexes(pc, {t: gmetas[t] for t in changed})
+        else:
+            pc.ingest_entry(gmetas[test], test)
+        click.echo('Success!')
+
+    # The local manifest was already computed for the search record. If it
+    # matches the previous record and the remote listing agrees on the size,
+    # the file on the endpoint is identical and does not need to be moved.
+    to_move = [t for t in locations if not (
+        prev_records[t] and remote_matches[t] and not files_modified(
+            records[t]['files'], prev_records[t]['files']))]
+    if not to_move:
+        click.echo('Metadata updated, dataframe is already up to date.')
+    return to_move
+
+
+@click.command(help='Upload dataframes to a location on Globus and categorize '
+                    'them in search. Usage: DATAFRAME... DESTINATION')
+@click.argument('paths', nargs=-1, required=True, type=click.Path())
 @click.option('-j', '--json', 'metadata', type=click.Path(),
               help='Metadata in JSON format')
 @click.option('-u', '--update/--no-update', default=False,
@@ -24,19 +203,48 @@ from jsonschema.exceptions import ValidationError
 @click.option('--gcp/--no-gcp', default=True,
               help='Use Globus Connect Personal to start a transfer instead '
                    'of uploading using direct HTTP')
+@click.option('--sync-level', type=click.Choice(SYNC_LEVELS),
+              default=DEFAULT_SYNC_LEVEL,
+              help='How Globus decides a file on the endpoint is already up '
+                   'to date. "size" and "mtime" avoid checksumming whole '
+                   'files.')
+@click.option('--max-transfer-items', type=int,
+              default=DEFAULT_MAX_TRANSFER_ITEMS,
+              help='Max number of files to include in one transfer task')
 @click.option('--test', is_flag=True, default=False,
               help='upload/ingest to test locations')
+@click.option('--both-indexes', is_flag=True, default=False,
+              help='Upload to both the test and production locations, and '
+                   'ingest a record for each into its search index at once. '
+                   'The dataframe is only analyzed once.')
 @click.option('--dry-run', is_flag=True, default=False,
               help='Do checks and validation but do not upload/ingest. ')
 @click.option('--verbose', is_flag=True, default=False)
+@click.option('--block-hashes', 'block_size', flag_value=BLOCK_SIZE,
+              default=None,
+              help='Also record a hash of each {}MB block of the file, so '
+                   'downloads can find and re-fetch only corrupt parts of '
+                   'it'.format(BLOCK_SIZE // 2 ** 20))
 @click.option('--no-analyze', is_flag=True, default=False,
               help='Analyze the field to collect additional metadata.')
+@click.option('--references', 'reference_dir',
+              type=click.Path(exists=True, file_okay=False),
+              envvar=REFERENCE_DIR_ENV,
+              help='Local directory of reference tables to check foreign '
+                   'keys against, laid out like the Pilot endpoint. By '
+                   'default they are fetched from the endpoint when changed.')
+@click.option('--analyze', 'sample_size', default='full',
+              callback=parse_analyze_mode,
+              help='"full" to analyze every row, "none" to skip analysis, or '
+                   '"sample:N" to quickly estimate field metadata from N '
+                   'randomly sampled rows.')
 # @click.option('--x-labels', type=click.Path(),
 #               help='Path to x label file')
 # @click.option('--y-labels', type=click.Path(),
 #               help='Path to y label file')
-def upload(dataframe, destination, metadata, gcp, update, test, dry_run,
-           verbose, no_analyze):
+def upload(paths, metadata, gcp, sync_level, max_transfer_items, update, test,
+           both_indexes, dry_run, verbose, block_size, no_analyze,
+           reference_dir, sample_size):
     """
     Create a search entry and upload this file to the GCS Endpoint.
 
@@ -47,6 +255,22 @@ def upload(dataframe, destination, metadata, gcp, update, test, dry_run,
         click.echo('You are not logged in.')
         return
 
+    if len(paths) == 1:
+        dataframes, destination = paths, None
+    else:
+        dataframes, destination = paths[:-1], paths[-1]
+        if os.path.isfile(destination):
+            click.secho('Destination "{}" is a local file. The last argument '
+                        'must be the directory to upload to.'.format(
+                            destination), err=True, bg='red')
+            return 1
+    for dataframe in dataframes:
+        if not os.path.isfile(dataframe):
+            click.secho('Dataframe "{}" does not exist.'.format(dataframe),
+                        err=True, bg='red')
+            return 1
+    dataframes = [os.path.abspath(df) for df in dataframes]
+
     if test:
         click.secho('Using test location: {}'.format(pc.TESTING_DIR),
                     fg='yellow')
@@ -59,17 +283,25 @@ def upload(dataframe, destination, metadata, gcp, update, test, dry_run,
                    'directory "{}":\n{}'.format(path, '\t '.join(dirs)))
         return
 
-    try:
-        pc.ls(dataframe, destination, test)
-    except globus_sdk.exc.TransferAPIError as tapie:
-        if tapie.code == 'ClientError.NotFound':
-            url = pc.get_globus_app_url('', test)
-            click.secho('Directory does not exist: "{}"\nPlease create it at: '
-                        '{}'.format(destination, url), err=True, bg='red')
-            return 1
-        else:
-            click.secho(tapie.message, err=True, bg='red')
-            return 1
+    locations = [test, not test] if both_indexes else [test]
+    for location in locations:
+        try:
+            if len(dataframes) > 1:
+                # List the destination once, each file is then found in the
+                # cache
+                pc.ls_dir(destination, location)
+            else:
+                pc.ls('', destination, location)
+        except globus_sdk.exc.TransferAPIError as tapie:
+            if tapie.code == 'ClientError.NotFound':
+                url = pc.get_globus_app_url('', location)
+                click.secho('Directory does not exist: "{}"\nPlease create '
+                            'it at: {}'.format(destination, url), err=True,
+                            bg='red')
+                return 1
+            else:
+                click.secho(tapie.message, err=True, bg='red')
+                return 1
 
     if metadata is not None:
         with open(metadata) as mf_fh:
@@ -77,87 +309,130 @@ def upload(dataframe, destination, metadata, gcp, update, test, dry_run,
     else:
         user_metadata = {}
 
-    filename = os.path.basename(dataframe)
-    prev_metadata = pc.get_search_entry(filename, destination, test)
+    if sample_size is None:
+        no_analyze = True
+    reference_indexes = None
+    if not no_analyze:
+        foreign_keys = get_foreign_keys(test=test)
+        if reference_dir:
+            reference_indexes = load_reference_indexes(foreign_keys,
+                                                       reference_dir)
+        else:
+            reference_indexes = fetch_reference_indexes(pc, foreign_keys,
+                                                        test)
+    to_transfer = []
+    for dataframe in dataframes:
+        if len(dataframes) > 1:
+            click.secho(os.path.basename(dataframe), bold=True)
+        to_transfer.extend((dataframe, location) for location in
+                           upload_dataframe(
+                               pc, dataframe, destination, user_metadata,
+                               update, test, dry_run, verbose, no_analyze,
+                               sample_size, both_indexes, reference_indexes,
+                               block_size))
 
-    url = pc.get_globus_http_url(filename, destination, test)
-    new_metadata = scrape_metadata(dataframe, url, no_analyze, test)
+    if not to_transfer:
+        return
+    if gcp:
+        click.echo('Starting Transfer...')
+        for location in locations:
+            items = [(df, os.path.basename(df), destination)
+                     for df, loc in to_transfer if loc == location]
+            if not items:
+                continue
+            transfer_results = pc.transfer_files(
+                items, location, sync_level=sync_level,
+                max_items=max_transfer_items)
+            for transfer_result, batch in transfer_results:
+                short_path = os.path.join(destination, batch[0][1])
+                if len(batch) > 1:
+                    short_path = '{} (+{} more)'.format(short_path,
+                                                        len(batch) - 1)
+                pilot.config.config.add_transfer_log(transfer_result,
+                                                     short_path)
+                # Counted when submitted, the task may still fail
+                metrics.inc('pilot_transfer_submitted_bytes_total',
+                            sum(os.path.getsize(i[0]) for i in batch),
+                            method='gcp')
+                click.echo('{}. You can check the status below: \n'
+                           'https://app.globus.org/activity/{}/overview'
+                           ''.format(transfer_result['message'],
+                                     transfer_result['task_id']))
+        for df, location in to_transfer:
+            url = pc.get_globus_http_url(os.path.basename(df), destination,
+                                         location)
+            click.echo('URL will be: {}'.format(url))
+    else:
+        for dataframe, location in to_transfer:
+            url = pc.get_globus_http_url(os.path.basename(dataframe),
+                                         destination, location)
+            click.echo('Uploading data...')
+            response = pc.upload(dataframe, destination, location)
+            if response.status_code == 200:
+                metrics.inc('pilot_upload_bytes_total',
+                            os.path.getsize(dataframe), method='http')
+                click.echo('Upload Successful! URL is \n{}'.format(url))
+            else:
+                click.echo('Failed with status code: {}'.format(
+                    response.status_code))
 
-    try:
-        new_metadata = update_metadata(new_metadata, prev_metadata,
-                                       user_metadata)
-        subject = pc.get_subject_url(filename, destination, test)
-        gmeta = gen_gmeta(subject, pc.GROUP, new_metadata)
-    except (RequiredUploadFields, ValidationError) as e:
-        click.secho('Error Validating Metadata: {}'.format(e), fg='red')
-        return 1
 
-    if json.dumps(new_metadata) == json.dumps(prev_metadata):
-        click.secho('Files and search entry are an exact match. No update '
-                    'necessary.', fg='green')
-        return 1
+def get_block_entry(pc, fname, dirname, test):
+    """The manifest entry for a file, if its search record has block
+    hashes"""
+    record = pc.get_search_entry(fname, dirname, test) or {}
+    for entry in record.get('files') or []:
+        if entry.get('filename') == fname and entry.get('blocks'):
+            return entry
+    return None
 
-    if prev_metadata and not update:
-        last_updated = prev_metadata['dc']['dates'][-1]['date']
-        dt = datetime.datetime.strptime(last_updated, '%Y-%m-%dT%H:%M:%S.%fZ')
-        click.echo('Existing record found for {}, specify -u to update.\n'
-                   'Last updated: {: %A, %b %d, %Y}'
-                   ''.format(filename, dt))
-        return 1
 
-    if dry_run:
-        click.echo('Success! (Dry Run -- No changes made.)')
-        click.echo('Pre-existing record: {}'.format(
-            'yes' if prev_metadata else 'no'))
-        click.echo('Version: {}'.format(new_metadata['dc']['version']))
-        click.echo('Search Subject: {}\nURL: {}'.format(
-            subject, url
-        ))
-        if verbose:
-            click.echo('Ingesting the following data:')
-            click.echo(json.dumps(new_metadata, indent=2))
-        return
+def fetch_blocks(url, filename, blocks, headers,
+                 workers=DEFAULT_MAX_WORKERS):
+    """
+    Download byte ranges of a file straight into place in a local copy,
+    several at once.
+    :param blocks: list of (offset, size)
+    """
+    def fetch(block):
+        offset, size = block
+        byte_range = 'bytes={}-{}'.format(offset, offset + size - 1)
+        response = requests.get(url, headers=dict(headers, Range=byte_range))
+        response.raise_for_status()
+        if response.status_code != 206 or len(response.content) != size:
+            raise click.ClickException('Server did not return {} of {}'
+                                       ''.format(byte_range, url))
+        with open(filename, 'r+b') as fh:
+            fh.seek(offset)
+            fh.write(response.content)
+        metrics.inc('pilot_download_bytes_total', size)
 
-    click.echo('Ingesting record into search...')
-    pc.ingest_entry(gmeta, test)
-    click.echo('Success!')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fetch, blocks))
 
-    if prev_metadata and not files_modified(new_metadata['files'],
-                                            prev_metadata['files']):
-        click.echo('Metadata updated, dataframe is already up to date.')
-        return
-    if gcp:
-        local_ep = globus_sdk.LocalGlobusConnectPersonal().endpoint_id
-        if not local_ep:
-            raise Exception('No local GCP client found')
-        auth = pc.get_authorizers()['transfer.api.globus.org']
-        tc = globus_sdk.TransferClient(authorizer=auth)
-        tdata = globus_sdk.TransferData(
-            tc, local_ep, pc.ENDPOINT,
-            label='{} Transfer'.format(pc.APP_NAME),
-            notify_on_succeeded=False,
-            sync_level='checksum',
-            encrypt_data=True)
-        path = pc.get_path(filename, destination, test)
-        tdata.add_item(dataframe, path)
-        click.echo('Starting Transfer...')
-        transfer_result = tc.submit_transfer(tdata)
-        short_path = os.path.join(destination, filename)
-        pilot.config.config.add_transfer_log(transfer_result, short_path)
-        click.echo('{}. You can check the status below: \n'
-                   'https://app.globus.org/activity/{}/overview\n'
-                   'URL will be: {}'.format(
-                        transfer_result['message'], transfer_result['task_id'],
-                        url)
-                   )
-    else:
-        click.echo('Uploading data...')
-        response = pc.upload(dataframe, destination, test)
-        if response.status_code == 200:
-            click.echo('Upload Successful! URL is \n{}'.format(url))
-        else:
-            click.echo('Failed with status code: {}'.format(
-                response.status_code))
+
+def repair_download(url, filename, entry, headers):
+    """
+    Check a local copy of a file against the block hashes in its manifest
+    entry, and re-fetch only the blocks which don't match.
+    :return: tuple of (blocks re-fetched, total blocks)
+    """
+    blocks = entry['blocks']
+    if get_merkle_root(blocks['sha256']) != blocks['merkle_root']:
+        raise click.ClickException('Block hashes recorded for {} do not '
+                                   'match their Merkle root'.format(filename))
+    # Missing or extra bytes at the end then show up as bad blocks
+    open(filename, 'ab').close()
+    os.truncate(filename, entry['length'])
+    bad = find_bad_blocks(filename, blocks, entry['length'])
+    fetch_blocks(url, filename, bad, headers)
+    still_bad = [b for b in bad if hash_block(filename, *b) !=
+                 blocks['sha256'][b[0] // blocks['size']]]
+    if still_bad:
+        raise click.ClickException('{} blocks of {} are still corrupt after '
+                                   'fetching them again'.format(
+                                       len(still_bad), filename))
+    return len(bad), len(blocks['sha256'])
 
 
 @click.command(help='Download a file to your local directory.')
@@ -167,7 +442,11 @@ def upload(dataframe, destination, metadata, gcp, update, test, dry_run,
 @click.option('--overwrite/--no-overwrite', default=True)
 @click.option('--range', help='Download only part of a file. '
                               'Ex: bytes=0-1, 4-5')
-def download(path, test, overwrite, range):
+@click.option('--repair', is_flag=True, default=False,
+              help='Check a file already downloaded against the block hashes '
+                   'in its search record, and fetch only the blocks which '
+                   'are corrupt or missing')
+def download(path, test, overwrite, range, repair):
     pc = pilot.commands.get_pilot_client()
     if not pc.is_logged_in():
         click.echo('You are not logged in.')
@@ -184,7 +463,7 @@ def download(path, test, overwrite, range):
         headers['Range'] = range
 
     fname, dirname = os.path.basename(path), os.path.dirname(path)
-    if os.path.exists(fname) and not overwrite:
+    if os.path.exists(fname) and not overwrite and not repair:
         click.echo('Aborted! File {} would be overwritten.'.format(fname))
         return
     try:
@@ -192,12 +471,23 @@ def download(path, test, overwrite, range):
             click.echo('File "{}" does not exist.'.format(path))
             return 1
         url = pc.get_globus_http_url(fname, dirname, test)
+        entry = None if range else get_block_entry(pc, fname, dirname, test)
+        if repair and entry and os.path.exists(fname):
+            fetched, total = repair_download(url, fname, entry, headers)
+            click.echo('Fetched {} of {} blocks. Saved {}'.format(
+                fetched, total, fname))
+            return
+        elif repair and not entry:
+            click.echo('No block hashes to check {} against, downloading '
+                       'the whole file.'.format(fname))
         response = requests.get(url, headers=headers, stream=True)
         with open(fname, 'wb') as fh:
             if range:
                 r_content = decoder.MultipartDecoder.from_response(response)
                 for part in r_content.parts:
                     fh.write(part.content)
+                    metrics.inc('pilot_download_bytes_total',
+                                len(part.content))
             else:
                 # Download content in 1MB chunks
                 r_content = response.iter_content(chunk_size=2048)
@@ -206,7 +496,13 @@ def download(path, test, overwrite, range):
                                        show_pos=True) as rc:
                     for chunk in rc:
                         fh.write(chunk)
+                        metrics.inc('pilot_download_bytes_total', len(chunk))
 
+        if entry:
+            fetched, total = repair_download(url, fname, entry, headers)
+            click.echo('Verified {} blocks{}'.format(total, (
+                ', fetched {} corrupt blocks again'.format(fetched)
+                if fetched else '')))
         click.echo('Saved {}'.format(fname))
     except globus_sdk.exc.TransferAPIError:
         click.echo('Directory "{}" does not exist.'.format(dirname))
@@ -0,0 +1,139 @@
+import os
+import json
+import click
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import pilot
+from pilot.batch import DEFAULT_MAX_WORKERS
+
+# Manifest hash fields mapped to Globus checksum algorithm names, in order of
+# preference.
+CHECKSUM_ALGORITHMS = [('sha256', 'SHA256'), ('md5', 'MD5')]
+
+
+def iter_manifest_files(pc, records, test):
+    """
+    Yield (subject, directory, manifest entry) for each file in the 'files'
+    manifest of every search record. Directory is relative to the Pilot base
+    directory, and is None if the file is stored somewhere else. Records
+    without any files yield a manifest entry of None.
+    """
+    base = pc.get_path('', '', test)
+    for record in records:
+        content = pc.get_metadata_content(record['content']) or {}
+        files = content.get('files') or [None]
+        for entry in files:
+            directory = None
+            if entry is not None:
+                path = urlparse(entry.get('url', '')).path
+                if path.startswith(base):
+                    directory = os.path.dirname(path[len(base):])
+            yield record['subject'], directory, entry
+
+
+def get_remote_filename(entry):
+    """The name of a manifest file on the endpoint, taken from its url"""
+    return os.path.basename(urlparse(entry['url']).path)
+
+
+def check_file(entry, directory, listing):
+    """Compare a manifest entry to a directory listing. Returns a tuple of
+    (problem, expected, actual), or None if it matches."""
+    if entry is None:
+        return 'no_files', None, None
+    if directory is None:
+        return 'unknown_location', entry.get('url'), None
+    filename = get_remote_filename(entry)
+    remote = listing.get(filename)
+    if remote is None:
+        return 'missing', filename, None
+    if entry.get('length') is not None and remote['size'] != entry['length']:
+        return 'size_mismatch', entry['length'], remote['size']
+    return None
+
+
+def get_checksum(entry):
+    for field, algorithm in CHECKSUM_ALGORITHMS:
+        if entry.get(field):
+            return algorithm, entry[field]
+    return None
+
+
+def parse_checksum_destination(ctx, param, value):
+    if value is None:
+        return None
+    endpoint, _, path = value.partition(':')
+    if not endpoint or not path.startswith('/'):
+        raise click.BadParameter('Must be ENDPOINT_ID:/absolute/path')
+    return endpoint, path
+
+
+@click.command(help='Check that every file in search records still exists on '
+               'the endpoint with the recorded size. Problems are written as '
+               'JSON lines.')
+@click.option('--prefix', help='Only check records for dataframes under '
+              'this directory')
+@click.option('--test', is_flag=True, default=False)
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help='Write problems to a file instead of stdout')
+@click.option('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+              help='Number of directories listed at once')
+@click.option('--checksum', 'checksum_dest', metavar='ENDPOINT:PATH',
+              callback=parse_checksum_destination,
+              help='Also verify recorded checksums, by checksum-syncing the '
+                   'files to a directory on another endpoint. Nothing is '
+                   'downloaded here, follow the tasks with "pilot status"')
+def verify(prefix, test, output, workers, checksum_dest):
+    pc = pilot.commands.get_pilot_client()
+    if not pc.is_logged_in():
+        click.echo('You are not logged in.')
+        return
+
+    filters = [pc.get_prefix_filter(prefix, test)] if prefix else None
+    files, listings = [], {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Start listing each directory as soon as it is first seen, while
+        # search results are still being paged in.
+        records = pc.iter_search_entries(test, filters=filters)
+        for subject, directory, entry in iter_manifest_files(pc, records,
+                                                             test):
+            files.append((subject, directory, entry))
+            if directory is not None and directory not in listings:
+                listings[directory] = executor.submit(pc.ls_dir, directory,
+                                                      test)
+
+        problems, checksums = 0, []
+        for subject, directory, entry in files:
+            try:
+                listing = (listings[directory].result()
+                           if directory is not None else {})
+                problem = check_file(entry, directory, listing)
+            except Exception as e:
+                problem = 'list_failed', directory, str(e)
+            if problem:
+                problems += 1
+                name, expected, actual = problem
+                click.echo(json.dumps({
+                    'subject': subject,
+                    'url': entry.get('url') if entry else None,
+                    'problem': name,
+                    'expected': expected,
+                    'actual': actual,
+                }), file=output)
+            elif checksum_dest and get_checksum(entry):
+                path = pc.get_path(get_remote_filename(entry), directory,
+                                   test)
+                checksums.append((path,) + get_checksum(entry))
+
+    click.secho('Checked {} files in {} directories, {} problems found'.format(
+        len(files), len(listings), problems),
+        fg='red' if problems else 'green', err=True)
+
+    if checksum_dest and checksums:
+        endpoint, path = checksum_dest
+        for result in pc.verify_checksums(checksums, endpoint, path):
+            pilot.config.config.add_transfer_log(
+                result, 'verify {}'.format(prefix or '/'))
+            click.echo('Checksum verify task submitted: {}'.format(
+                result['task_id']), err=True)
@@ -6,21 +6,64 @@ from fair_research_login import ConfigParserTokenStorage
 TRANSFER_LOG_MAX_SIZE = 2
 
 
+def parse_timestamp(value):
+    """Parse a Globus timestamp, ex: '2019-05-01T12:00:00+00:00'"""
+    # Python 3.6 strptime can't parse a colon in the UTC offset
+    if value[-3:-2] == ':':
+        value = value[:-3] + value[-2:]
+    return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+
+
 class Config(ConfigParserTokenStorage):
     CFG_FILENAME = os.path.expanduser('~/.pilot1.cfg')
     TRANSFER_LOG_FIELDS = ['dataframe', 'status', 'task_id',
                            'start_time']
+    # Fields copied from finished Globus Transfer task documents. These are
+    # stored after TRANSFER_LOG_FIELDS, and are left out of logs which
+    # don't have them yet.
+    TRANSFER_STAT_FIELDS = ['completion_time', 'bytes_transferred',
+                            'effective_bytes_per_second', 'faults', 'files',
+                            'files_transferred', 'files_skipped']
+
+    @staticmethod
+    def _timestamp(value):
+        if isinstance(value, datetime.datetime):
+            return str(int(value.timestamp()))
+        return value
+
+    def _format_log(self, log_dict):
+        log_dict = dict(log_dict)
+        for field in ['start_time', 'completion_time']:
+            log_dict[field] = self._timestamp(log_dict.get(field))
+        fields = self.TRANSFER_LOG_FIELDS
+        if any(log_dict.get(f) is not None
+               for f in self.TRANSFER_STAT_FIELDS):
+            fields = fields + self.TRANSFER_STAT_FIELDS
+        return ','.join('' if log_dict.get(f) is None else str(log_dict[f])
+                        for f in fields)
+
+    def _parse_log(self, log_id, data):
+        values = data.split(',')
+        tlog = dict(zip(self.TRANSFER_LOG_FIELDS, values))
+        tlog['id'] = int(log_id)
+        timestamp = int(tlog['start_time'])
+        tlog['start_time'] = datetime.datetime.fromtimestamp(timestamp)
+        stats = values[len(self.TRANSFER_LOG_FIELDS):]
+        for field, value in zip(self.TRANSFER_STAT_FIELDS, stats):
+            if not value:
+                continue
+            elif field == 'completion_time':
+                value = datetime.datetime.fromtimestamp(int(value))
+            else:
+                value = int(value)
+            tlog[field] = value
+        return tlog
 
     def _save_log(self, log_id, log_dict):
         cfg = self.load()
-        if isinstance(log_dict['start_time'], datetime.datetime):
-            timestamp = log_dict['start_time'].timestamp()
-            log_dict['start_time'] = str(int(timestamp))
-        field_list = [log_dict.get(f) for f in self.TRANSFER_LOG_FIELDS]
-        log_data = ','.join(field_list)
         if 'transfer_log' not in cfg:
             cfg['transfer_log'] = {}
-        cfg['transfer_log'][str(log_id)] = log_data
+        cfg['transfer_log'][str(log_id)] = self._format_log(log_dict)
         self.save(cfg)
 
     def add_transfer_log(self, transfer_result, datapath):
@@ -42,13 +85,8 @@ class Config(ConfigParserTokenStorage):
         if 'transfer_log' not in cfg:
             return []
 
-        logs = []
-        for log_id, data in cfg['transfer_log'].items():
-            tlog = dict(zip(self.TRANSFER_LOG_FIELDS, data.split(',')))
-            tlog['id'] = int(log_id)
-            timestamp = int(tlog['start_time'])
-            tlog['start_time'] = datetime.datetime.fromtimestamp(timestamp)
-            logs.append(tlog)
+        logs = [self._parse_log(log_id, data)
+                for log_id, data in cfg['transfer_log'].items()]
         logs.sort(key=lambda l: l['id'], reverse=True)
         return logs
 
@@ -58,9 +96,20 @@ class Config(ConfigParserTokenStorage):
                 return tlog
 
     def update_transfer_log(self, task_id, new_status):
-        tlog = self.get_transfer_log_by_task(task_id)
-        tlog['status'] = new_status
-        self._save_log(tlog['id'], tlog)
+        self.update_transfer_logs({task_id: {'status': new_status}})
+
+    def update_transfer_logs(self, updates):
+        """
+        Update many transfer logs with a single config write.
+        :param updates: dict of task_id to a dict of fields to set, which
+        can be any of TRANSFER_LOG_FIELDS or TRANSFER_STAT_FIELDS
+        """
+        cfg = self.load()
+        for tlog in self.get_transfer_log():
+            if tlog['task_id'] in updates:
+                tlog.update(updates[tlog['task_id']])
+                cfg['transfer_log'][str(tlog['id'])] = self._format_log(tlog)
+        self.save(cfg)
 
     def get_user_info(self):
         cfg = self.load()
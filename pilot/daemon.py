@@ -0,0 +1,150 @@
+"""
+A long lived pilot process, which keeps a logged in client, schemas, caches
+and connections warm and runs commands sent to it over a Unix socket. The
+'pilot' executable starts in this module, so forwarding a command to a
+running daemon never pays for importing pandas or the Globus SDK.
+
+Protocol: one JSON request per connection, {"argv": [...], "cwd": "..."},
+answered by one JSON response, {"output": "...", "exit_code": 0}. Each is a
+single line terminated by a newline.
+"""
+import os
+import io
+import sys
+import json
+import socket
+import traceback
+import contextlib
+import socketserver
+
+SOCKET_PATH = os.environ.get('PILOT_SOCKET',
+                             os.path.expanduser('~/.pilot1.sock'))
+# Set to run every command locally, even when a daemon is running.
+NO_DAEMON_ENV = 'PILOT_NO_DAEMON'
+# Quick, non-interactive commands which are safe to run on the daemon. The
+# daemon handles one request at a time and returns output when a command
+# ends, so long running commands such as upload always run locally.
+FORWARDED_COMMANDS = ['describe', 'list', 'status']
+# Options which make a forwarded command long running
+LOCAL_OPTIONS = {'status': ['--follow']}
+
+
+def send_request(request, socket_path=SOCKET_PATH):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as fh:
+            return json.loads(fh.readline().decode('utf-8'))
+    finally:
+        sock.close()
+
+
+def forward(argv, socket_path=SOCKET_PATH):
+    """
+    Run a command on the pilot daemon, if one is running and the command
+    can be forwarded. Output is written to stdout.
+    :return: The exit code of the command, or None if it wasn't forwarded
+    """
+    if not argv or argv[0] not in FORWARDED_COMMANDS or \
+            os.environ.get(NO_DAEMON_ENV) or not os.path.exists(socket_path):
+        return None
+    if set(argv[1:]) & set(LOCAL_OPTIONS.get(argv[0], [])):
+        return None
+    try:
+        response = send_request({'argv': argv, 'cwd': os.getcwd()},
+                                socket_path)
+    except (OSError, ValueError):
+        # Stale socket or the daemon went away, run the command locally.
+        return None
+    sys.stdout.write(response['output'])
+    sys.stdout.flush()
+    return response['exit_code']
+
+
+def run_command(cli, argv, cwd):
+    """
+    Run a click command in this process as if it were called from the
+    command line in cwd, capturing everything it prints.
+    """
+    import click
+    output = io.StringIO()
+    prev_cwd, prev_stdin = os.getcwd(), sys.stdin
+    exit_code = 0
+    try:
+        os.chdir(cwd)
+        sys.stdin = io.StringIO('')
+        with contextlib.redirect_stdout(output), \
+                contextlib.redirect_stderr(output):
+            try:
+                cli.main(args=argv, prog_name='pilot', standalone_mode=False)
+            except click.exceptions.Exit as e:
+                exit_code = e.exit_code
+            except click.ClickException as ce:
+                ce.show()
+                exit_code = ce.exit_code
+            except click.exceptions.Abort:
+                click.echo('Aborted!', err=True)
+                exit_code = 1
+            except SystemExit as se:
+                exit_code = se.code if isinstance(se.code, int) else 1
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+    finally:
+        os.chdir(prev_cwd)
+        sys.stdin = prev_stdin
+        # Export after each command, the daemon itself rarely exits
+        from pilot import metrics
+        metrics.flush()
+    return {'output': output.getvalue(), 'exit_code': exit_code}
+
+
+class PilotRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            response = run_command(self.server.cli, request['argv'],
+                                   request['cwd'])
+        except (ValueError, KeyError, OSError) as e:
+            response = {'output': 'Bad request: {}\n'.format(e),
+                        'exit_code': 2}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class PilotServer(socketserver.UnixStreamServer):
+    """Handles one request at a time, since commands share the process's
+    working directory and standard streams."""
+
+    def __init__(self, socket_path, cli):
+        self.cli = cli
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        # Only the current user may connect, since commands run with their
+        # Globus tokens.
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, PilotRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+
+def serve(socket_path=SOCKET_PATH):
+    # Importing the commands loads everything they need once, up front.
+    from pilot.commands.main import cli
+    server = PilotServer(socket_path, cli)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def main():
+    exit_code = forward(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+    from pilot.commands.main import cli
+    cli()
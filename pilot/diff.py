@@ -0,0 +1,89 @@
+"""
+Compare search records without serializing or copying them whole.
+"""
+import json
+import hashlib
+
+# Records store a hash of the rest of their content under this key
+CONTENT_HASH_KEY = 'content_hash'
+
+ADDED, REMOVED, CHANGED = '+', '-', '~'
+
+
+def canonical_hash(record):
+    """
+    Return a sha256 of a record's canonical JSON: sorted keys, compact
+    separators, and excluding any stored CONTENT_HASH_KEY. Records with the
+    same content always hash the same, regardless of key order.
+    """
+    content = {k: v for k, v in record.items() if k != CONTENT_HASH_KEY}
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'),
+                           ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def get_content_hash(record):
+    """Return the stored hash for a record, or compute it for records
+    ingested before hashes were stored. None if there is no record."""
+    if not record:
+        return None
+    return record.get(CONTENT_HASH_KEY) or canonical_hash(record)
+
+
+def diff(old, new, path=''):
+    """
+    Compute the minimal set of changed paths between two JSON documents.
+    Subtrees shared by both documents (the same object) are skipped
+    without being compared.
+    :return: list of (op, path, old_value, new_value) tuples, where op is
+    one of ADDED, REMOVED or CHANGED and path looks like 'dc.dates[1].date'
+    """
+    if old is new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in old:
+            sub_path = '{}.{}'.format(path, key) if path else str(key)
+            if key not in new:
+                changes.append((REMOVED, sub_path, old[key], None))
+            else:
+                changes.extend(diff(old[key], new[key], sub_path))
+        for key in new:
+            if key not in old:
+                sub_path = '{}.{}'.format(path, key) if path else str(key)
+                changes.append((ADDED, sub_path, None, new[key]))
+        return changes
+    if isinstance(old, list) and isinstance(new, list):
+        changes = []
+        for idx in range(max(len(old), len(new))):
+            sub_path = '{}[{}]'.format(path, idx)
+            if idx >= len(new):
+                changes.append((REMOVED, sub_path, old[idx], None))
+            elif idx >= len(old):
+                changes.append((ADDED, sub_path, None, new[idx]))
+            else:
+                changes.extend(diff(old[idx], new[idx], sub_path))
+        return changes
+    if old == new and type(old) is type(new):
+        return []
+    return [(CHANGED, path, old, new)]
+
+
+def format_diff(changes, max_value_length=80):
+    """Format changes from diff() as one line per change"""
+    def fmt(value):
+        text = json.dumps(value, sort_keys=True)
+        if len(text) > max_value_length:
+            text = text[:max_value_length - 3] + '...'
+        return text
+
+    lines = []
+    for op, path, old, new in changes:
+        if op == ADDED:
+            lines.append('{} {}: {}'.format(op, path, fmt(new)))
+        elif op == REMOVED:
+            lines.append('{} {}: {}'.format(op, path, fmt(old)))
+        else:
+            lines.append('{} {}: {} -> {}'.format(op, path, fmt(old),
+                                                  fmt(new)))
+    return '\n'.join(lines)
@@ -15,3 +15,8 @@ class RequiredUploadFields(PilotClientException):
         example = {f: '<VALUE>' for f in self.fields}
         return ('{}. Please provide minimum fields with the -j flag. Example:'
                 '\n {}'.format(self.message, json.dumps(example, indent=4)))
+
+
+class CircuitOpenError(PilotClientException):
+    """Raised instead of making a request while a service keeps failing"""
+    pass
@@ -0,0 +1,185 @@
+"""
+Bulk import of a catalog of dataframes already stored on the Pilot endpoint.
+The catalog is a tab separated metadata sheet with one row per dataframe,
+plus optional text files with one '<location> <value>' line per dataframe
+for checksums, sizes and shapes. Locations are paths relative to the Pilot
+base directory, ex: 'my_folder/foo.tsv'.
+"""
+import os
+import csv
+import json
+import datetime
+import mimetypes
+
+from pilot.search import DEFAULT_PUBLISHER
+from pilot.diff import CONTENT_HASH_KEY, canonical_hash
+from pilot.validation import get_validator
+
+# Record field name -> metadata sheet column
+SHEET_COLUMNS = {
+    'location': 'LOCATION',
+    'title': 'TITLE',
+    'filename': 'NAME',
+    'description': 'DESCRIPTION',
+    'data_type': 'DATA TYPE',
+    'dataframe_type': 'DATA FRAME TYPE',
+    'source': 'SOURCE',
+}
+# Record field name -> value file in the catalog directory
+VALUE_FILES = {
+    'md5': 'md5.txt',
+    'sha256': 'sha256.txt',
+    'length': 'sizes.txt',
+    'numrows': 'rows.txt',
+    'numcols': 'cols.txt',
+}
+INTEGER_FIELDS = ['length', 'numrows', 'numcols']
+DEFAULT_MIMETYPE = 'text/tab-separated-values'
+# Globus Search rejects ingest documents over 10MB, leave plenty of headroom
+DEFAULT_BATCH_BYTES = 4 * 2 ** 20
+CHECKPOINT_SUFFIX = '.import-progress'
+
+
+def read_value_file(filename):
+    """Read a file of '<location> <value>' lines into a dict"""
+    values = {}
+    with open(filename) as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) >= 2:
+                values[parts[0]] = parts[-1]
+    return values
+
+
+def read_value_files(catalog_dir, value_files=VALUE_FILES):
+    """
+    Read every value file present in catalog_dir. These hold one short value
+    per dataframe, so they are indexed by location while the (much larger)
+    metadata sheet is streamed against them.
+    :return: dict of field name to a dict of location to value
+    """
+    values = {}
+    for field, fname in value_files.items():
+        path = os.path.join(catalog_dir, fname)
+        if os.path.exists(path):
+            values[field] = read_value_file(path)
+    return values
+
+
+def iter_sheet(filename):
+    """Yield each row of a metadata sheet, keyed by SHEET_COLUMNS fields"""
+    with open(filename, newline='') as fh:
+        for row in csv.DictReader(fh, dialect='excel-tab'):
+            yield {field: (row.get(column) or '').strip()
+                   for field, column in SHEET_COLUMNS.items()}
+
+
+def gen_record(row, values, url, creator):
+    """
+    Build a search record for one metadata sheet row
+    :param row: A row from iter_sheet()
+    :param values: Value file contents, from read_value_files()
+    :param url: The url of the dataframe on the Pilot endpoint
+    :param creator: Datacite creator name for the record
+    """
+    location = row['location']
+    extra = {field: vals[location] for field, vals in values.items()
+             if location in vals}
+    for field in INTEGER_FIELDS:
+        if field in extra:
+            extra[field] = int(extra[field])
+    filename = row['filename'] or os.path.basename(location)
+    mimetype = mimetypes.guess_type(filename)[0] or DEFAULT_MIMETYPE
+
+    rfm = {'filename': filename, 'url': url, 'mime_type': mimetype,
+           'data_type': row['data_type']}
+    rfm.update({f: extra[f] for f in ['md5', 'sha256', 'length']
+                if f in extra})
+    ncipilot = {'data_type': row['data_type'],
+                'dataframe_type': row['dataframe_type']}
+    sources = [s.strip() for s in row['source'].split(',') if s.strip()]
+    if sources:
+        ncipilot['source'] = sources
+    record = {
+        'dc': {
+            'titles': [{'title': row['title'] or filename}],
+            'creators': [{'creatorName': creator}],
+            'publicationYear': str(datetime.datetime.now().year),
+            'publisher': DEFAULT_PUBLISHER,
+            'resourceType': {
+                'resourceType': 'Dataset',
+                'resourceTypeGeneral': 'Dataset'
+            },
+            'formats': [mimetype],
+            'version': '1'
+        },
+        'files': [rfm],
+        'ncipilot': ncipilot,
+    }
+    if row['description']:
+        record['dc']['descriptions'] = [{'description': row['description'],
+                                         'descriptionType': 'Other'}]
+    field_metadata = {f: extra[f] for f in ['numrows', 'numcols']
+                      if f in extra}
+    if field_metadata:
+        record['field_metadata'] = field_metadata
+    record[CONTENT_HASH_KEY] = canonical_hash(record)
+    return record
+
+
+def validate_record(record):
+    """Validate a record against the dataset schema. field_metadata is
+    generated by pilot and not covered by the schema."""
+    dataset = {k: v for k, v in record.items() if k != 'field_metadata'}
+    get_validator('dataset').validate(dataset)
+
+
+def iter_batches(entries, max_bytes=DEFAULT_BATCH_BYTES):
+    """
+    Group (location, gmeta_entry) pairs into lists, keeping the serialized
+    size of each list under max_bytes. An entry larger than max_bytes is
+    put in a batch of its own.
+    """
+    batch, size = [], 0
+    for location, entry in entries:
+        entry_size = len(json.dumps(entry))
+        if batch and size + entry_size > max_bytes:
+            yield batch
+            batch, size = [], 0
+        batch.append((location, entry))
+        size += entry_size
+    if batch:
+        yield batch
+
+
+class Checkpoint(object):
+    """
+    Locations which have been imported, so an interrupted import can resume.
+    Locations are appended to the checkpoint file after each successful
+    batch.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.done = set()
+        if os.path.exists(filename):
+            with open(filename) as fh:
+                self.done = {line.strip() for line in fh if line.strip()}
+
+    def __contains__(self, location):
+        return location in self.done
+
+    def __len__(self):
+        return len(self.done)
+
+    def add(self, locations):
+        with open(self.filename, 'a') as fh:
+            fh.writelines('{}\n'.format(loc) for loc in locations)
+            fh.flush()
+            os.fsync(fh.fileno())
+        self.done.update(locations)
+
+    def clear(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.done = set()
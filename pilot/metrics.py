@@ -0,0 +1,189 @@
+"""
+Counters and histograms for pilot operations, exported in the Prometheus
+text format. Metrics are always recorded in memory, but only exported if one
+of these environment variables is set:
+
+PILOT_METRICS_FILE: Path for a node_exporter textfile collector, ex:
+    /var/lib/node_exporter/textfile_collector/pilot.prom
+PILOT_METRICS_PUSHGATEWAY: URL to PUT metrics to, ex:
+    http://localhost:9091/metrics/job/pilot
+"""
+import os
+import sys
+import time
+import atexit
+import threading
+import contextlib
+import requests
+
+METRICS_FILE_ENV = 'PILOT_METRICS_FILE'
+METRICS_PUSHGATEWAY_ENV = 'PILOT_METRICS_PUSHGATEWAY'
+
+INF = float('inf')
+SECONDS_BUCKETS = (.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300, INF)
+MB_PER_SECOND_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, INF)
+ROWS_PER_SECOND_BUCKETS = (1e2, 1e3, 1e4, 1e5, 1e6, 1e7, INF)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'pilot_hash_bytes_total': (
+        'counter', 'Bytes read to compute file checksums', None),
+    'pilot_hash_mb_per_second': (
+        'histogram', 'Checksum throughput per file in MB/s',
+        MB_PER_SECOND_BUCKETS),
+    'pilot_analysis_rows_total': (
+        'counter', 'Dataframe rows analyzed', None),
+    'pilot_analysis_rows_per_second': (
+        'histogram', 'Analysis throughput per dataframe in rows/s',
+        ROWS_PER_SECOND_BUCKETS),
+    'pilot_ingest_seconds': (
+        'histogram', 'Time to ingest a search document, until its task '
+        'finishes', SECONDS_BUCKETS),
+    'pilot_task_wait_seconds': (
+        'histogram', 'Time spent waiting on search tasks', SECONDS_BUCKETS),
+    'pilot_transfer_submit_seconds': (
+        'histogram', 'Time to submit a Globus Transfer task', SECONDS_BUCKETS),
+    'pilot_upload_bytes_total': (
+        'counter', 'Bytes of dataframes uploaded over HTTP', None),
+    'pilot_transfer_submitted_bytes_total': (
+        'counter', 'Bytes of dataframes submitted in Globus Transfer tasks, '
+        'whether or not the tasks later succeed', None),
+    'pilot_download_bytes_total': (
+        'counter', 'Bytes of dataframes downloaded', None),
+    'pilot_api_requests_total': (
+        'counter', 'Globus API calls by operation and outcome', None),
+}
+
+
+class Registry(object):
+    """Thread-safe store of metric values, keyed by name and labels"""
+
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self.metrics[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.setdefault(
+                key, {'buckets': [0] * len(buckets), 'sum': 0, 'count': 0})
+            for idx, bound in enumerate(buckets):
+                if value <= bound:
+                    hist['buckets'][idx] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.counters, self.histograms = {}, {}
+
+    def render(self):
+        """Render all recorded metrics in the Prometheus text format"""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {k: dict(v, buckets=list(v['buckets']))
+                          for k, v in self.histograms.items()}
+        lines = []
+        for name, (mtype, help_text, buckets) in sorted(self.metrics.items()):
+            values = counters if mtype == 'counter' else histograms
+            keys = sorted(k for k in values if k[0] == name)
+            if not keys:
+                continue
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, mtype))
+            for key in keys:
+                labels = key[1]
+                if mtype == 'counter':
+                    lines.append(format_sample(name, labels, values[key]))
+                    continue
+                hist = values[key]
+                for bound, count in zip(buckets, hist['buckets']):
+                    le = '+Inf' if bound == INF else repr(float(bound))
+                    lines.append(format_sample(name + '_bucket',
+                                               labels + (('le', le),), count))
+                lines.append(format_sample(name + '_sum', labels,
+                                           hist['sum']))
+                lines.append(format_sample(name + '_count', labels,
+                                           hist['count']))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def format_sample(name, labels, value):
+    if labels:
+        label_text = ','.join('{}="{}"'.format(
+            k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+            for k, v in labels)
+        name = '{}{{{}}}'.format(name, label_text)
+    return '{} {}'.format(name, value)
+
+
+registry = Registry()
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+def observe_rate(name, amount, seconds, **labels):
+    """Observe amount per second, ignoring operations too fast to time"""
+    if seconds > 0:
+        registry.observe(name, amount / seconds, **labels)
+
+
+@contextlib.contextmanager
+def timed(name, **labels):
+    """Observe the seconds taken by the with block in histogram name"""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.monotonic() - start, **labels)
+
+
+def write_textfile(path, text):
+    # Write then rename, so the collector never reads a partial file
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as fh:
+        fh.write(text)
+    os.replace(tmp_path, path)
+
+
+def flush():
+    """Export metrics to any configured destination. Failures are reported
+    but never raised, so metrics can't break the job being measured."""
+    path = os.environ.get(METRICS_FILE_ENV)
+    url = os.environ.get(METRICS_PUSHGATEWAY_ENV)
+    if not path and not url:
+        return
+    text = registry.render()
+    try:
+        if path:
+            write_textfile(path, text)
+        if url:
+            requests.put(url, data=text.encode('utf-8'), timeout=10,
+                         headers={'Content-Type': 'text/plain; version=0.0.4'}
+                         ).raise_for_status()
+    except (OSError, requests.exceptions.RequestException) as e:
+        sys.stderr.write('Unable to export metrics: {}\n'.format(e))
+
+
+_flush_registered = False
+
+
+def flush_at_exit():
+    global _flush_registered
+    if not _flush_registered:
+        atexit.register(flush)
+        _flush_registered = True
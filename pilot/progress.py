@@ -0,0 +1,170 @@
+"""
+Follow running Globus Transfer tasks. Each poll costs one task_list call for
+all tasks, and event lists are only fetched for tasks whose counters changed,
+starting from the newest event and stopping at the last one already seen.
+Polling slows down while nothing changes, so following stalled or long
+transfers for hours stays cheap.
+"""
+import time
+
+from pilot.config import parse_timestamp
+
+FINISHED_TASK_STATES = ['SUCCEEDED', 'FAILED']
+# Seconds between polls, grows by POLL_BACKOFF while tasks make no progress
+MIN_POLL_INTERVAL = 2
+MAX_POLL_INTERVAL = 60
+POLL_BACKOFF = 1.5
+EVENT_PAGE_SIZE = 10
+# Stop paging back through events after this many in a single poll
+MAX_EVENTS_PER_POLL = 100
+# Weight of the latest sample in the smoothed transfer rate
+RATE_SMOOTHING = 0.3
+# Task counters which show a task made progress
+PROGRESS_FIELDS = ['status', 'bytes_transferred', 'files_transferred',
+                   'files_skipped', 'faults', 'subtasks_pending']
+
+
+def get_event_key(event):
+    return event.get('time'), event.get('code'), event.get('details')
+
+
+def task_event_page(tc, task_id, offset, limit=EVENT_PAGE_SIZE):
+    """Fetch one page of task events, newest first"""
+    response = tc.get('task/{}/event_list'.format(task_id),
+                      params={'offset': offset, 'limit': limit})
+    return response['DATA']
+
+
+def fetch_new_events(pc, task_id, seen):
+    """
+    Fetch events newer than any seen before, paging back from the newest
+    event until a seen event is found.
+    :param seen: set of event keys already seen. Updated in place.
+    :return: list of new events, oldest first
+    """
+    new_events, offset = [], 0
+    while offset < MAX_EVENTS_PER_POLL:
+        page = pc.call_api(task_event_page, pc.gtransfer, task_id, offset)
+        for event in page:
+            if get_event_key(event) in seen:
+                return list(reversed(new_events))
+            seen.add(get_event_key(event))
+            new_events.append(event)
+        if len(page) < EVENT_PAGE_SIZE:
+            break
+        offset += len(page)
+    return list(reversed(new_events))
+
+
+def estimate_total_bytes(task):
+    """Estimate a task's total bytes from the average size of the files
+    transferred so far. None until at least one file has transferred."""
+    transferred = task.get('files_transferred') or 0
+    if not transferred:
+        return None
+    files = (task.get('files') or 0) - (task.get('files_skipped') or 0)
+    average = task.get('bytes_transferred', 0) / transferred
+    return max(int(average * files), task.get('bytes_transferred', 0))
+
+
+class TransferProgress(object):
+    """
+    Tracks the progress of several transfer tasks from successive task
+    documents, with an aggregate transfer rate and ETA.
+    """
+
+    def __init__(self, task_ids, clock=time.monotonic):
+        self.task_ids = list(task_ids)
+        self.tasks = {}
+        self.events = {tid: set() for tid in self.task_ids}
+        self.clock = clock
+        self.last_poll = None
+        self.last_bytes = 0
+        self.rate = None
+        self.interval = MIN_POLL_INTERVAL
+
+    @property
+    def finished(self):
+        return all(self.tasks.get(tid, {}).get('status') in
+                   FINISHED_TASK_STATES for tid in self.task_ids)
+
+    @property
+    def bytes_transferred(self):
+        return sum(t.get('bytes_transferred') or 0
+                   for t in self.tasks.values())
+
+    @property
+    def pending_task_ids(self):
+        return [tid for tid in self.task_ids
+                if self.tasks.get(tid, {}).get('status') not in
+                FINISHED_TASK_STATES]
+
+    def update(self, documents):
+        """
+        Record new task documents, and update the rate and poll interval.
+        :param documents: dict of task_id to task document
+        :return: list of task ids which made progress since the last update
+        """
+        now = self.clock()
+        changed = []
+        for tid, doc in documents.items():
+            prev = self.tasks.get(tid, {})
+            if any(prev.get(f) != doc.get(f) for f in PROGRESS_FIELDS):
+                changed.append(tid)
+            self.tasks[tid] = doc
+
+        total = self.bytes_transferred
+        if self.last_poll is not None and now > self.last_poll:
+            sample = (total - self.last_bytes) / (now - self.last_poll)
+            self.rate = sample if self.rate is None else (
+                RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * self.rate)
+        self.last_poll, self.last_bytes = now, total
+
+        if changed:
+            self.interval = MIN_POLL_INTERVAL
+        else:
+            self.interval = min(self.interval * POLL_BACKOFF,
+                                MAX_POLL_INTERVAL)
+        return changed
+
+    def get_eta(self):
+        """Seconds until all pending tasks finish at the current rate, or
+        None if it can't be estimated yet"""
+        remaining = 0
+        for tid in self.pending_task_ids:
+            total = estimate_total_bytes(self.tasks.get(tid, {}))
+            if total is None:
+                return None
+            remaining += total - self.tasks[tid].get('bytes_transferred', 0)
+        if not remaining:
+            return 0
+        if not self.rate or self.rate <= 0:
+            return None
+        return remaining / self.rate
+
+
+def format_bytes(num):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if abs(num) < 1000 or unit == 'TB':
+            return '{:.1f}{}'.format(num, unit)
+        num /= 1000
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '--:--'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '{}:{:02}:{:02}'.format(hours, minutes, seconds)
+    return '{:02}:{:02}'.format(minutes, seconds)
+
+
+def format_event(task_id, event):
+    when = event.get('time')
+    try:
+        when = parse_timestamp(when).astimezone().strftime('%H:%M:%S')
+    except (TypeError, ValueError):
+        pass
+    return '{} {} {}: {}'.format(when, task_id[:8], event.get('code'),
+                                 event.get('description'))
@@ -0,0 +1,281 @@
+"""
+Check foreign key columns against the reference tables named in
+foreign_keys.json. The key column of each reference table is loaded once
+into a KeyIndex, which is saved under CACHE_DIR/references as a sorted numpy
+array named by the reference file's sha256, so it is only rebuilt when the
+reference table changes.
+"""
+import os
+import hashlib
+import tempfile
+import threading
+import urllib.parse
+import numpy
+import pandas
+
+from pilot.cache import CACHE_DIR
+
+REFERENCE_DIR_ENV = 'PILOT_REFERENCE_DIR'
+INDEX_CACHE_DIR = os.path.join(CACHE_DIR, 'references')
+# Rows of a dataframe's key columns read at a time when streaming
+CHECK_CHUNK_ROWS = 2 ** 16
+# Number of unmatched values listed in each column's results
+UNMATCHED_EXAMPLES = 5
+
+_indexes = {}
+_checksums = {}
+_indexes_lock = threading.Lock()
+
+
+class KeyIndex(object):
+    """The set of keys in a reference table column, hashed for fast
+    membership checks"""
+
+    def __init__(self, keys, checksum):
+        self.keys = keys
+        self.checksum = checksum
+        self.index = pandas.Index(keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def contains(self, values):
+        """Return a boolean array, True for each value found in the index"""
+        return self.index.get_indexer(values) != -1
+
+
+class ReferenceCheck(object):
+    """Accumulates match counts for one column over any number of chunks"""
+
+    def __init__(self, key_index):
+        self.key_index = key_index
+        self.checked = 0
+        self.unmatched = 0
+        self.examples = []
+
+    def update(self, values):
+        values = values.dropna().astype(str)
+        found = self.key_index.contains(values)
+        self.checked += len(values)
+        self.unmatched += int((~found).sum())
+        if len(self.examples) < UNMATCHED_EXAMPLES:
+            for value in pandas.unique(values[~found]):
+                if value not in self.examples:
+                    self.examples.append(value)
+                if len(self.examples) >= UNMATCHED_EXAMPLES:
+                    break
+
+    def result(self):
+        return get_check_result(self.checked, self.unmatched, self.examples)
+
+
+def get_check_result(checked, unmatched, examples):
+    return {
+        'checked': checked,
+        'unmatched': unmatched,
+        'match_rate': (round(1 - unmatched / checked, 6)
+                       if checked else None),
+        'unmatched_examples': examples,
+    }
+
+
+def merge_reference_results(a, b):
+    """Combine the results of checking two sets of rows of a column"""
+    examples = a['unmatched_examples'] + [
+        e for e in b['unmatched_examples']
+        if e not in a['unmatched_examples']]
+    return get_check_result(a['checked'] + b['checked'],
+                            a['unmatched'] + b['unmatched'],
+                            examples[:UNMATCHED_EXAMPLES])
+
+
+def file_checksum(filename, block_size=2 ** 20):
+    """sha256 of a file, remembered until the file is modified"""
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    with _indexes_lock:
+        if key in _checksums:
+            return _checksums[key]
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            sha.update(block)
+    with _indexes_lock:
+        _checksums[key] = sha.hexdigest()
+    return _checksums[key]
+
+
+def build_key_index(filename, field):
+    """Read the unique, sorted keys in one column of a reference table"""
+    column = pandas.read_csv(filename, sep='\t', usecols=[field],
+                             dtype=str)[field]
+    return numpy.unique(column.dropna().to_numpy(dtype=str))
+
+
+def _get_index_path(checksum, field, cache_dir):
+    field_hash = hashlib.sha1(field.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(cache_dir, '{}-{}.npy'.format(checksum, field_hash))
+
+
+def load_cached_key_index(checksum, field, cache_dir=INDEX_CACHE_DIR):
+    """Load a saved KeyIndex for a column of a reference table with this
+    sha256, or return None if there isn't one"""
+    path = _get_index_path(checksum, field, cache_dir)
+    with _indexes_lock:
+        if path in _indexes:
+            return _indexes[path]
+    try:
+        keys = numpy.load(path)
+    except (OSError, ValueError):
+        return None
+    key_index = KeyIndex(keys, checksum)
+    with _indexes_lock:
+        _indexes[path] = key_index
+    return key_index
+
+
+def load_key_index(filename, field, checksum=None,
+                   cache_dir=INDEX_CACHE_DIR):
+    """
+    Load the KeyIndex for a column of a reference table, building and saving
+    it if no index exists yet for this version of the file.
+    :param checksum: The file's sha256, if already known
+    """
+    checksum = checksum or file_checksum(filename)
+    key_index = load_cached_key_index(checksum, field, cache_dir)
+    if key_index is not None:
+        return key_index
+    keys = build_key_index(filename, field)
+    path = _get_index_path(checksum, field, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write then rename, so other processes never see partial files
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as fh:
+        numpy.save(fh, keys)
+    os.replace(tmp_path, path)
+    key_index = KeyIndex(keys, checksum)
+    with _indexes_lock:
+        _indexes[path] = key_index
+    return key_index
+
+
+def get_reference_location(reference, base_dirs):
+    """The path of a reference table relative to the Pilot base directory.
+    reference['resource'] is a search subject, see get_foreign_keys()"""
+    path = urllib.parse.urlparse(reference['resource']).path
+    for base in base_dirs:
+        if path.startswith(base.rstrip('/') + '/'):
+            return path[len(base.rstrip('/')) + 1:]
+    return path.lstrip('/')
+
+
+def load_reference_indexes(foreign_keys, reference_dir,
+                           cache_dir=INDEX_CACHE_DIR):
+    """
+    Load key indexes for foreign keys whose reference tables are stored
+    locally under reference_dir, laid out the same as on the Pilot endpoint,
+    ex: reference_dir/metadata/drugs.tsv
+    :return: dict of column name to KeyIndex
+    """
+    from pilot.client import PilotClient
+    base_dirs = [PilotClient.BASE_DIR, PilotClient.TESTING_DIR]
+    indexes = {}
+    for column, fkey in (foreign_keys or {}).items():
+        reference = fkey['reference']
+        location = get_reference_location(reference, base_dirs)
+        filename = os.path.join(reference_dir, location)
+        if os.path.exists(filename):
+            indexes[column] = load_key_index(filename, reference['fields'],
+                                             cache_dir=cache_dir)
+    return indexes
+
+
+def fetch_key_index(pc, location, field, test=False,
+                    cache_dir=INDEX_CACHE_DIR):
+    """
+    Load the KeyIndex for a reference table stored on the Pilot endpoint.
+    The sha256 in the table's search record is checked first, and the table
+    is only downloaded if no index exists yet for that checksum.
+    :return: KeyIndex, or None if the table has no record or checksum
+    """
+    record = pc.get_search_entry(os.path.basename(location),
+                                 os.path.dirname(location), test)
+    manifest = (record or {}).get('files') or [{}]
+    checksum, url = manifest[0].get('sha256'), manifest[0].get('url')
+    if not checksum or not url:
+        return None
+    cached = load_cached_key_index(checksum, field, cache_dir)
+    if cached is not None:
+        return cached
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, os.path.basename(location))
+        download_file(url, filename, pc.http_headers)
+        if file_checksum(filename) != checksum:
+            return None
+        return load_key_index(filename, field, checksum, cache_dir)
+
+
+def fetch_reference_indexes(pc, foreign_keys, test=False,
+                            cache_dir=INDEX_CACHE_DIR):
+    """
+    Load key indexes for reference tables stored on the Pilot endpoint, see
+    fetch_key_index().
+    :return: dict of column name to KeyIndex
+    """
+    base_dirs = [pc.TESTING_DIR if test else pc.BASE_DIR]
+    # Several columns may reference the same table
+    fetched, indexes = {}, {}
+    for column, fkey in (foreign_keys or {}).items():
+        reference = fkey['reference']
+        key = (get_reference_location(reference, base_dirs),
+               reference['fields'])
+        if key not in fetched:
+            fetched[key] = fetch_key_index(pc, key[0], key[1], test,
+                                           cache_dir)
+        if fetched[key] is not None:
+            indexes[column] = fetched[key]
+    return indexes
+
+
+def download_file(url, filename, headers):
+    import requests
+    with requests.get(url, headers=headers, stream=True) as response:
+        response.raise_for_status()
+        with open(filename, 'wb') as fh:
+            for chunk in response.iter_content(chunk_size=2 ** 20):
+                fh.write(chunk)
+
+
+def check_references(filename, reference_indexes, dataframe=None,
+                     chunk_rows=CHECK_CHUNK_ROWS):
+    """
+    Check the values of foreign key columns against their reference indexes.
+    String columns of an already loaded dataframe are used if given, other
+    key columns are streamed from the file. Numbers are read back as
+    strings, since their formatting in the dataframe may differ from the
+    reference table.
+    :param reference_indexes: dict of column name to KeyIndex
+    :return: dict of column name to match results
+    """
+    loaded = []
+    if dataframe is not None:
+        loaded = [c for c in reference_indexes if c in dataframe.columns and
+                  pandas.api.types.is_string_dtype(dataframe[c].dtype)]
+    results = _check_chunks([dataframe[loaded]] if loaded else [], loaded,
+                            reference_indexes)
+    header = pandas.read_csv(filename, sep='\t', nrows=0).columns
+    streamed = [c for c in reference_indexes
+                if c in header and c not in loaded]
+    if streamed:
+        chunks = pandas.read_csv(filename, sep='\t', usecols=streamed,
+                                 dtype=str, chunksize=chunk_rows)
+        results.update(_check_chunks(chunks, streamed, reference_indexes))
+    return results
+
+
+def _check_chunks(chunks, columns, reference_indexes):
+    checks = {c: ReferenceCheck(reference_indexes[c]) for c in columns}
+    for chunk in chunks:
+        for column, check in checks.items():
+            check.update(chunk[column])
+    return {column: check.result() for column, check in checks.items()}
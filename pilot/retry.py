@@ -0,0 +1,182 @@
+"""
+A request policy applied to every Globus API call pilot makes: calls are
+rate limited with a token bucket shared by all threads, retried with
+jittered exponential backoff on throttling, server and network errors, and
+stopped by a circuit breaker when a service is persistently failing. Each
+service has its own circuit breaker, so an outage of one doesn't stop calls
+to the others.
+"""
+import time
+import random
+import threading
+import collections
+import globus_sdk
+
+from pilot.batch import RateLimiter, DEFAULT_RATE_LIMIT
+from pilot.exc import CircuitOpenError
+from pilot import metrics
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+DEFAULT_MAX_RETRIES = 5
+# Seconds. Backoff doubles with each retry, up to BACKOFF_MAX
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# Short bursts above the rate limit are allowed, up to this many calls
+DEFAULT_BURST = 5
+# Consecutive failed calls before the circuit opens, and seconds it stays open
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30
+
+
+def is_retryable(error):
+    """Errors which may succeed if the call is made again"""
+    if isinstance(error, globus_sdk.exc.NetworkError):
+        return True
+    return (isinstance(error, globus_sdk.exc.GlobusAPIError) and
+            error.http_status in RETRY_STATUS_CODES)
+
+
+def is_throttled(error):
+    """Throttled requests were rejected without being processed, so even
+    non-idempotent calls are safe to retry."""
+    return (isinstance(error, globus_sdk.exc.GlobusAPIError) and
+            error.http_status == 429)
+
+
+def get_retry_after(error):
+    """Seconds the server asked us to wait, if it said"""
+    response = getattr(error, '_underlying_response', None)
+    try:
+        return float(response.headers['Retry-After'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker(object):
+    """
+    Stops calls to a failing service. After failure_threshold consecutive
+    failures the circuit opens and calls fail immediately. After
+    reset_timeout seconds a single trial call is let through, which closes
+    the circuit again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            waited = time.monotonic() - self.opened_at
+            if waited < self.reset_timeout or self.trial_running:
+                raise CircuitOpenError(
+                    'Too many failed requests, not retrying for {:.0f}s'
+                    ''.format(max(self.reset_timeout - waited, 0)))
+            self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+class RequestPolicy(object):
+    """
+    Makes API calls under a shared rate limit, retry and circuit breaker
+    policy. Counts of each call's outcomes are kept in `counters`, keyed by
+    (operation, outcome), where outcome is one of 'success', 'retry',
+    'throttled', 'error' or 'rejected'. Safe to share between threads.
+    Calls get a circuit breaker per service, unless a single breaker is given
+    for all of them.
+    """
+
+    def __init__(self, rate_limit=DEFAULT_RATE_LIMIT, burst=DEFAULT_BURST,
+                 max_retries=DEFAULT_MAX_RETRIES, breaker=None,
+                 sleep=time.sleep):
+        self.limiter = RateLimiter(rate_limit, burst) if rate_limit else None
+        self.max_retries = max_retries
+        self.breaker = breaker
+        self.breakers = {}
+        self.counters = collections.Counter()
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+    def count(self, operation, outcome):
+        with self.lock:
+            self.counters[(operation, outcome)] += 1
+        metrics.inc('pilot_api_requests_total', operation=operation,
+                    outcome=outcome)
+
+    def get_breaker(self, service):
+        if self.breaker is not None:
+            return self.breaker
+        with self.lock:
+            if service not in self.breakers:
+                self.breakers[service] = CircuitBreaker()
+            return self.breakers[service]
+
+    def get_counters(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def backoff(self, attempt, error):
+        """Full jitter backoff, unless the server said how long to wait"""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, BACKOFF_MAX)
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def call(self, func, *args, idempotent=True, service=None, **kwargs):
+        """
+        Call func(*args, **kwargs) under this policy.
+        :param idempotent: Calls which are not idempotent are only retried if
+        they were throttled, since they may have taken effect otherwise.
+        :param service: Name of the service called, which picks the circuit
+        breaker used
+        """
+        operation = getattr(func, '__name__', 'call')
+        breaker = self.get_breaker(service)
+        attempt = 0
+        while True:
+            if self.limiter:
+                self.limiter.wait()
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                self.count(operation, 'rejected')
+                raise
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    # The service answered, even if we don't like the answer
+                    breaker.record_success()
+                can_retry = retryable and (idempotent or is_throttled(e))
+                if not can_retry or attempt >= self.max_retries:
+                    self.count(operation, 'error')
+                    raise
+                self.count(operation,
+                           'throttled' if is_throttled(e) else 'retry')
+                self.sleep(self.backoff(attempt, e))
+                attempt += 1
+                continue
+            breaker.record_success()
+            self.count(operation, 'success')
+            return result
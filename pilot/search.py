@@ -1,19 +1,24 @@
 import os
 import copy
+import time
 import hashlib
 import pytz
 import datetime
 import mimetypes
 import json
+import threading
 import jsonschema
 
 from pilot.config import config
 from pilot.validation import validate_dataset, validate_user_provided_metadata
-from pilot.analysis import analyze_dataframe
+from pilot.analysis import analyze_dataframe_cached
 from pilot.exc import RequiredUploadFields
+from pilot.diff import CONTENT_HASH_KEY, canonical_hash
+from pilot.checksums import (get_checksums, get_block_manifest,
+                             DEFAULT_HASH_ALGORITHMS)
+from pilot import metrics
 import pilot
 
-DEFAULT_HASH_ALGORITHMS = ['sha256', 'md5']
 FOREIGN_KEYS_FILE = os.path.join(os.path.dirname(__file__),
                                  'foreign_keys.json')
 DEFAULT_PUBLISHER = 'Argonne National Laboratory'
@@ -23,23 +28,32 @@ MINIMUM_USER_REQUIRED_FIELDS = [
     'mime_type',
 ]
 
+GMETA_VERSION = "2016-11-09"
 GMETA_LIST = {
-    "@version": "2016-11-09",
+    "@version": GMETA_VERSION,
     "ingest_type": "GMetaList",
     "ingest_data": {
-        "@version": "2016-11-09",
+        "@version": GMETA_VERSION,
         "gmeta": []
     }
 }
 
 GMETA_ENTRY = {
-    "@version": "2016-11-09",
+    "@version": GMETA_VERSION,
     "visible_to": [],
     "content": '',
     "subject": ''
 }
 
 GROUP_URN_PREFIX = 'urn:globus:groups:id:{}'
+METADATA_ENTRY_ID = 'metadata'
+# Metadata for every field of a wide dataframe is stored in a JSON Lines file
+# next to it on the endpoint, so search records, and every search result
+# page, stay small. See pilot.analysis.dump_field_table().
+FIELD_TABLE_SUFFIX = '.fields.jsonl'
+# Records ingested by older versions kept the field table as a second entry
+# under the same subject. It is skipped when reading records.
+FIELD_TABLE_ENTRY_ID = 'field_table'
 
 # Used for user provided metadata. These fields will be stripped out and used
 # in the datacite fields.
@@ -65,7 +79,20 @@ def get_foreign_keys(filename=FOREIGN_KEYS_FILE, test=False):
     return fkeys
 
 
-def scrape_metadata(dataframe, url, skip_analysis=True, test=False):
+def get_creator_name():
+    """Return the logged in user's name formatted for a datacite creator"""
+    user_info = config.get_user_info()
+    name = user_info['name'].split(' ')
+    if len(name) > 1 and ',' not in user_info['name']:
+        # If the persons name is ['Samuel', 'L.', 'Jackson'], produces:
+        # "Jackson, Samuel L."
+        return '{}, {}'.format(name[-1:][0], ' '.join(name[:-1]))
+    return user_info['name']
+
+
+def scrape_metadata(dataframe, url, skip_analysis=True, test=False,
+                    dtypes=None, sample_size=None, reference_indexes=None,
+                    block_size=None):
     mimetype = mimetypes.guess_type(dataframe)[0]
     dc_formats = []
     rfm_metadata = {}
@@ -73,16 +100,13 @@ def scrape_metadata(dataframe, url, skip_analysis=True, test=False):
         dc_formats.append(mimetype)
         rfm_metadata['mime_type'] = mimetype
 
-    user_info = config.get_user_info()
-    name = user_info['name'].split(' ')
-    if len(name) > 1 and ',' not in user_info['name']:
-        # If the persons name is ['Samuel', 'L.', 'Jackson'], produces:
-        # "Jackson, Samuel L."
-        formal_name = '{}, {}'.format(name[-1:][0], ' '.join(name[:-1]))
-    else:
-        formal_name = user_info['name']
+    formal_name = get_creator_name()
     fkeys = get_foreign_keys(test=test)
-    metadata = analyze_dataframe(dataframe, fkeys) if not skip_analysis else {}
+    metadata = {}
+    if not skip_analysis:
+        metadata = analyze_dataframe_cached(
+            dataframe, fkeys, dtypes, sample_size,
+            reference_indexes=reference_indexes)
     return {
         'dc': {
             'titles': [
@@ -119,7 +143,8 @@ def scrape_metadata(dataframe, url, skip_analysis=True, test=False):
             'version': '1'
         },
         'files': gen_remote_file_manifest(dataframe, url,
-                                          metadata=rfm_metadata),
+                                          metadata=rfm_metadata,
+                                          block_size=block_size),
         'field_metadata': metadata,
         'ncipilot': {},
     }
@@ -185,9 +210,33 @@ def update_dc_version(metadata):
     })
 
 
+def copy_record(metadata):
+    """
+    Copy a record deep enough that update_metadata() can modify the copy
+    without changing the original. Parts it never modifies in place, such as
+    the (potentially very large) field metadata, are shared with the original.
+    """
+    record = dict(metadata)
+    if 'dc' in record:
+        record['dc'] = dict(record['dc'])
+        if 'dates' in record['dc']:
+            record['dc']['dates'] = list(record['dc']['dates'])
+    if 'files' in record:
+        record['files'] = [dict(f) for f in record['files']]
+    if 'ncipilot' in record:
+        record['ncipilot'] = dict(record['ncipilot'])
+    return record
+
+
 def update_metadata(scraped_metadata, prev_metadata, user_metadata):
+    """
+    Build the new record for a dataframe from freshly scraped metadata, the
+    previous record (if there is one) and metadata provided by the user.
+    The result includes a canonical hash of its content, see
+    pilot.diff.canonical_hash().
+    """
     if prev_metadata:
-        metadata = copy.deepcopy(prev_metadata or {})
+        metadata = copy_record(prev_metadata)
 
         files_updated = files_modified(scraped_metadata.get('files'),
                                        metadata.get('files'))
@@ -195,6 +244,9 @@ def update_metadata(scraped_metadata, prev_metadata, user_metadata):
             # If files have been modified, don't carryover metadata fields
             update_dc_version(metadata)
             metadata['files'] = scraped_metadata['files']
+            # Field stats for the old files no longer apply
+            if scraped_metadata.get('field_metadata'):
+                metadata['field_metadata'] = scraped_metadata['field_metadata']
         carryover_old_file_metadata(scraped_metadata.get('files'),
                                     prev_metadata.get('files'))
     else:
@@ -217,24 +269,155 @@ def update_metadata(scraped_metadata, prev_metadata, user_metadata):
                     metadata['ncipilot'] = {}
                 metadata['ncipilot'][field_name] = value
     metadata['ncipilot'] = metadata.get('ncipilot', {})
+    metadata[CONTENT_HASH_KEY] = canonical_hash(metadata)
     return metadata
 
 
+def pop_field_table(metadata):
+    """Remove and return the full field table from scraped metadata, or
+    None if the analysis didn't produce one."""
+    return (metadata.get('field_metadata') or {}).pop('field_table', None)
+
+
+def get_field_table_name(filename):
+    """Name of the field table file stored next to a dataframe"""
+    return filename + FIELD_TABLE_SUFFIX
+
+
 def gen_gmeta(subject, visible_to, content):
+    """
+    Generate a GMetaList for ingesting content into search.
+    """
     try:
         validate_dataset(content)
     except jsonschema.exceptions.ValidationError as ve:
         if any([m in ve.message for m in MINIMUM_USER_REQUIRED_FIELDS]):
             raise RequiredUploadFields(ve.message,
                                        MINIMUM_USER_REQUIRED_FIELDS) from None
-    entry = GMETA_ENTRY.copy()
+    builder = GMetaBuilder(visible_to)
+    builder.add(subject, content)
+    return builder.build()
+
+
+def gen_gmeta_entry(subject, visible_to, content, entry_id=METADATA_ENTRY_ID):
+    """Generate a single GMetaEntry, for use in a GMetaList"""
+    entry = copy.deepcopy(GMETA_ENTRY)
     entry['visible_to'] = [GROUP_URN_PREFIX.format(visible_to)]
     entry['subject'] = subject
     entry['content'] = content
-    entry['id'] = 'metadata'
-    gmeta = GMETA_LIST.copy()
-    gmeta['ingest_data']['gmeta'].append(entry)
-    return gmeta
+    entry['id'] = entry_id
+    return entry
+
+
+def relocate(value, relocations):
+    """Move a url or subject from the first (old prefix, new prefix) pair of
+    relocations it starts with. Anything else is returned unchanged."""
+    for old, new in relocations:
+        if isinstance(value, str) and value.startswith(old):
+            return new + value[len(old):]
+    return value
+
+
+def relocate_fields(fields, relocations):
+    """Copy field definitions with their reference subjects relocated"""
+    return [dict(f, reference=dict(f['reference'], resource=relocate(
+                f['reference'].get('resource'), relocations)))
+            if f.get('reference') else f for f in fields]
+
+
+def relocate_field_table(field_table, relocations):
+    """Copy a field table (see pilot.analysis.get_field_table()) with its
+    reference subjects relocated"""
+    if not field_table or 'reference' not in field_table:
+        return field_table
+    references = relocate_fields(
+        [{'reference': r} for r in field_table['reference']], relocations)
+    return dict(field_table, reference=[r['reference'] for r in references])
+
+
+def relocate_record(metadata, relocations):
+    """
+    Copy a record for the same dataframe at another location, such as
+    production instead of test. File urls, the field table url and foreign
+    key references are moved by relocations, a list of (old prefix, new
+    prefix) pairs. A stored content hash is updated to match.
+    """
+    record = copy_record(metadata)
+    for manifest in record.get('files') or []:
+        manifest['url'] = relocate(manifest.get('url'), relocations)
+    if record.get('field_metadata'):
+        field_metadata = record['field_metadata'] = dict(
+            record['field_metadata'])
+        if 'field_table_url' in field_metadata:
+            field_metadata['field_table_url'] = relocate(
+                field_metadata['field_table_url'], relocations)
+        if 'field_definitions' in field_metadata:
+            field_metadata['field_definitions'] = relocate_fields(
+                field_metadata['field_definitions'], relocations)
+    if CONTENT_HASH_KEY in record:
+        record[CONTENT_HASH_KEY] = canonical_hash(record)
+    return record
+
+
+def gen_gmeta_list(entries):
+    """Generate a GMetaList ingesting all of the given entries at once"""
+    return GMetaBuilder(entries=entries).build()
+
+
+class GMetaBuilder(object):
+    """
+    Builds a GMetaList ingest document from any number of entries, for any
+    number of subjects and entry ids. Every builder starts from a fresh
+    document, and entries may be added from many threads at once.
+    """
+
+    def __init__(self, visible_to=None, entries=()):
+        """
+        :param visible_to: Default Globus Group id entries are visible to
+        :param entries: Complete GMetaEntries to start with, such as from
+        gen_gmeta_entry()
+        """
+        self.visible_to = visible_to
+        self.entries = list(entries)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def add(self, subject, content, entry_id=METADATA_ENTRY_ID,
+            visible_to=None):
+        """Add a single entry, and return it"""
+        entry = gen_gmeta_entry(subject, visible_to or self.visible_to,
+                                content, entry_id)
+        with self.lock:
+            self.entries.append(entry)
+        return entry
+
+    def build(self):
+        """Return the GMetaList document for all entries added so far"""
+        gmeta = copy.deepcopy(GMETA_LIST)
+        with self.lock:
+            gmeta['ingest_data']['gmeta'] = list(self.entries)
+        return gmeta
+
+    def iter_json(self):
+        """Serialize the GMetaList one entry at a time, yielding strings
+        which join to the same JSON as build()."""
+        with self.lock:
+            entries = list(self.entries)
+        version = json.dumps(GMETA_VERSION)
+        yield ('{{"@version": {0}, "ingest_type": "GMetaList", '
+               '"ingest_data": {{"@version": {0}, "gmeta": ['.format(version))
+        for idx, entry in enumerate(entries):
+            yield (', ' if idx else '') + json.dumps(entry)
+        yield ']}}'
+
+    def write(self, stream):
+        """Write the GMetaList as JSON to a text stream, without building
+        the whole document in memory first."""
+        for chunk in self.iter_json():
+            stream.write(chunk)
 
 
 def set_dc_field(metadata, field_name, value):
@@ -269,10 +452,17 @@ def gen_dc_formats(metadata, formats):
 
 
 def gen_remote_file_manifest(filepath, url, metadata={},
-                             algorithms=DEFAULT_HASH_ALGORITHMS):
+                             algorithms=DEFAULT_HASH_ALGORITHMS,
+                             block_size=None):
+    """
+    Describe a local file for the 'files' field of a search record.
+    :param block_size: Also add 'blocks', hashes of each block of this many
+    bytes, see pilot.checksums.get_block_manifest()
+    """
     rfm = metadata.copy()
-    rfm.update({alg: compute_checksum(filepath, getattr(hashlib, alg)())
-                for alg in algorithms})
+    rfm.update(get_checksums(filepath, algorithms))
+    if block_size:
+        rfm['blocks'] = get_block_manifest(filepath, block_size)
     rfm.update({
         'filename': os.path.basename(filepath),
         'url': url,
@@ -284,10 +474,15 @@ def gen_remote_file_manifest(filepath, url, metadata={},
 def compute_checksum(file_path, algorithm, block_size=65536):
     if not algorithm:
         algorithm = hashlib.sha256()
+    start, size = time.monotonic(), 0
     with open(os.path.abspath(file_path), 'rb') as open_file:
         buf = open_file.read(block_size)
         while len(buf) > 0:
             algorithm.update(buf)
+            size += len(buf)
             buf = open_file.read(block_size)
     open_file.close()
+    metrics.inc('pilot_hash_bytes_total', size, algorithm=algorithm.name)
+    metrics.observe_rate('pilot_hash_mb_per_second', size / 2 ** 20,
+                         time.monotonic() - start, algorithm=algorithm.name)
     return algorithm.hexdigest()
@@ -0,0 +1,222 @@
+"""
+Mergeable summaries of dataframe columns. Summaries of two sets of rows can
+be merged into the summary of all of them, so when a dataframe only grows by
+appended rows, only the new rows need to be read (see
+pilot.analysis.analyze_appended()). Summaries are plain JSON serializable
+dicts, so they can be stored with the analysis cache.
+
+Numeric columns keep their count, mean, sum of squared differences from the
+mean (merged with Chan's parallel algorithm), min and max, plus a relative
+error sketch for percentiles. String columns keep exact value counts, up to
+MAX_TRACKED_VALUES distinct values.
+"""
+import math
+import numpy
+import pandas
+
+# Relative accuracy of percentiles estimated from a sketch
+SKETCH_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+# Max buckets for each sign in a sketch. The smallest magnitude buckets are
+# collapsed together past this, which only affects tiny values.
+SKETCH_MAX_BUCKETS = 2048
+# String columns with more distinct values than this aren't summarized
+MAX_TRACKED_VALUES = 100000
+
+
+def _bucket_counts(values):
+    indexes = numpy.ceil(numpy.log(values) / math.log(SKETCH_GAMMA))
+    keys, counts = numpy.unique(indexes.astype(numpy.int64),
+                                return_counts=True)
+    return {int(k): int(c) for k, c in zip(keys, counts)}
+
+
+def _collapse(buckets):
+    if len(buckets) <= SKETCH_MAX_BUCKETS:
+        return buckets
+    keys = sorted(buckets)
+    cutoff = keys[-SKETCH_MAX_BUCKETS]
+    collapsed = {k: v for k, v in buckets.items() if k > cutoff}
+    collapsed[cutoff] = sum(v for k, v in buckets.items() if k <= cutoff)
+    return collapsed
+
+
+def _add_buckets(a, b):
+    merged = dict(a)
+    for k, v in b.items():
+        merged[k] = merged.get(k, 0) + v
+    return _collapse(merged)
+
+
+def summarize_numeric(values):
+    """Summarize a 1D float array, ignoring NANs"""
+    values = values[~numpy.isnan(values)]
+    summary = {'kind': 'numeric', 'count': int(len(values)), 'mean': 0.0,
+               'm2': 0.0, 'min': None, 'max': None,
+               'positive': {}, 'negative': {}, 'zero': 0}
+    if not len(values):
+        return summary
+    finite = values[numpy.isfinite(values)]
+    mean = float(values.mean())
+    summary.update({
+        'mean': mean,
+        'm2': float(((values - mean) ** 2).sum()),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'positive': _collapse(_bucket_counts(finite[finite > 0])),
+        'negative': _collapse(_bucket_counts(-finite[finite < 0])),
+        'zero': int((finite == 0).sum()),
+    })
+    return summary
+
+
+def summarize_strings(series):
+    """Summarize a column of strings, or return None if it has too many
+    distinct values to track"""
+    counts = series.dropna().astype(str).value_counts()
+    if len(counts) > MAX_TRACKED_VALUES:
+        return None
+    return {'kind': 'string', 'count': int(counts.sum()),
+            'values': {k: int(v) for k, v in counts.items()}}
+
+
+def summarize_dataframe(df):
+    """
+    Summarize every column of a dataframe.
+    :return: dict of column names to summaries, or None if any column can't
+    be summarized (types other than numbers and strings, or too many
+    distinct strings)
+    """
+    summaries = {}
+    for name in df.columns:
+        column = df[name]
+        if pandas.api.types.is_bool_dtype(column.dtype):
+            return None
+        if pandas.api.types.is_numeric_dtype(column.dtype):
+            summaries[name] = summarize_numeric(column.to_numpy(
+                dtype=numpy.float64, na_value=numpy.nan))
+        elif pandas.api.types.is_string_dtype(column.dtype):
+            summaries[name] = summarize_strings(column)
+        else:
+            return None
+        if summaries[name] is None:
+            return None
+    return summaries
+
+
+def summarize_rows(df, summaries):
+    """
+    Summarize rows read as strings (dtype=str) into the same kinds of
+    summaries as an earlier set of rows, so they can be merged.
+    :raises ValueError: if a numeric column has values which aren't numbers
+    """
+    summarized = {}
+    for name, summary in summaries.items():
+        if summary['kind'] == 'numeric':
+            values = pandas.to_numeric(df[name], errors='raise')
+            summarized[name] = summarize_numeric(numpy.asarray(
+                values, dtype=numpy.float64))
+        else:
+            summarized[name] = summarize_strings(df[name])
+    return summarized
+
+
+def merge_summaries(a, b):
+    """Merge the summaries of two sets of rows of the same column"""
+    if a['kind'] != b['kind']:
+        raise ValueError('Cannot merge {} and {} summaries'
+                         ''.format(a['kind'], b['kind']))
+    if a['kind'] == 'string':
+        values = dict(a['values'])
+        for k, v in b['values'].items():
+            values[k] = values.get(k, 0) + v
+        if len(values) > MAX_TRACKED_VALUES:
+            return None
+        return {'kind': 'string', 'count': a['count'] + b['count'],
+                'values': values}
+    if not b['count']:
+        return a
+    if not a['count']:
+        return b
+    count = a['count'] + b['count']
+    delta = b['mean'] - a['mean']
+    return {
+        'kind': 'numeric',
+        'count': count,
+        'mean': a['mean'] + delta * b['count'] / count,
+        'm2': a['m2'] + b['m2'] + delta ** 2 * a['count'] * b['count'] / count,
+        'min': min(a['min'], b['min']),
+        'max': max(a['max'], b['max']),
+        'positive': _add_buckets(a['positive'], b['positive']),
+        'negative': _add_buckets(a['negative'], b['negative']),
+        'zero': a['zero'] + b['zero'],
+    }
+
+
+def get_sketch_percentile(summary, q):
+    """Estimate the q (0 to 1) percentile of a numeric summary, with linear
+    ranks like pandas describe(). Accurate within SKETCH_ACCURACY."""
+    if q <= 0:
+        return summary['min']
+    if q >= 1:
+        return summary['max']
+    negative = sorted(summary['negative'].items(), reverse=True)
+    positive = sorted(summary['positive'].items())
+    bucket_values = ([-2 * SKETCH_GAMMA ** k / (SKETCH_GAMMA + 1)
+                      for k, _ in negative] + [0.0] +
+                     [2 * SKETCH_GAMMA ** k / (SKETCH_GAMMA + 1)
+                      for k, _ in positive])
+    counts = [c for _, c in negative] + [summary['zero']] + \
+        [c for _, c in positive]
+    rank = q * (summary['count'] - 1)
+    idx = int(numpy.searchsorted(numpy.cumsum(counts), rank, side='right'))
+    idx = min(idx, len(bucket_values) - 1)
+    return min(max(bucket_values[idx], summary['min']), summary['max'])
+
+
+def get_summary_metadata(name, summary):
+    """Field metadata for a summary, with the same keys as
+    pilot.analysis.describe_dataframe() (NANs are left for the caller to
+    strip)"""
+    if summary['kind'] == 'string':
+        metadata = {'name': name, 'type': 'string',
+                    'count': summary['count'],
+                    'unique': len(summary['values'])}
+        if summary['values']:
+            top = max(summary['values'].items(), key=lambda kv: kv[1])
+            metadata['top'], metadata['frequency'] = top
+        return metadata
+    metadata = {'name': name, 'type': 'float64', 'count': summary['count']}
+    if not summary['count']:
+        return metadata
+    metadata.update({
+        'mean': summary['mean'],
+        'std': (math.sqrt(summary['m2'] / (summary['count'] - 1))
+                if summary['count'] > 1 else numpy.nan),
+        'min': summary['min'],
+        'max': summary['max'],
+    })
+    for key, q in [('25', .25), ('50', .5), ('75', .75)]:
+        metadata[key] = get_sketch_percentile(summary, q)
+    return metadata
+
+
+def get_summary_size(summaries):
+    """Rough number of values stored in a set of summaries"""
+    return sum(len(s.get('values', ())) + len(s.get('positive', ())) +
+               len(s.get('negative', ())) + 1 for s in summaries.values())
+
+
+def to_json(summaries):
+    """JSON only allows string keys, so sketch buckets are stored as pairs"""
+    return {name: dict(s, positive=sorted(s['positive'].items()),
+                       negative=sorted(s['negative'].items()))
+            if s['kind'] == 'numeric' else s
+            for name, s in summaries.items()}
+
+
+def from_json(summaries):
+    return {name: dict(s, positive={int(k): v for k, v in s['positive']},
+                       negative={int(k): v for k, v in s['negative']})
+            if s['kind'] == 'numeric' else s
+            for name, s in summaries.items()}
@@ -0,0 +1,173 @@
+"""
+Refresh Globus tokens ahead of expiry on a background thread. Requests read
+the current access token without ever waiting on a refresh, and refreshes
+are single flight: when several threads need new tokens at once, only one
+refresh is made and all new tokens are saved with a single config write.
+"""
+import sys
+import time
+import threading
+import collections
+import functools
+import globus_sdk
+from globus_sdk import AccessTokenAuthorizer
+
+# Seconds before expiry to refresh tokens. Globus access tokens last 48 hours.
+REFRESH_MARGIN = 600
+# Seconds to wait before trying again after a failed background refresh
+REFRESH_RETRY_INTERVAL = 30
+# Max seconds the refresh thread sleeps at once, so it notices if the machine
+# was suspended past a refresh time
+MAX_REFRESH_WAIT = 300
+
+
+class TokenManager(object):
+    """
+    Keeps tokens for a fair_research_login NativeClient fresh. Tokens with
+    refresh tokens are refreshed refresh_margin seconds before they expire
+    by a daemon thread, started with the first call to get_authorizers().
+    """
+
+    def __init__(self, native_client, refresh_margin=REFRESH_MARGIN,
+                 clock=time.time):
+        self.native_client = native_client
+        self.refresh_margin = refresh_margin
+        self.clock = clock
+        self.tokens = None
+        # Held while refreshing, so only one refresh happens at a time
+        self.refresh_lock = threading.Lock()
+        # Number of times each resource server's token has been refreshed
+        self.generations = collections.Counter()
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.authorizers = {}
+
+    def load(self):
+        if self.tokens is None:
+            # Expired tokens are refreshed synchronously by load_tokens()
+            self.tokens = self.native_client.load_tokens()
+        return self.tokens
+
+    def get_access_token(self, resource_server):
+        # self.tokens is replaced whole on refresh, never modified in place,
+        # so this never sees a half-updated token set.
+        return self.load()[resource_server]['access_token']
+
+    def get_authorizers(self):
+        """
+        Authorizers for each resource server, which are updated with new
+        access tokens as they are refreshed. Globus SDK clients only accept
+        their own authorizer types, so these are AccessTokenAuthorizers.
+        """
+        for rs, ts in self.load().items():
+            if rs not in self.authorizers:
+                authorizer = AccessTokenAuthorizer(ts['access_token'])
+                # If a token is rejected (the background refresh fell
+                # behind, or it was revoked) refresh it now. The SDK retries
+                # the request once if this returns True.
+                authorizer.handle_missing_authorization = functools.partial(
+                    self.handle_missing_authorization, rs)
+                self.authorizers[rs] = authorizer
+        self.start()
+        return dict(self.authorizers)
+
+    def handle_missing_authorization(self, resource_server, *args, **kwargs):
+        try:
+            return self.refresh([resource_server], force=True)
+        except globus_sdk.exc.GlobusError:
+            return False
+
+    def get_refreshable(self):
+        return {rs: ts for rs, ts in self.load().items()
+                if ts.get('refresh_token')}
+
+    def get_next_refresh(self):
+        """Time when the next token should be refreshed, or None if no tokens
+        can be refreshed"""
+        expiries = [ts['expires_at_seconds'] for ts in
+                    self.get_refreshable().values()
+                    if ts.get('expires_at_seconds')]
+        if not expiries:
+            return None
+        return min(expiries) - self.refresh_margin
+
+    def refresh(self, resource_servers=None, force=False):
+        """
+        Refresh tokens which are due (or all listed tokens, if force), and
+        save them. If another thread is already refreshing, wait for it and
+        use its tokens instead of refreshing again.
+        :param resource_servers: Only refresh these. Default all refreshable.
+        :return: True if tokens were refreshed by this or another thread
+        """
+        if resource_servers is None:
+            resource_servers = list(self.get_refreshable())
+        seen = {rs: self.generations[rs] for rs in resource_servers}
+        with self.refresh_lock:
+            if seen and all(self.generations[rs] != gen
+                            for rs, gen in seen.items()):
+                return True
+            tokens = dict(self.load())
+            due_before = self.clock() + self.refresh_margin
+            due = {rs: ts for rs, ts in self.get_refreshable().items()
+                   if rs in resource_servers and self.generations[rs] ==
+                   seen[rs] and (force or due_before >=
+                                 (ts.get('expires_at_seconds') or 0))}
+            if not due:
+                return False
+            auth_client = self.native_client.client
+            for rs, ts in due.items():
+                response = auth_client.oauth2_refresh_token(
+                    ts['refresh_token'])
+                new_ts = response.by_resource_server[rs]
+                tokens[rs] = dict(ts, access_token=new_ts['access_token'],
+                                  expires_at_seconds=new_ts[
+                                      'expires_at_seconds'])
+            # Write tokens directly rather than through save_tokens(), which
+            # revokes replaced access tokens in-flight requests may be using.
+            self.native_client.token_storage.write_tokens(tokens)
+            self.tokens = tokens
+            for rs in due:
+                if rs in self.authorizers:
+                    # Requests read header_val once, so replacing it is safe
+                    # while they are in flight.
+                    self.authorizers[rs].access_token = tokens[rs][
+                        'access_token']
+                    self.authorizers[rs].header_val = 'Bearer {}'.format(
+                        tokens[rs]['access_token'])
+            self.generations.update(due.keys())
+            return True
+
+    def start(self):
+        if self.thread is not None or self.get_next_refresh() is None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name='pilot-token-refresh')
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            next_refresh = self.get_next_refresh()
+            if next_refresh is None:
+                break
+            delay = next_refresh - self.clock()
+            if delay > 0:
+                self.wakeup.wait(min(delay, MAX_REFRESH_WAIT))
+                self.wakeup.clear()
+                continue
+            try:
+                self.refresh()
+            except (globus_sdk.exc.GlobusError, OSError) as e:
+                sys.stderr.write('Unable to refresh tokens, retrying in '
+                                 '{}s: {}\n'.format(REFRESH_RETRY_INTERVAL, e))
+                self.stopped.wait(REFRESH_RETRY_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+        self.tokens = None
+        self.authorizers = {}
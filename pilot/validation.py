@@ -1,11 +1,13 @@
 import os
 import json
+import functools
 import jsonschema
 
 BASE_DIR = os.path.dirname(__file__)
 BASE_SCHEMA_DIR = os.path.join(BASE_DIR, 'schemas')
 
 
+@functools.lru_cache()
 def get_schemas():
     schemas = {}
     files = [f for f in os.listdir(BASE_SCHEMA_DIR)
@@ -30,10 +32,19 @@ def validate_user_provided_metadata(metadata):
     validate_json('user_provided_metadata', metadata)
 
 
-def validate_json(name, json):
+@functools.lru_cache()
+def get_validator(name):
+    """Build a validator for the named schema once. Validators check their
+    schema when built, and keep any $ref'd schemas they load."""
     schema = get_schemas()[name]
     resolver = jsonschema.RefResolver(
         base_uri="file://{}/{}".format(BASE_SCHEMA_DIR, name),
         referrer=name
     )
-    jsonschema.validate(schema=schema, resolver=resolver, instance=json)
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema, resolver=resolver)
+
+
+def validate_json(name, json):
+    get_validator(name).validate(json)
@@ -32,7 +32,7 @@ setup(
     requires=[],
     entry_points='''
     [console_scripts]
-    pilot=pilot.commands.main:cli
+    pilot=pilot.daemon:main
 ''',
     install_requires=install_requires,
     dependency_links=[],
@@ -0,0 +1,69 @@
+"""
+Compare two pytest-benchmark JSON files, such as the checked in baseline and
+a new run, and exit non-zero if any benchmark got slower or used more memory
+than the threshold allows:
+
+    python tests/benchmarks/compare.py tests/benchmarks/baseline.json \
+        results.json
+
+Timings are only comparable between runs on the same machine with the same
+PILOT_BENCHMARK_SCALE.
+"""
+import json
+import click
+
+METRICS = ['mean', 'peak_memory_bytes']
+
+
+def load_results(filename):
+    """dict of benchmark name to dict of metric to value"""
+    with open(filename) as fh:
+        results = json.load(fh)
+    return {b['fullname']: {'mean': b['stats']['mean'],
+                            'peak_memory_bytes':
+                                b['extra_info'].get('peak_memory_bytes')}
+            for b in results['benchmarks']}
+
+
+def compare_results(baseline, current, threshold):
+    """
+    :return: list of (name, metric, baseline value, current value, ratio,
+    whether it regressed) for every metric both results have
+    """
+    rows = []
+    for name in sorted(set(baseline) & set(current)):
+        for metric in METRICS:
+            old, new = baseline[name][metric], current[name][metric]
+            if not old or new is None:
+                continue
+            ratio = new / old
+            rows.append((name, metric, old, new, ratio,
+                         ratio > 1 + threshold))
+    return rows
+
+
+@click.command(help=__doc__)
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False))
+@click.argument('current', type=click.Path(exists=True, dir_okay=False))
+@click.option('--threshold', type=float, default=0.25, show_default=True,
+              help='Allowed fractional increase before a benchmark counts '
+                   'as a regression')
+def compare(baseline, current, threshold):
+    old, new = load_results(baseline), load_results(current)
+    rows = compare_results(old, new, threshold)
+    for name, metric, old_val, new_val, ratio, regressed in rows:
+        click.echo('{:<4} {:+7.1%} {:<18} {}'.format(
+            'FAIL' if regressed else 'ok', ratio - 1, metric, name))
+    for name in sorted(set(old) ^ set(new)):
+        click.echo('skip {} (only in {})'.format(
+            name, baseline if name in old else current))
+    regressions = [r for r in rows if r[-1]]
+    if regressions:
+        click.secho('{} regressions over {:.0%}'.format(
+            len(regressions), threshold), fg='red')
+        raise click.exceptions.Exit(1)
+    click.secho('No regressions', fg='green')
+
+
+if __name__ == '__main__':
+    compare()
@@ -0,0 +1,128 @@
+"""
+Benchmarks for the hot paths of uploading and browsing dataframes. They are
+skipped unless pytest-benchmark is installed and --benchmark-only is given:
+
+    pytest tests/benchmarks --benchmark-only --benchmark-json=results.json
+    python tests/benchmarks/compare.py tests/benchmarks/baseline.json \
+        results.json
+
+Besides time, each benchmark records the peak memory traced by tracemalloc
+in its 'extra_info'.
+"""
+import os
+import copy
+import functools
+import tracemalloc
+import pytest
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    collect_ignore_glob = ['test_*.py']
+
+import pilot
+from pilot.cache import TTLCache
+from pilot.client import PilotClient
+from pilot.analysis import analyze_dataframe
+from pilot.checksums import get_checksums
+from pilot.search import scrape_metadata, update_metadata, pop_field_table
+from tests.benchmarks import data
+
+DIRECTORY = 'benchmarks'
+USER_METADATA = {'data_type': 'Drug Response', 'dataframe_type': 'List',
+                 'description': 'Synthetic dataframe for benchmarks'}
+# Every lookup misses, so benchmarks never time (or fill) the real caches
+NO_CACHE = TTLCache('benchmarks', -1, persist=False)
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('benchmark_only', False):
+        return
+    skip = pytest.mark.skip(reason='Benchmarks only run with --benchmark-only')
+    for item in items:
+        if 'benchmark' in getattr(item, 'fixturenames', ()):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope='session')
+def frames_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp('frames')
+
+
+@pytest.fixture(scope='session')
+def tall_tsv(frames_dir):
+    return data.write_tsv(data.tall_frame(), str(frames_dir / 'tall.tsv'))
+
+
+@pytest.fixture(scope='session')
+def wide_tsv(frames_dir):
+    return data.write_tsv(data.wide_frame(), str(frames_dir / 'wide.tsv'))
+
+
+@pytest.fixture(scope='session')
+def mixed_tsv(frames_dir):
+    return data.write_tsv(data.mixed_frame(), str(frames_dir / 'mixed.tsv'))
+
+
+@pytest.fixture(scope='session')
+def compressed_tsv(frames_dir):
+    return data.write_tsv(data.mixed_frame(),
+                          str(frames_dir / 'mixed.tsv.gz'))
+
+
+@pytest.fixture(scope='session')
+def frames(tall_tsv, wide_tsv, mixed_tsv, compressed_tsv):
+    return {'tall': tall_tsv, 'wide': wide_tsv, 'mixed': mixed_tsv,
+            'compressed': compressed_tsv}
+
+
+def scrape_record(filename):
+    """A complete search record for a dataframe, as built by upload, and its
+    field table"""
+    pc = PilotClient()
+    url = pc.get_globus_http_url(os.path.basename(filename), DIRECTORY)
+    with pytest.MonkeyPatch.context() as mp:
+        # Normally the logged in user's name
+        mp.setattr(pilot.search, 'get_creator_name', lambda: 'Doe, Jane')
+        mp.setattr(pilot.search, 'analyze_dataframe_cached',
+                   analyze_dataframe)
+        mp.setattr(pilot.search, 'get_checksums',
+                   functools.partial(get_checksums, cache=NO_CACHE))
+        scraped = scrape_metadata(filename, url, skip_analysis=False)
+    field_table = pop_field_table(scraped)
+    return update_metadata(scraped, None, USER_METADATA), field_table
+
+
+@pytest.fixture(scope='session')
+def mixed_record(mixed_tsv):
+    return scrape_record(mixed_tsv)
+
+
+@pytest.fixture(scope='session')
+def wide_record(wide_tsv):
+    return scrape_record(wide_tsv)
+
+
+@pytest.fixture
+def measure(benchmark):
+    """
+    Benchmark func(*args, **kwargs) for a fixed number of rounds, and record
+    its peak memory. Memory is measured in a separate, untimed call, since
+    tracing slows down allocations. Memory allocated outside of Python's and
+    NumPy's allocators (such as by pyarrow) isn't traced. Each call gets a
+    fresh copy of args, so functions which modify them can be benchmarked.
+    An untraced warm-up call comes first, so one-time costs like lazy imports
+    don't land on whichever benchmark happens to run first.
+    """
+    def run(func, *args, rounds=5, **kwargs):
+        func(*copy.deepcopy(args), **kwargs)
+        tracemalloc.start()
+        try:
+            func(*copy.deepcopy(args), **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info['peak_memory_bytes'] = peak
+        return benchmark.pedantic(
+            func, setup=lambda: (copy.deepcopy(args), kwargs), rounds=rounds)
+    return run
@@ -0,0 +1,61 @@
+"""
+Synthetic dataframes for benchmarks. Row and column counts are multiplied by
+the PILOT_BENCHMARK_SCALE environment variable, so a quick run can use 0.1
+and a thorough one 10. Data is seeded, so every run sees the same files.
+"""
+import os
+import numpy
+import pandas
+
+SCALE = float(os.environ.get('PILOT_BENCHMARK_SCALE', '1'))
+SEED = 0
+
+
+def scaled(num):
+    return max(1, int(num * SCALE))
+
+
+def tall_frame(rows=scaled(200000), cols=5):
+    """Many rows of an ID column and a few numeric columns"""
+    rand = numpy.random.RandomState(SEED)
+    frame = pandas.DataFrame({'sample_id': ['S{:08d}'.format(i)
+                                            for i in range(rows)]})
+    for col in range(cols):
+        frame['x{}'.format(col)] = rand.normal(col, col + 1, rows)
+    return frame
+
+
+def wide_frame(rows=scaled(200), cols=scaled(2000)):
+    """A numeric matrix: an ID column followed by many numeric columns, like
+    gene expression dataframes"""
+    rand = numpy.random.RandomState(SEED)
+    values = rand.lognormal(size=(rows, cols)).astype(numpy.float32)
+    frame = pandas.DataFrame(values, columns=['g{}'.format(c)
+                                              for c in range(cols)])
+    frame.insert(0, 'sample', ['S{:06d}'.format(i) for i in range(rows)])
+    return frame
+
+
+def mixed_frame(rows=scaled(100000)):
+    """Numbers with missing values, categories, unique strings and dates"""
+    rand = numpy.random.RandomState(SEED)
+    dose = rand.exponential(10, rows)
+    dose[rand.rand(rows) < 0.05] = numpy.nan
+    start = numpy.datetime64('2015-01-01')
+    return pandas.DataFrame({
+        'drug': rand.choice(['D{:03d}'.format(i) for i in range(500)], rows),
+        'cell_line': rand.choice(['C{:02d}'.format(i) for i in range(60)],
+                                 rows),
+        'dose': dose,
+        'replicate': rand.randint(1, 4, rows),
+        'response': rand.normal(50, 20, rows),
+        'outcome': rand.choice(['growth', 'inhibition', 'none'], rows),
+        'record_id': ['R{:09d}'.format(i) for i in range(rows)],
+        'date': (start + rand.randint(0, 2000, rows)).astype(str),
+    })
+
+
+def write_tsv(frame, filename):
+    """Write a dataframe as a TSV, gzip compressed if filename ends in .gz"""
+    frame.to_csv(filename, sep='\t', index=False, float_format='%.6g')
+    return filename
@@ -0,0 +1,58 @@
+import os
+import hashlib
+import functools
+import pytest
+import pilot
+from pilot.analysis import analyze_dataframe
+from pilot.checksums import get_checksums, get_block_manifest, hash_file
+from pilot.search import compute_checksum, gen_remote_file_manifest
+from tests.benchmarks.conftest import NO_CACHE
+
+FILES = ['tall', 'compressed']
+FRAMES = ['tall', 'wide', 'mixed']
+
+
+def file_info(benchmark, filename):
+    benchmark.extra_info['file_bytes'] = os.path.getsize(filename)
+
+
+@pytest.mark.parametrize('name', FILES)
+@pytest.mark.parametrize('algorithm', ['sha256', 'md5'])
+def test_compute_checksum(measure, benchmark, frames, name, algorithm):
+    file_info(benchmark, frames[name])
+    measure(lambda f: compute_checksum(f, hashlib.new(algorithm)),
+            frames[name])
+
+
+@pytest.mark.parametrize('name', FILES)
+def test_hash_file_one_pass(measure, benchmark, frames, name):
+    file_info(benchmark, frames[name])
+    measure(hash_file, frames[name], ['sha256', 'md5'])
+
+
+@pytest.mark.parametrize('name', FILES)
+def test_block_manifest(measure, benchmark, frames, name):
+    file_info(benchmark, frames[name])
+    measure(get_block_manifest, frames[name], 2 ** 20, cache=NO_CACHE)
+
+
+@pytest.mark.parametrize('name', FILES)
+def test_gen_remote_file_manifest(measure, benchmark, frames, name,
+                                  monkeypatch):
+    monkeypatch.setattr(pilot.search, 'get_checksums',
+                        functools.partial(get_checksums, cache=NO_CACHE))
+    file_info(benchmark, frames[name])
+    measure(gen_remote_file_manifest, frames[name], 'https://example.org/x',
+            {'mime_type': 'text/tab-separated-values'})
+
+
+@pytest.mark.parametrize('name', FRAMES)
+def test_analyze_dataframe(measure, benchmark, frames, name):
+    file_info(benchmark, frames[name])
+    measure(analyze_dataframe, frames[name], rounds=3)
+
+
+@pytest.mark.parametrize('name', FRAMES)
+def test_analyze_dataframe_sampled(measure, benchmark, frames, name):
+    file_info(benchmark, frames[name])
+    measure(analyze_dataframe, frames[name], sample_size=1000)
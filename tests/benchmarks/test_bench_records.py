@@ -0,0 +1,105 @@
+import copy
+import pytest
+from unittest.mock import Mock
+from click.testing import CliRunner
+
+import pilot
+from pilot.search import (gen_gmeta, update_metadata, files_modified,
+                          gen_remote_file_manifest)
+from pilot.validation import validate_dataset
+from pilot.commands.search.search_commands import list_command, describe
+from tests.benchmarks.conftest import USER_METADATA, NO_CACHE
+from tests.benchmarks.data import scaled
+
+SUBJECT = 'globus://endpoint/benchmarks/mixed.tsv'
+GROUP = 'd99b3400-33e7-11e9-8857-0af4690c7c7e'
+LIST_RECORDS = scaled(1000)
+SEARCH_PAGE_SIZE = 100
+
+
+def get_dataset(record):
+    """The parts of a record checked by the dataset schema"""
+    return {k: v for k, v in record.items() if k != 'field_metadata'}
+
+
+@pytest.fixture(params=['mixed', 'wide'])
+def record(request, mixed_record, wide_record):
+    return {'mixed': mixed_record, 'wide': wide_record}[request.param]
+
+
+def test_validate_dataset(measure, record):
+    content, _ = record
+    measure(validate_dataset, get_dataset(content))
+
+
+def test_validate_dataset_with_blocks(measure, mixed_record, tall_tsv):
+    content, _ = mixed_record
+    dataset = get_dataset(content)
+    dataset['files'] = gen_remote_file_manifest(
+        tall_tsv, dataset['files'][0]['url'], {
+            'data_type': 'Drug Response',
+            'mime_type': 'text/tab-separated-values'},
+        block_size=2 ** 16)
+    measure(validate_dataset, dataset)
+
+
+def test_gen_gmeta(measure, record):
+    content, _ = record
+    measure(gen_gmeta, SUBJECT, GROUP, content)
+
+
+@pytest.mark.parametrize('changed', [False, True])
+def test_update_metadata(measure, mixed_record, changed):
+    prev, _ = mixed_record
+    scraped = copy.deepcopy(prev)
+    if changed:
+        scraped['files'][0]['sha256'] = '0' * 64
+        scraped['files'][0]['length'] += 1
+    measure(update_metadata, scraped, prev, USER_METADATA)
+
+
+def test_files_modified(measure, mixed_record):
+    prev, _ = mixed_record
+    new = copy.deepcopy(prev['files'])
+    measure(files_modified, new, prev['files'], rounds=100)
+
+
+def mock_pilot_client(monkeypatch, **methods):
+    pc = Mock(**methods)
+    pc.is_logged_in.return_value = True
+    pc.get_subject_url.return_value = SUBJECT
+    pc.get_metadata_content = pilot.client.PilotClient.get_metadata_content
+    monkeypatch.setattr(pilot.commands, 'get_pilot_client', lambda: pc)
+    return pc
+
+
+def test_list_formatting(measure, monkeypatch, mixed_record):
+    content, _ = mixed_record
+    pages = [{'total': LIST_RECORDS, 'gmeta': [
+        {'subject': '{}{}'.format(SUBJECT, i), 'content': [content]}
+        for i in range(start, min(start + SEARCH_PAGE_SIZE, LIST_RECORDS))]}
+        for start in range(0, LIST_RECORDS, SEARCH_PAGE_SIZE)]
+    mock_pilot_client(monkeypatch, **{
+        'iter_search_pages.side_effect': lambda *a, **kw: iter(pages)})
+    runner = CliRunner()
+    result = measure(runner.invoke, list_command, ['--limit',
+                                                   str(LIST_RECORDS)])
+    assert result.exit_code == 0
+
+
+@pytest.mark.parametrize('all_fields', [False, True])
+def test_describe_formatting(measure, monkeypatch, wide_record, all_fields):
+    content, field_table = wide_record
+    mock_pilot_client(monkeypatch, **{
+        'get_search_entry.side_effect': lambda *a, **kw: copy.deepcopy(
+            content),
+        'get_field_table.return_value': field_table})
+    args = ['benchmarks/wide.tsv'] + (['--all-fields'] if all_fields else [])
+    result = measure(CliRunner().invoke, describe, args)
+    assert result.exit_code == 0
+
+
+def test_no_cache():
+    # Benchmarks rely on this to never hit the checksum and analysis caches
+    NO_CACHE.set('key', 'value')
+    assert NO_CACHE.get('key') is None
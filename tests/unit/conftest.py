@@ -8,6 +8,24 @@ from .mocks import (MemoryStorage, MOCK_TOKEN_SET, GlobusTransferTaskResponse,
 
 from pilot.client import PilotClient
 import pilot
+import pilot.analysis
+import pilot.cache
+import pilot.checksums
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep every cache, including the module level ones, out of the real
+    cache directory"""
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(pilot.cache, 'CACHE_DIR', cache_dir)
+    for cache in [pilot.checksums.checksum_cache,
+                  pilot.analysis.analysis_cache]:
+        monkeypatch.setattr(cache, 'path',
+                            os.path.join(cache_dir, os.path.basename(
+                                cache.path)))
+        monkeypatch.setattr(cache, 'memory', {})
+    return cache_dir
 
 
 @pytest.fixture
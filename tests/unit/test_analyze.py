@@ -1,7 +1,19 @@
+import os
+import pytest
 import pandas
-from pilot.analysis import analyze_dataframe
+import pilot.analysis
+from unittest.mock import Mock
+from pilot import analysis
+from pilot.cache import TTLCache
+from pilot.analysis import (analyze_dataframe, get_numeric_field_metadata,
+                            get_pandas_field_metadata, unpack_field_table,
+                            dump_field_table, load_field_table,
+                            get_dtype_hints, read_dataframe,
+                            describe_dataframe, is_numeric_matrix,
+                            get_numeric_matrix_metadata, PREVIEW_FIELD_COUNT)
 from io import StringIO
 
+
 def test_analyze_dataframe(simple_tsv):
     ana = analyze_dataframe(simple_tsv)
     assert ana['numcols'] == 2
@@ -26,3 +38,193 @@ def test_preview_bytes(simple_tsv):
     assert list(preview_df.columns) == list(normal_df.columns)
     assert preview_df.head(10).to_dict() == normal_df.head(10).to_dict()
     assert preview_df.head(11).to_dict() != normal_df.head(11).to_dict()
+
+
+def test_analyze_wide_dataframe(tmpdir):
+    wide = tmpdir.join('wide.tsv')
+    columns = ['col{}'.format(i) for i in range(25)]
+    rows = ['\t'.join(str(r * c) for c in range(25)) for r in range(20)]
+    wide.write('\n'.join(['\t'.join(columns)] + rows) + '\n')
+    ana = analyze_dataframe(str(wide))
+    assert ana['numcols'] == 25
+    assert len(ana['field_definitions']) == PREVIEW_FIELD_COUNT
+    assert len(ana['field_table']['name']) == 25
+    fields = unpack_field_table(ana['field_table'])
+    preview = [{k: v for k, v in field.items() if v is not None}
+               for field in ana['field_definitions']]
+    assert fields[:PREVIEW_FIELD_COUNT] == preview
+    assert fields[24]['max'] == 19 * 24
+    lines = dump_field_table(ana['field_table']).splitlines()
+    assert len(lines) == 25
+    assert unpack_field_table(load_field_table(lines)) == fields
+
+
+def test_numeric_field_metadata_matches_describe(simple_tsv):
+    df = pandas.read_csv(simple_tsv, sep='\t')
+    described = get_pandas_field_metadata(df.describe(include='all'),
+                                          'Numbers')
+    assert get_numeric_field_metadata(df[['Numbers']])[0] == described
+
+
+def test_dtype_hints(simple_tsv):
+    ana = analyze_dataframe(simple_tsv)
+    dtypes = get_dtype_hints(ana['field_definitions'])
+    assert dtypes == {'Numbers': 'float64', 'Title': 'string'}
+    assert analyze_dataframe(simple_tsv, dtypes=dtypes) == ana
+
+
+def test_read_dataframe_bad_dtype_hints(simple_tsv):
+    df = read_dataframe(simple_tsv, dtypes={'Title': 'float64'})
+    assert len(df.index) == 99
+
+
+def write_matrix(tmpdir, rows, cols=12):
+    matrix = tmpdir.join('matrix.tsv')
+    header = ['Sample'] + ['gene{}'.format(c) for c in range(cols)]
+    lines = ['\t'.join(header)]
+    for r in range(rows):
+        values = ['' if (r + c) % 7 == 0 else str(r * c / 3)
+                  for c in range(cols)]
+        lines.append('\t'.join(['sample{}'.format(r % 5)] + values))
+    matrix.write('\n'.join(lines) + '\n')
+    return str(matrix)
+
+
+def test_numeric_matrix_fast_path(tmpdir):
+    matrix = write_matrix(tmpdir, 50)
+    assert is_numeric_matrix(matrix)
+    fast_info, numrows = get_numeric_matrix_metadata(matrix, block_cells=200)
+    assert numrows == 50
+    pandas_info = describe_dataframe(pandas.read_csv(matrix, sep='\t'))
+    assert fast_info.keys() == pandas_info.keys()
+    for name, metadata in pandas_info.items():
+        assert fast_info[name] == pytest.approx(metadata)
+
+
+def test_numeric_matrix_skips_schema_inference(tmpdir, monkeypatch):
+    matrix = write_matrix(tmpdir, 150)
+    with monkeypatch.context() as m:
+        m.setattr(pilot.analysis, 'get_numeric_matrix_fields',
+                  Mock(return_value=None))
+        inferred = analyze_dataframe(matrix)
+    monkeypatch.setattr(pilot.analysis.tableschema, 'infer',
+                        Mock(side_effect=AssertionError('inferred')))
+    assert analyze_dataframe(matrix) == inferred
+
+
+def test_numeric_matrix_falls_back(tmpdir):
+    matrix = write_matrix(tmpdir, 150)
+    with open(matrix, 'a') as fh:
+        fh.write('\t'.join(['sampleX'] + ['oops'] * 12) + '\n')
+    assert is_numeric_matrix(matrix)
+    ana = analyze_dataframe(matrix)
+    assert ana['numrows'] == 151
+    assert ana['field_definitions'][1]['type'] == 'string'
+
+
+def test_sampled_analysis(simple_tsv):
+    ana = analyze_dataframe(simple_tsv, sample_size=20)
+    assert ana['numrows'] == 99
+    assert ana['sampled']['sample_size'] == 20
+    assert ana['sampled']['method'] == 'reservoir'
+    numbers = ana['field_definitions'][0]
+    assert numbers['count'] == 99
+    low, high = numbers['mean_ci']
+    assert low < numbers['mean'] < high
+
+
+def test_sampled_analysis_skips_file_schema_inference(simple_tsv, tmpdir,
+                                                      monkeypatch):
+    infer = Mock(wraps=pilot.analysis.tableschema.infer)
+    monkeypatch.setattr(pilot.analysis.tableschema, 'infer', infer)
+    ana = analyze_dataframe(simple_tsv, sample_size=20)
+    assert ana['field_definitions'][0]['format'] == 'default'
+    # Inferred from the sampled rows only, never from the whole file
+    assert infer.call_count == 1
+    assert infer.call_args[0][0] != simple_tsv
+
+    infer.reset_mock()
+    analyze_dataframe(write_matrix(tmpdir, 150), sample_size=20)
+    assert not infer.called
+
+
+def test_offset_sampled_analysis(tmpdir, monkeypatch):
+    monkeypatch.setattr(pilot.analysis, 'SAMPLE_FULL_READ_BYTES', 0)
+    matrix = write_matrix(tmpdir, 500)
+    ana = analyze_dataframe(matrix, sample_size=100)
+    assert ana['sampled']['method'] == 'offset'
+    assert ana['sampled']['sample_size'] <= 100
+    low, high = ana['sampled']['numrows_ci']
+    assert low <= ana['numrows'] <= high
+    assert 300 < ana['numrows'] < 700
+
+
+def append_rows(filename, rows):
+    with open(filename, 'a') as fh:
+        fh.write(''.join(rows))
+    # Make sure the modification time changes, even on coarse filesystems
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_analyze_appended_rows(tmpdir, monkeypatch):
+    filename = str(tmpdir.join('growing.tsv'))
+    with open(filename, 'w') as fh:
+        fh.write('name\tvalue\n' + ''.join('n{}\t{}\n'.format(i % 7, i)
+                                           for i in range(200)))
+    cache = TTLCache('analysis', 60, cache_dir=str(tmpdir))
+    first = analysis.analyze_dataframe_cached(filename, cache=cache)
+    assert first['numrows'] == 200
+
+    real = Mock(side_effect=analysis.analyze_dataframe)
+    monkeypatch.setattr(analysis, 'analyze_dataframe', real)
+    append_rows(filename, ['n{}\t{}\n'.format(i % 7, i)
+                           for i in range(200, 300)])
+    appended = analysis.analyze_dataframe_cached(filename, cache=cache)
+    assert real.call_count == 0
+    full = real.side_effect(filename)
+    assert appended['numrows'] == full['numrows'] == 300
+    name, value = appended['field_definitions']
+    full_name, full_value = full['field_definitions']
+    assert name == full_name
+    for key in ['count', 'mean', 'std', 'min', 'max']:
+        assert value[key] == pytest.approx(full_value[key])
+    assert value['50'] == pytest.approx(full_value['50'], rel=0.02)
+    assert appended['approximate']['fields'] == ['25', '50', '75']
+    assert 'approximate' not in first and 'approximate' not in full
+
+    # Changing earlier rows means the whole file is analyzed again
+    with open(filename, 'r+') as fh:
+        fh.write('name\tvalue\nchanged')
+    append_rows(filename, [])
+    analysis.analyze_dataframe_cached(filename, cache=cache)
+    assert real.call_count == 1
+
+
+def test_analyze_appended_rows_must_match_types(tmpdir):
+    filename = str(tmpdir.join('growing.tsv'))
+    with open(filename, 'w') as fh:
+        fh.write('value\n1\n2\n')
+    cache = TTLCache('analysis', 60, cache_dir=str(tmpdir))
+    analysis.analyze_dataframe_cached(filename, cache=cache)
+    append_rows(filename, ['three\n'])
+    ana = analysis.analyze_dataframe_cached(filename, cache=cache)
+    assert ana['numrows'] == 3
+    assert ana['field_definitions'][0]['type'] == 'string'
+
+
+def test_analyze_date_columns(tmpdir):
+    filename = str(tmpdir.join('dates.tsv'))
+    with open(filename, 'w') as fh:
+        fh.write('value\tdate\n1\t2019-01-01\n2\t2019-06-01\n'
+                 '3\t2019-12-31\n')
+    metadata = analyze_dataframe(filename)
+    value, date = metadata['field_definitions']
+    assert date['type'] == 'date'
+    assert date['count'] == 3
+    assert all(isinstance(date[k], str) for k in ['min', 'max'] if k in date)
+    assert value['mean'] == 2.0
+    # Dates aren't hinted, so hinted re-analysis gives the same stats
+    hints = get_dtype_hints(metadata['field_definitions'])
+    assert 'date' not in hints
+    assert analyze_dataframe(filename, dtypes=hints) == metadata
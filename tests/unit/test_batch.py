@@ -0,0 +1,18 @@
+from pilot.batch import run_concurrently
+
+
+def test_run_concurrently():
+    results = list(run_concurrently(lambda x: x * 2, range(10)))
+    assert sorted(r for _, r, _ in results) == [x * 2 for x in range(10)]
+
+
+def test_run_concurrently_errors():
+    def func(x):
+        if x == 3:
+            raise ValueError('bad item')
+        return x
+
+    results = {item: err for item, _, err in run_concurrently(func, range(5),
+                                                              rate_limit=100)}
+    assert isinstance(results[3], ValueError)
+    assert all(results[i] is None for i in [0, 1, 2, 4])
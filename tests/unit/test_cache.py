@@ -0,0 +1,54 @@
+import os
+import time
+import pilot.cache
+from pilot.cache import TTLCache
+
+
+def test_cache_set_get(tmpdir):
+    cache = TTLCache('test', 60, cache_dir=str(tmpdir))
+    assert cache.get('foo') is None
+    cache.set('foo', {'bar': 1})
+    assert cache.get('foo') == {'bar': 1}
+
+
+def test_cache_shared_on_disk(tmpdir):
+    TTLCache('test', 60, cache_dir=str(tmpdir)).set('foo', [1, 2])
+    assert TTLCache('test', 60, cache_dir=str(tmpdir)).get('foo') == [1, 2]
+    no_disk = TTLCache('test', 60, cache_dir=str(tmpdir), persist=False)
+    assert no_disk.get('foo') is None
+
+
+def test_cache_expires(tmpdir, monkeypatch):
+    cache = TTLCache('test', 60, cache_dir=str(tmpdir))
+    cache.set('foo', 'bar')
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert cache.get('foo') is None
+
+
+def test_cache_invalidate(tmpdir):
+    cache = TTLCache('test', 60, cache_dir=str(tmpdir))
+    cache.set('foo', 'bar')
+    cache.invalidate('foo')
+    assert cache.get('foo') is None
+
+
+def test_cache_removes_expired_files(tmpdir, monkeypatch):
+    cache = TTLCache('test', 60, cache_dir=str(tmpdir))
+    cache.set('foo', 'bar')
+    cache.set('baz', 'qux')
+    now = time.time()
+    with monkeypatch.context() as m:
+        m.setattr(time, 'time', lambda: now + 61)
+        assert TTLCache('test', 60, cache_dir=str(tmpdir)).get('foo') is None
+    assert not os.path.exists(cache._filename('foo'))
+    # Other expired files are pruned when a value is stored
+    os.utime(cache._filename('baz'), (now - 61, now - 61))
+    monkeypatch.setattr(pilot.cache, 'PRUNE_INTERVAL', 0)
+    cache.set('new', 1)
+    assert os.listdir(cache.path) == [os.path.basename(cache._filename('new'))]
+
+
+def test_cache_dir_default(tmpdir, monkeypatch):
+    monkeypatch.setattr(pilot.cache, 'CACHE_DIR', str(tmpdir))
+    assert TTLCache('test', 60).path == str(tmpdir.join('test'))
@@ -0,0 +1,93 @@
+from unittest.mock import Mock
+from click.testing import CliRunner
+from pilot.cache import TTLCache
+from pilot.checksums import (hash_file, get_checksums, get_block_manifest,
+                             get_merkle_root, find_bad_blocks, get_blocks)
+from pilot.commands.transfer import transfer_commands
+
+# Fixed data, so the corrupted bytes written below always differ from it
+DATA = bytes(range(256)) * 3 + bytes(range(255, 23, -1))
+
+
+def test_hash_file_checkpoint(tmpdir):
+    filename = str(tmpdir.join('data.tsv'))
+    with open(filename, 'wb') as fh:
+        fh.write(b'a' * 100 + b'b' * 50)
+    digests, prefix = hash_file(filename, ['sha256', 'md5'], checkpoint=100,
+                                block_size=32)
+    with open(str(tmpdir.join('prefix')), 'wb') as fh:
+        fh.write(b'a' * 100)
+    assert prefix == hash_file(str(tmpdir.join('prefix')),
+                               ['sha256', 'md5'])[0]
+    assert hash_file(filename, ['sha256'], checkpoint=200)[1] is None
+
+    cache = TTLCache('checksums', 60, cache_dir=str(tmpdir))
+    assert get_checksums(filename, ['sha256', 'md5'], cache) == digests
+
+
+def test_merkle_root():
+    leaves = ['{:064x}'.format(i) for i in range(5)]
+    roots = {get_merkle_root(leaves[:n]) for n in range(6)}
+    assert len(roots) == 6
+    assert get_merkle_root(leaves) != get_merkle_root(leaves[::-1])
+    # A leaf can't stand in for an inner node
+    assert get_merkle_root([get_merkle_root(leaves[:2])]) != \
+        get_merkle_root(leaves[:2])
+
+
+def test_block_manifest(tmpdir):
+    data = DATA
+    filename = str(tmpdir.join('data.bin'))
+    with open(filename, 'wb') as fh:
+        fh.write(data)
+    cache = TTLCache('checksums', 60, cache_dir=str(tmpdir))
+    blocks = get_block_manifest(filename, 256, workers=3, cache=cache)
+    assert blocks['size'] == 256
+    assert len(blocks['sha256']) == 4
+    assert blocks['merkle_root'] == get_merkle_root(blocks['sha256'])
+    assert find_bad_blocks(filename, blocks, 1000) == []
+
+    with open(filename, 'r+b') as fh:
+        fh.seek(300)
+        fh.write(bytes([data[300] ^ 0xff]))
+        fh.truncate(900)
+    assert find_bad_blocks(filename, blocks, 1000) == [(256, 256),
+                                                       (768, 232)]
+
+
+def test_download_repair(mock_command_pilot_cli, tmpdir, monkeypatch):
+    data = DATA
+    source = str(tmpdir.join('source.bin'))
+    with open(source, 'wb') as fh:
+        fh.write(data)
+    pc = mock_command_pilot_cli
+    pc.ls.return_value = {'name': 'data.bin'}
+    pc.get_globus_http_url = Mock(return_value='https://example.org/data.bin')
+    monkeypatch.setattr(type(pc), 'http_headers', {'Authorization': 'x'})
+    cache = TTLCache('checksums', 60, cache_dir=str(tmpdir))
+    pc.get_search_entry.return_value = {'files': [{
+        'filename': 'data.bin', 'length': 1000,
+        'blocks': get_block_manifest(source, 256, cache=cache)}]}
+
+    def get(url, headers):
+        start, end = headers['Range'][len('bytes='):].split('-')
+        return Mock(status_code=206, content=data[int(start):int(end) + 1])
+    requests_get = Mock(side_effect=get)
+    monkeypatch.setattr(transfer_commands.requests, 'get', requests_get)
+
+    monkeypatch.chdir(str(tmpdir))
+    with open('data.bin', 'wb') as fh:
+        fh.write(data[:600] + bytes(b ^ 0xff for b in data[600:610]) +
+                 data[610:800])
+    result = CliRunner().invoke(transfer_commands.download,
+                                ['foo/data.bin', '--repair'])
+    assert result.exit_code == 0, result.output
+    assert 'Fetched 2 of 4 blocks' in result.output
+    assert requests_get.call_count == 2
+    with open('data.bin', 'rb') as fh:
+        assert fh.read() == data
+
+
+def test_get_blocks():
+    assert get_blocks(10, 4) == [(0, 4), (4, 4), (8, 2)]
+    assert get_blocks(0, 4) == []
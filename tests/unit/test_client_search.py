@@ -0,0 +1,46 @@
+import pytest
+from unittest.mock import Mock
+from pilot import client
+from pilot.client import PilotClient
+from pilot.exc import PilotClientException
+
+
+def page(subjects, total):
+    return {'gmeta': [{'subject': s} for s in subjects],
+            'count': len(subjects), 'total': total}
+
+
+def test_iter_search_entries_scrolls():
+    pc = PilotClient()
+    pc._gsearch = Mock()
+    pc._gsearch.post.side_effect = [
+        {'gmeta': [{'subject': 'a'}, {'subject': 'b'}],
+         'has_next_page': True, 'marker': 'm1'},
+        {'gmeta': [{'subject': 'c'}], 'has_next_page': False},
+    ]
+    filters = [pc.get_prefix_filter('my_folder')]
+    entries = pc.iter_search_entries(page_size=2, filters=filters)
+    assert [e['subject'] for e in entries] == ['a', 'b', 'c']
+    (path,), first = pc._gsearch.post.call_args_list[0]
+    assert path == '/v1/index/{}/scroll'.format(pc.SEARCH_INDEX)
+    assert first['json_body'] == {'q': '*', 'limit': 2, 'filters': filters}
+    assert pc._gsearch.post.call_args[1]['json_body']['marker'] == 'm1'
+
+
+def test_iter_search_pages_stops_at_max_results(monkeypatch):
+    monkeypatch.setattr(client, 'SEARCH_MAX_RESULTS', 3)
+    pc = PilotClient()
+    pc._gsearch = Mock()
+    pc._gsearch.post_search.side_effect = [page(['a', 'b'], 5),
+                                           page(['c'], 5)]
+    pages = pc.iter_search_pages({'q': '*'}, page_size=2)
+    assert next(pages)['count'] == 2
+    assert next(pages)['count'] == 1
+    assert pc._gsearch.post_search.call_args[0][1]['limit'] == 1
+    with pytest.raises(PilotClientException):
+        next(pages)
+    # Asking for no more than the cap is fine
+    pc._gsearch.post_search.side_effect = [page(['a', 'b'], 5),
+                                           page(['c'], 5)]
+    assert len(list(pc.iter_search_pages({'q': '*'}, limit=3,
+                                         page_size=2))) == 2
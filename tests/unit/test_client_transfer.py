@@ -0,0 +1,136 @@
+import globus_sdk
+import requests
+from unittest.mock import Mock
+from pilot.batch import iter_results
+from pilot.cache import TTLCache
+from pilot.client import PilotClient
+
+
+def test_transfer_files_batches(mock_auth_pilot_cli, mock_transfer_client,
+                                monkeypatch):
+    gcp = Mock()
+    gcp.return_value.endpoint_id = 'local-endpoint'
+    monkeypatch.setattr(globus_sdk, 'LocalGlobusConnectPersonal', gcp)
+    items = [('/tmp/{}.tsv'.format(i), '{}.tsv'.format(i), 'my_folder')
+             for i in range(5)]
+    results = mock_auth_pilot_cli.transfer_files(items, sync_level='size',
+                                                 max_items=2)
+    assert len(results) == 3
+    batches = [batch for _, batch in results]
+    assert batches == [items[:2], items[2:4], items[4:]]
+    assert mock_transfer_client.call_count == 3
+    tdata_kwargs = globus_sdk.TransferData.call_args[1]
+    assert tdata_kwargs['sync_level'] == 'size'
+
+
+def ls_response(names):
+    return {'DATA': [{'name': n, 'type': 'file', 'size': 10,
+                      'last_modified': '2019-01-01 00:00:00+00:00'}
+                     for n in names]}
+
+
+def test_ls_uses_name_filter(tmpdir):
+    pc = PilotClient()
+    pc.ls_cache = TTLCache('ls', 60, cache_dir=str(tmpdir))
+    pc._gtransfer = Mock()
+    pc._gtransfer.operation_ls.return_value = ls_response(['foo.tsv'])
+    assert pc.ls('foo.tsv', 'my_folder', False)['size'] == 10
+    params = pc._gtransfer.operation_ls.call_args[1]
+    assert params['filter'] == 'name:foo.tsv'
+    # Second lookup is served from the cache
+    pc.ls('foo.tsv', 'my_folder', False)
+    assert pc._gtransfer.operation_ls.call_count == 1
+
+
+def test_ls_name_with_comma(tmpdir):
+    pc = PilotClient()
+    pc.ls_cache = TTLCache('ls', 60, cache_dir=str(tmpdir))
+    pc._gtransfer = Mock()
+    pc._gtransfer.operation_ls.return_value = ls_response(['a,b.tsv', 'c'])
+    assert pc.ls('a,b.tsv', 'my_folder', False)['name'] == 'a,b.tsv'
+    assert 'filter' not in pc._gtransfer.operation_ls.call_args[1]
+
+
+def test_ls_invalidated_by_upload(tmpdir, monkeypatch):
+    pc = PilotClient()
+    pc.ls_cache = TTLCache('ls', 60, cache_dir=str(tmpdir))
+    pc._gtransfer = Mock()
+    pc._gtransfer.operation_ls.return_value = ls_response([])
+    assert pc.ls('foo.tsv', 'my_folder', False) is None
+    assert pc.ls_dir('my_folder', False) == {}
+    monkeypatch.setattr(requests, 'put', Mock())
+    monkeypatch.setattr(type(pc), 'http_headers', {})
+    dataframe = tmpdir.join('foo.tsv')
+    dataframe.write('a\n1\n')
+    pc.upload(str(dataframe), 'my_folder')
+    pc._gtransfer.operation_ls.return_value = ls_response(['foo.tsv'])
+    assert pc.ls('foo.tsv', 'my_folder', False)['name'] == 'foo.tsv'
+    assert set(pc.ls_dir('my_folder', False)) == {'foo.tsv'}
+
+
+def test_ls_dir_pages_and_caches(tmpdir):
+    pc = PilotClient()
+    pc.ls_cache = TTLCache('ls', 60, cache_dir=str(tmpdir))
+    pc._gtransfer = Mock()
+    pc._gtransfer.operation_ls.side_effect = [
+        ls_response(['a', 'b']), ls_response(['c'])
+    ]
+    listing = pc.iter_ls('my_folder', False, page_size=2)
+    assert [f['name'] for f in listing] == ['a', 'b', 'c']
+    pc._gtransfer.operation_ls.side_effect = [ls_response(['a', 'b', 'c'])]
+    assert set(pc.ls_dir('my_folder', False)) == {'a', 'b', 'c'}
+    assert pc.ls('c', 'my_folder', False)['name'] == 'c'
+    assert pc.ls('d', 'my_folder', False) is None
+    assert pc._gtransfer.operation_ls.call_count == 3
+
+
+def test_describe_many(mock_auth_pilot_cli):
+    def get_entry(basename, directory, test):
+        if basename == 'missing.tsv':
+            raise ValueError('Missing')
+        return {'directory': directory}
+    mock_auth_pilot_cli.get_search_entry.side_effect = get_entry
+    paths = ['foo/a.tsv', 'bar/b.tsv', 'foo/missing.tsv']
+    futures = mock_auth_pilot_cli.describe_many(paths)
+    assert list(futures.values()) == paths
+    results = {path: (result, error)
+               for path, result, error in iter_results(futures)}
+    assert results['bar/b.tsv'] == ({'directory': 'bar'}, None)
+    assert isinstance(results['foo/missing.tsv'][1], ValueError)
+    mock_auth_pilot_cli.shutdown()
+
+
+def test_ingest_many(mock_auth_pilot_cli):
+    mock_auth_pilot_cli.ingest_entry.return_value = True
+    entries = [{'subject': 'a'}, {'subject': 'b'}]
+    futures = mock_auth_pilot_cli.ingest_many(entries, test=True)
+    assert sorted(r for _, r, _ in iter_results(futures)) == [True, True]
+    mock_auth_pilot_cli.ingest_entry.assert_any_call(entries[1], True)
+
+
+def test_field_table_file(mock_auth_pilot_cli, monkeypatch):
+    pc = mock_auth_pilot_cli
+    monkeypatch.setattr(type(pc), 'http_headers', {})
+    stored = {}
+
+    def put(url, headers, data, allow_redirects):
+        stored[url] = data.decode('utf-8')
+        return Mock(status_code=200)
+
+    def get(url, headers):
+        if url not in stored:
+            return Mock(status_code=404)
+        return Mock(status_code=200, text=stored[url])
+    monkeypatch.setattr(requests, 'put', put)
+    monkeypatch.setattr(requests, 'get', get)
+    table = {'name': ['a', 'b'], 'type': ['float64', 'string'],
+             'mean': [1.5, None]}
+    pc.upload_field_table(table, 'foo.tsv', 'my_folder')
+    assert list(stored) == [pc.get_globus_http_url('foo.tsv.fields.jsonl',
+                                                   'my_folder')]
+    assert pc.get_field_table('foo.tsv', 'my_folder') == table
+
+    # Older records kept it in a search entry
+    pc._gsearch = Mock()
+    pc._gsearch.get_entry.return_value = {'content': [{'field_table': table}]}
+    assert pc.get_field_table('old.tsv', 'my_folder') == table
@@ -0,0 +1,52 @@
+import json
+from unittest.mock import Mock
+from click.testing import CliRunner
+from pilot import analysis
+from pilot.cache import TTLCache
+from pilot.commands.analysis.analyze_commands import analyze, get_field_rows
+
+
+def test_analyze_dataframe_cached(simple_tsv, tmpdir, monkeypatch):
+    cache = TTLCache('analysis', 60, cache_dir=str(tmpdir))
+    real = Mock(side_effect=analysis.analyze_dataframe)
+    monkeypatch.setattr(analysis, 'analyze_dataframe', real)
+    first = analysis.analyze_dataframe_cached(simple_tsv, cache=cache)
+    first['numrows'] = 'modified'
+    second = analysis.analyze_dataframe_cached(simple_tsv, cache=cache)
+    assert second['numrows'] == 99
+    assert real.call_count == 1
+    analysis.analyze_dataframe_cached(simple_tsv, cache=cache, sample_size=5)
+    assert real.call_count == 2
+
+
+def test_analysis_cache_key_dtypes(simple_tsv):
+    key = analysis.get_analysis_cache_key(simple_tsv)
+    hinted = analysis.get_analysis_cache_key(simple_tsv,
+                                             dtypes={'numbers': 'string'})
+    assert key != hinted
+    assert hinted == analysis.get_analysis_cache_key(
+        simple_tsv, dtypes={'numbers': 'string'})
+
+
+def test_analyze_command_jsonl(simple_tsv, tmpdir):
+    output = str(tmpdir.join('out.jsonl'))
+    bad = tmpdir.join('bad.py')
+    bad.write('print("not a dataframe")')
+    runner = CliRunner()
+    result = runner.invoke(analyze, [simple_tsv, str(bad), '-o', output,
+                                     '--workers', '2', '--no-cache'])
+    assert result.exit_code == 0
+    assert 'Analyzed 1 of 2 dataframes' in result.output
+    with open(output) as fh:
+        results = [json.loads(line) for line in fh]
+    assert len(results) == 1
+    assert results[0]['field_metadata']['numrows'] == 99
+
+
+def test_get_field_rows(simple_tsv):
+    metadata = analysis.analyze_dataframe(simple_tsv)
+    rows = get_field_rows({'filename': simple_tsv,
+                           'field_metadata': metadata})
+    assert [r['name'] for r in rows] == ['Numbers', 'Title']
+    assert rows[0]['mean'] == 50.0 and rows[0]['top'] is None
+    assert rows[1]['top'] == 'baz'
@@ -0,0 +1,82 @@
+from unittest.mock import Mock
+from click.testing import CliRunner
+from pilot.commands.search.delete import delete_command
+
+
+def test_delete_single(mock_command_pilot_cli):
+    mock_command_pilot_cli.delete_subject_entry = Mock(return_value={})
+    runner = CliRunner()
+    result = runner.invoke(delete_command, ['my_folder/foo.tsv'])
+    assert result.exit_code == 0
+    assert 'Removed my_folder/foo.tsv Successfully' in result.output
+    mock_command_pilot_cli.delete_subject_entry.assert_called_once()
+
+
+def test_delete_many_from_stdin(mock_command_pilot_cli):
+    mock_command_pilot_cli.delete_subject_entry = Mock(
+        return_value={'task_id': 'abc'})
+    mock_command_pilot_cli.wait_for_tasks = Mock(
+        return_value={'abc': 'SUCCESS'})
+    runner = CliRunner()
+    paths = '\n'.join(['my_folder/{}.tsv'.format(i) for i in range(10)])
+    result = runner.invoke(delete_command, ['my_folder/extra.tsv', '-f', '-',
+                                            '--yes'], input=paths)
+    assert result.exit_code == 0
+    assert mock_command_pilot_cli.delete_subject_entry.call_count == 11
+    mock_command_pilot_cli.wait_for_tasks.assert_called_once()
+    assert 'Removed 11 of 11 entries' in result.output
+
+
+def test_delete_by_query(mock_command_pilot_cli):
+    mock_command_pilot_cli.delete_by_query = Mock(return_value='abc')
+    mock_command_pilot_cli.wait_for_tasks = Mock(
+        return_value={'abc': 'SUCCESS'})
+    runner = CliRunner()
+    result = runner.invoke(delete_command, ['--query', 'foo', '--yes'])
+    assert result.exit_code == 0
+    mock_command_pilot_cli.delete_by_query.assert_called_once_with('foo',
+                                                                   False)
+
+
+def test_delete_by_prefix(mock_command_pilot_cli):
+    pc = mock_command_pilot_cli
+    pc.delete_by_query = Mock(return_value='abc')
+    pc.wait_for_tasks = Mock(return_value={'abc': 'SUCCESS'})
+    result = CliRunner().invoke(delete_command, ['--prefix', 'my_folder',
+                                                 '--yes'])
+    assert result.exit_code == 0
+    assert 'Delete by prefix finished: SUCCESS' in result.output
+    query, test = pc.delete_by_query.call_args[0]
+    assert (query, test) == ('*', False)
+    prefix_filter, = pc.delete_by_query.call_args[1]['filters']
+    assert prefix_filter['field_name'] == 'files.url'
+    assert prefix_filter['value'] == pc.get_globus_http_url(
+        '', 'my_folder') + '*'
+
+
+def test_delete_by_prefix_rejects_entry_options(mock_command_pilot_cli):
+    pc = mock_command_pilot_cli
+    pc.delete_by_query = Mock(return_value='abc')
+    for args in [['--prefix', 'my_folder', '--entry-id', 'foo'],
+                 ['--prefix', 'my_folder', '--subject', 'yes'],
+                 ['--query', 'foo', '--entry-id', 'null']]:
+        result = CliRunner().invoke(delete_command, args + ['--yes'])
+        assert result.exit_code == 2
+        assert "can't be used with --prefix or --query" in result.output
+    assert not pc.delete_by_query.called
+
+
+def test_delete_by_prefix_dry_run(mock_command_pilot_cli):
+    pc = mock_command_pilot_cli
+    subject = pc.get_subject_url('foo.tsv', 'my_folder')
+    pc._gsearch = Mock()
+    pc._gsearch.post.return_value = {'gmeta': [{'subject': subject}],
+                                     'has_next_page': False}
+    pc.delete_by_query = Mock()
+    result = CliRunner().invoke(delete_command, ['--prefix', 'my_folder',
+                                                 '--dry-run'])
+    assert result.exit_code == 0
+    assert 'Search Entry: {}'.format(subject) in result.output
+    query_doc = pc._gsearch.post.call_args[1]['json_body']
+    assert query_doc['filters'] == [pc.get_prefix_filter('my_folder')]
+    assert not pc.delete_by_query.called
@@ -0,0 +1,134 @@
+from unittest.mock import Mock
+from click.testing import CliRunner
+from pilot.commands.search.promote_commands import promote
+from pilot.diff import canonical_hash
+from tests.unit.mocks import GlobusTransferTaskResponse
+
+SUBJECT = 'globus://ebf55996-33bf-11e9-9fa4-0a06afd4a22e{}'
+URL = 'https://ebf55996-33bf-11e9-9fa4-0a06afd4a22e.e.globus.org{}'
+
+
+def result(path, title, field_table=None):
+    content = {'dc': {'titles': [{'title': title}]},
+               'files': [{'url': URL.format(path)}]}
+    content['content_hash'] = canonical_hash(content)
+    contents = [content]
+    if field_table:
+        contents.append({'field_table': field_table})
+    return {'subject': SUBJECT.format(path), 'content': contents}
+
+
+def search(test_records, prod_records):
+    """Mock iter_search_entries(), applying prefix filters like Search"""
+    def iter_search_entries(test, filters=None):
+        records = test_records if test else prod_records
+        if filters:
+            prefix = filters[0]['value'].rstrip('*')
+            records = [r for r in records
+                       if r['content'][0]['files'][0]['url'].startswith(
+                           prefix)]
+        return records
+    return Mock(side_effect=iter_search_entries)
+
+
+def test_promote(mock_command_pilot_cli, mock_config):
+    pc = mock_command_pilot_cli
+    field_table = {'name': ['DRUG_ID'], 'reference': [
+        {'resource': SUBJECT.format('/test/metadata/drugs.tsv')}]}
+    test_records = [
+        result('/test/foo/new.tsv', 'new', field_table=field_table),
+        result('/test/foo/same.tsv', 'same'),
+        result('/test/foo/changed.tsv', 'changed'),
+        result('/test/bar/other.tsv', 'other'),
+    ]
+    prod_records = [
+        result('/restricted/dataframes/foo/same.tsv', 'same'),
+        result('/restricted/dataframes/foo/changed.tsv', 'old title'),
+    ]
+    pc.iter_search_entries = search(test_records, prod_records)
+    ingested = []
+    pc.ingest_entry = Mock(side_effect=lambda gmeta, test: ingested.append(
+        (gmeta, test)))
+    pc.upload_field_table = Mock(return_value=Mock(status_code=200))
+    pc.copy_files = Mock()
+
+    runner = CliRunner()
+    res = runner.invoke(promote, ['--prefix', 'foo'])
+    assert res.exit_code == 0
+    assert '1 records promoted, 0 failed, 1 already up to date, 1 skipped' \
+        in res.output
+    assert len(ingested) == 1
+    gmeta, test = ingested[0]
+    assert test is False
+    entries = gmeta['ingest_data']['gmeta']
+    assert [(e['subject'], e['id']) for e in entries] == [
+        (SUBJECT.format('/restricted/dataframes/foo/new.tsv'), 'metadata'),
+    ]
+    # Urls and references are moved to production
+    content = entries[0]['content']
+    assert content['files'][0]['url'] == \
+        URL.format('/restricted/dataframes/foo/new.tsv')
+    assert content['field_metadata']['field_table_url'] == \
+        URL.format('/restricted/dataframes/foo/new.tsv.fields.jsonl')
+    assert content['content_hash'] == canonical_hash(content)
+    table, filename, directory, test = pc.upload_field_table.call_args[0]
+    assert (filename, directory, test) == ('new.tsv', 'foo', False)
+    assert table['reference'][0]['resource'] == \
+        SUBJECT.format('/restricted/dataframes/metadata/drugs.tsv')
+    # Data files are left alone unless --copy-files is given
+    assert not pc.copy_files.called
+
+    ingested.clear()
+    res = runner.invoke(promote, ['-u'])
+    assert res.exit_code == 0
+    subjects = {e['subject'] for g, _ in ingested
+                for e in g['ingest_data']['gmeta']}
+    assert len(subjects) == 3
+
+
+def test_promote_copy_files(mock_command_pilot_cli, mock_config):
+    pc = mock_command_pilot_cli
+    pc.iter_search_entries = search([result('/test/foo/copied.tsv', 'a'),
+                                     result('/test/foo/lost.tsv', 'b')], [])
+    calls = []
+    tasks = {}
+
+    def copy_files(items):
+        calls.append('copy')
+        copies = [(GlobusTransferTaskResponse(), [item]) for item in items]
+        tasks.update({t['task_id']: i[0][0] for t, i in copies})
+        return copies
+    pc.copy_files = Mock(side_effect=copy_files)
+    pc.wait_for_transfers = Mock(side_effect=lambda task_ids: {
+        tid: 'FAILED' if tasks[tid].endswith('lost.tsv') else 'SUCCEEDED'
+        for tid in task_ids})
+    ingested = []
+    pc.ingest_entry = Mock(side_effect=lambda gmeta, test: (
+        calls.append('ingest'), ingested.extend(
+            e['subject'] for e in gmeta['ingest_data']['gmeta'])))
+
+    res = CliRunner().invoke(promote, ['--copy-files'])
+    assert res.exit_code == 0
+    # Files are copied before their records are ingested
+    assert calls == ['copy', 'ingest']
+    assert sorted(pc.copy_files.call_args[0][0]) == [
+        ('/test/foo/copied.tsv', '/restricted/dataframes/foo/copied.tsv'),
+        ('/test/foo/lost.tsv', '/restricted/dataframes/foo/lost.tsv'),
+    ]
+    assert ingested == [
+        SUBJECT.format('/restricted/dataframes/foo/copied.tsv')]
+    assert 'Failed to copy the files of {}'.format(
+        SUBJECT.format('/restricted/dataframes/foo/lost.tsv')) in res.output
+    assert '1 records promoted, 1 failed' in res.output
+
+
+def test_promote_dry_run(mock_command_pilot_cli):
+    pc = mock_command_pilot_cli
+    pc.copy_files = Mock()
+    pc.iter_search_entries = search([result('/test/foo/a.tsv', 'a')], [])
+    res = CliRunner().invoke(promote, ['--dry-run'])
+    assert res.exit_code == 0
+    assert 'Would promote {}'.format(
+        SUBJECT.format('/restricted/dataframes/foo/a.tsv')) in res.output
+    assert not pc.ingest_entry.called
+    assert not pc.copy_files.called
@@ -0,0 +1,61 @@
+import datetime
+import json
+from unittest.mock import Mock
+from click.testing import CliRunner
+from pilot.commands.search.search_commands import list_command, gen_list_query
+
+RECORD = {
+    'dc': {'titles': [{'title': 'My Dataframe'}]},
+    'ncipilot': {'data_type': 'Drug Response', 'dataframe_type': 'Matrix'},
+    'field_metadata': {'numrows': 10, 'numcols': 3},
+    'files': [{'url': 'https://example.com/test/my_folder/foo.tsv',
+               'length': 2048}],
+}
+
+
+def test_gen_list_query():
+    since = datetime.datetime(2019, 3, 1)
+    query = gen_list_query(None, [('data_type', 'Drug Response'),
+                                  ('data_type', 'Other'),
+                                  ('files.length', '10')], since)
+    assert query['q'] == '*'
+    filters = {f['field_name']: f for f in query['filters']}
+    assert filters['ncipilot.data_type']['values'] == ['Drug Response',
+                                                       'Other']
+    assert filters['files.length']['values'] == ['10']
+    assert filters['dc.dates.date']['type'] == 'range'
+
+
+def test_list_filters_and_facets(mock_command_pilot_cli):
+    page = {
+        'total': 1, 'count': 1,
+        'gmeta': [{'subject': 'foo', 'content': [RECORD]}],
+        'facet_results': [{'name': 'Data Type', 'buckets': [
+            {'value': 'Drug Response', 'count': 1}]}],
+    }
+    mock_command_pilot_cli.iter_search_pages = Mock(return_value=[page])
+    runner = CliRunner()
+    result = runner.invoke(list_command, ['--data-type', 'Drug Response',
+                                          '--facets'])
+    assert result.exit_code == 0
+    assert 'My Dataframe' in result.output
+    assert 'Drug Response' in result.output
+    query_doc = mock_command_pilot_cli.iter_search_pages.call_args[0][0]
+    assert query_doc['filters'][0]['values'] == ['Drug Response']
+    assert query_doc['facets']
+
+
+def test_list_json_merges_pages(mock_command_pilot_cli):
+    pages = [{'@datatype': 'GSearchResult', 'total': 3, 'count': count,
+              'offset': offset, 'has_next_page': True,
+              'gmeta': [{'subject': 'foo', 'content': [RECORD]}] * count}
+             for offset, count in [(0, 2), (2, 1)]]
+    mock_command_pilot_cli.iter_search_pages = Mock(return_value=pages)
+    result = CliRunner().invoke(list_command, ['--json'])
+    assert result.exit_code == 0
+    output = json.loads(result.output)
+    # Same shape as a single search response
+    assert output['@datatype'] == 'GSearchResult'
+    assert (output['count'], output['offset'], output['total']) == (3, 0, 3)
+    assert output['has_next_page'] is False
+    assert len(output['gmeta']) == 3
@@ -0,0 +1,111 @@
+from unittest.mock import Mock
+from click.testing import CliRunner
+from pilot.commands.transfer.status_commands import status
+from pilot.progress import TransferProgress, MIN_POLL_INTERVAL
+from tests.unit.mocks import GlobusTransferTaskResponse
+
+
+def task_doc(task_id, rate, completed='2019-05-01T12:00:00+00:00'):
+    return Mock(data={
+        'task_id': task_id, 'status': 'SUCCEEDED',
+        'completion_time': completed, 'bytes_transferred': rate * 10,
+        'effective_bytes_per_second': rate, 'faults': 1, 'files': 1,
+        'files_transferred': 1, 'files_skipped': 0,
+    })
+
+
+def test_status_stats(mock_command_pilot_cli, mock_config, monkeypatch):
+    tasks = [GlobusTransferTaskResponse() for _ in range(3)]
+    for task in tasks:
+        mock_config.add_transfer_log(task, 'foo/bar')
+    docs = [task_doc(t.data['task_id'], (i + 1) * 10 ** 6)
+            for i, t in enumerate(tasks)]
+    task_list = Mock(return_value=Mock(data=docs))
+    monkeypatch.setattr(mock_command_pilot_cli.gtransfer, 'task_list',
+                        task_list)
+
+    result = CliRunner().invoke(status, ['--stats', '--period', 'month'])
+    assert result.exit_code == 0
+    assert task_list.call_count == 1
+    assert 'task_id:' in task_list.call_args[1]['filter']
+    row = result.output.splitlines()[-1].split()
+    assert row == ['2019-05', '3', '60.0', '1.2', '2.0', '2.8', '3']
+
+    # Stats were saved, so they aren't fetched again
+    result = CliRunner().invoke(status, ['--stats'])
+    assert result.exit_code == 0
+    assert task_list.call_count == 1
+
+
+def running(task_id, status, nbytes, files_transferred, faults=0):
+    return Mock(data={
+        'task_id': task_id, 'status': status, 'bytes_transferred': nbytes,
+        'files': 4, 'files_transferred': files_transferred,
+        'files_skipped': 0, 'faults': faults,
+        'completion_time': '2019-05-01T12:00:00+00:00',
+        'effective_bytes_per_second': 100,
+    })
+
+
+def event(code, time):
+    return {'code': code, 'time': time, 'description': code.lower(),
+            'details': ''}
+
+
+def test_status_follow(mock_command_pilot_cli, mock_config, monkeypatch):
+    monkeypatch.setattr('pilot.commands.transfer.status_commands.time.sleep',
+                        Mock())
+    tc = mock_command_pilot_cli.gtransfer
+    task_list = Mock(side_effect=[
+        Mock(data=[running('t1', 'ACTIVE', 100, 1)]),
+        Mock(data=[running('t1', 'ACTIVE', 100, 1)]),
+        Mock(data=[running('t1', 'SUCCEEDED', 400, 4, faults=1)]),
+    ])
+    monkeypatch.setattr(tc, 'task_list', task_list)
+    first = event('STARTED', '2019-05-01T11:00:00+00:00')
+    fault = event('CONNECTION_RESET', '2019-05-01T11:30:00+00:00')
+    done = event('SUCCEEDED', '2019-05-01T12:00:00+00:00')
+    get = Mock(side_effect=[{'DATA': [first]}, {'DATA': [done, fault, first]}])
+    monkeypatch.setattr(tc, 'get', get)
+
+    result = CliRunner().invoke(status, ['t1', '--follow'])
+    assert result.exit_code == 0, result.output
+    assert task_list.call_count == 3
+    # Events are only fetched when the task changed
+    assert get.call_count == 2
+    lines = result.output.splitlines()
+    assert len([line for line in lines if 'STARTED' in line]) == 1
+    assert lines.index(next(i for i in lines if 'CONNECTION_RESET' in i)) < \
+        lines.index(next(i for i in lines if ' SUCCEEDED:' in i))
+    assert '1 done' in lines[-1]
+
+
+def test_status_follow_failed(mock_command_pilot_cli, mock_config,
+                              monkeypatch):
+    gccr = GlobusTransferTaskResponse()
+    mock_config.add_transfer_log(gccr, 'foo/bar')
+    tid = gccr.data['task_id']
+    tc = mock_command_pilot_cli.gtransfer
+    monkeypatch.setattr(tc, 'task_list', Mock(
+        return_value=Mock(data=[running(tid, 'FAILED', 0, 0)])))
+    monkeypatch.setattr(tc, 'get', Mock(return_value={'DATA': []}))
+    result = CliRunner().invoke(status, ['--follow'])
+    assert result.exit_code == 1
+    assert 'Transfers failed' in result.output
+    assert mock_config.get_transfer_log()[0]['status'] == 'FAILED'
+
+
+def test_transfer_progress_rate_and_interval():
+    clock = Mock(side_effect=[0, 10, 20])
+    tracker = TransferProgress(['t1'], clock=clock)
+    doc = {'status': 'ACTIVE', 'files': 4, 'files_transferred': 1,
+           'bytes_transferred': 100}
+    assert tracker.update({'t1': doc}) == ['t1']
+    assert tracker.get_eta() is None
+    assert tracker.update({'t1': dict(doc, bytes_transferred=200,
+                                      files_transferred=2)}) == ['t1']
+    assert tracker.rate == 10
+    assert tracker.get_eta() == 20
+    assert tracker.update({'t1': dict(doc, bytes_transferred=200,
+                                      files_transferred=2)}) == []
+    assert tracker.interval > MIN_POLL_INTERVAL
@@ -1,6 +1,7 @@
 import os
 from unittest.mock import Mock
 from click.testing import CliRunner
+import pilot.search
 from pilot.commands.transfer.transfer_commands import upload
 from tests.unit.mocks import COMMANDS_FILE_BASE_DIR
 
@@ -32,3 +33,49 @@ def test_upload_gcp_log(mock_command_pilot_cli, mock_config):
                                     '-j', m_file,
                                     '--no-analyze'])
     assert result.exit_code == 0
+
+
+def test_upload_both_indexes(mock_command_pilot_cli, monkeypatch):
+    monkeypatch.setattr(pilot.search, 'get_creator_name', lambda: 'User, Test')
+    test_file = os.path.join(COMMANDS_FILE_BASE_DIR,
+                             'test_file_zero_length.txt')
+    m_file = os.path.join(COMMANDS_FILE_BASE_DIR,
+                          'test_command_upload_minimal.json')
+    filename = os.path.basename(test_file)
+    pc = mock_command_pilot_cli
+    pc.upload.return_value = Mock(status_code=200)
+    pc.get_search_entry.return_value = None
+    args = [test_file, 'my_folder', '--no-gcp', '-j', m_file, '--no-analyze',
+            '--test', '--both-indexes']
+    result = CliRunner().invoke(upload, args)
+    assert result.exit_code == 0
+    calls = {c[0][1]: c[0][0] for c in pc.ingest_entry.call_args_list}
+    assert set(calls) == {True, False}
+    records = {}
+    for test, gmeta in calls.items():
+        entry = gmeta['ingest_data']['gmeta'][0]
+        assert entry['subject'] == pc.get_subject_url(filename, 'my_folder',
+                                                      test)
+        records[test] = entry['content']
+        assert records[test]['files'][0]['url'] == pc.get_globus_http_url(
+            filename, 'my_folder', test)
+    assert {c[0][2] for c in pc.upload.call_args_list} == {True, False}
+
+    # Each index is compared with its own record, only production changed
+    pc.ingest_entry.reset_mock()
+    pc.upload.reset_mock()
+    pc.get_search_entry.side_effect = lambda name, dest, test: (
+        records[True] if test else None)
+    pc.ls.return_value = {'size': 0}
+    result = CliRunner().invoke(upload, args + ['-u'])
+    assert result.exit_code == 0
+    assert [c[0][1] for c in pc.ingest_entry.call_args_list] == [False]
+    assert [c[0][2] for c in pc.upload.call_args_list] == [False]
+
+
+def test_upload_destination_is_local_file(mock_command_pilot_cli):
+    test_file = os.path.join(COMMANDS_FILE_BASE_DIR,
+                             'test_file_zero_length.txt')
+    result = CliRunner().invoke(upload, [test_file, test_file, '--no-gcp'])
+    assert 'is a local file' in result.output
+    assert not mock_command_pilot_cli.upload.called
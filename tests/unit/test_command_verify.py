@@ -0,0 +1,59 @@
+import json
+from unittest.mock import Mock
+from click.testing import CliRunner
+import pilot
+from pilot.commands.transfer.verify_commands import verify
+
+URL = 'https://ebf55996-33bf-11e9-9fa4-0a06afd4a22e.e.globus.org'
+
+
+def record(subject, *files):
+    return {'subject': subject, 'content': [{'files': [
+        {'url': '{}/restricted/dataframes/{}'.format(URL, name),
+         'filename': name.split('/')[-1], 'length': length, 'sha256': 'abc'}
+        for name, length in files
+    ]}]}
+
+
+def test_verify(mock_command_pilot_cli, monkeypatch):
+    pc = mock_command_pilot_cli
+    pc.iter_search_entries = Mock(return_value=[
+        record('a', ('foo/a.tsv', 10)),
+        record('b', ('foo/b.tsv', 10)),
+        record('c', ('bar/c.tsv', 10), ('bar/d.tsv', 10)),
+        record('e', ('baz/e.tsv', 10)),
+        {'subject': 'f', 'content': [{'dc': {}}]},
+    ])
+    listings = {
+        'foo': {'a.tsv': {'size': 10}, 'b.tsv': {'size': 20}},
+        'bar': {'c.tsv': {'size': 10}},
+    }
+
+    def ls_dir(directory, test):
+        if directory not in listings:
+            raise ValueError('No such directory')
+        return listings[directory]
+    pc.ls_dir = Mock(side_effect=ls_dir)
+    pc.verify_checksums = Mock(return_value=[{'task_id': 'task1'}])
+    add_log = Mock()
+    monkeypatch.setattr(pilot.config.config, 'add_transfer_log', add_log)
+
+    runner = CliRunner()
+    result = runner.invoke(verify, ['--checksum', 'ep:/scratch'])
+    assert result.exit_code == 0
+    problems = {p['subject']: p for p in map(json.loads,
+                                             result.stdout.splitlines())}
+    assert problems['b']['problem'] == 'size_mismatch'
+    assert problems['b']['actual'] == 20
+    assert problems['c']['problem'] == 'missing'
+    assert problems['e']['problem'] == 'list_failed'
+    assert problems['f']['problem'] == 'no_files'
+    assert 'a' not in problems
+    assert pc.ls_dir.call_count == 3
+    checksums, endpoint, path = pc.verify_checksums.call_args[0]
+    assert sorted(checksums) == [
+        ('/restricted/dataframes/bar/c.tsv', 'SHA256', 'abc'),
+        ('/restricted/dataframes/foo/a.tsv', 'SHA256', 'abc'),
+    ]
+    assert (endpoint, path) == ('ep', '/scratch')
+    assert add_log.call_count == 1
@@ -1,3 +1,4 @@
+from pilot.config import parse_timestamp
 from tests.unit.mocks import GlobusTransferTaskResponse
 
 
@@ -27,3 +28,27 @@ def test_update_transfer_log(mock_config):
     mock_config.update_transfer_log(gccr.data['task_id'], 'complete')
     tlog = mock_config.get_transfer_log_by_task(gccr.data['task_id'])
     assert tlog['status'] == 'complete'
+
+
+def test_transfer_log_stats(mock_config):
+    gccr = GlobusTransferTaskResponse()
+    mock_config.add_transfer_log(gccr, 'foo/bar')
+    mock_config.update_transfer_logs({gccr.data['task_id']: {
+        'status': 'SUCCEEDED',
+        'completion_time': parse_timestamp('2019-05-01T12:00:00+00:00'),
+        'bytes_transferred': 2000, 'effective_bytes_per_second': 1000,
+        'faults': 0, 'files': 1, 'files_transferred': 1,
+        'files_skipped': None,
+    }})
+    tlog = mock_config.get_transfer_log_by_task(gccr.data['task_id'])
+    assert tlog['status'] == 'SUCCEEDED'
+    assert tlog['effective_bytes_per_second'] == 1000
+    assert tlog['completion_time'].timestamp() == 1556712000
+    assert 'files_skipped' not in tlog
+
+
+def test_transfer_log_without_stats(mock_config):
+    mock_config.data = {'transfer_log': {'0': 'foo/bar,SUCCEEDED,abc,1'}}
+    tlog = mock_config.get_transfer_log()[0]
+    assert tlog['task_id'] == 'abc'
+    assert 'completion_time' not in tlog
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import threading
+import click
+import pytest
+
+from pilot import daemon
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument('name')
+def status(name):
+    click.echo('Hello {} from {}'.format(name, os.getcwd()))
+
+
+@cli.command()
+def list():
+    raise click.ClickException('Bad things')
+
+
+@pytest.fixture
+def server():
+    # Unix socket paths are limited to ~100 characters, so avoid tmp_path
+    dirname = tempfile.mkdtemp(prefix='pilot')
+    socket_path = os.path.join(dirname, 'pilot.sock')
+    srv = daemon.PilotServer(socket_path, cli)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path
+    srv.shutdown()
+    srv.server_close()
+    shutil.rmtree(dirname)
+
+
+def test_run_command_output_and_cwd(tmp_path):
+    result = daemon.run_command(cli, ['status', 'foo'], str(tmp_path))
+    assert result['exit_code'] == 0
+    assert result['output'] == 'Hello foo from {}\n'.format(tmp_path)
+    assert os.getcwd() != str(tmp_path)
+
+
+def test_run_command_errors():
+    result = daemon.run_command(cli, ['list'], os.getcwd())
+    assert result['exit_code'] == 1
+    assert 'Bad things' in result['output']
+    result = daemon.run_command(cli, ['nope'], os.getcwd())
+    assert result['exit_code'] == 2
+
+
+def test_forward(server, capsys):
+    assert daemon.forward(['status', 'bar'], server) == 0
+    assert 'Hello bar' in capsys.readouterr().out
+    assert daemon.forward(['list'], server) == 1
+
+
+def test_forward_skips(server, monkeypatch):
+    assert daemon.forward(['login'], server) is None
+    assert daemon.forward(['upload', 'foo.tsv', 'foo'], server) is None
+    assert daemon.forward(['status', '--follow'], server) is None
+    assert daemon.forward(['status', 'bar'], server + '.missing') is None
+    monkeypatch.setenv(daemon.NO_DAEMON_ENV, '1')
+    assert daemon.forward(['status', 'bar'], server) is None
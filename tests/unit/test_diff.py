@@ -0,0 +1,49 @@
+from pilot.diff import (canonical_hash, get_content_hash, diff, format_diff,
+                        CONTENT_HASH_KEY, ADDED, REMOVED, CHANGED)
+from pilot.search import update_metadata
+
+RECORD = {
+    'dc': {'version': '1', 'titles': [{'title': 'foo'}],
+           'dates': [{'dateType': 'Created', 'date': '2019'}]},
+    'files': [{'url': 'https://example.com/foo.tsv', 'filename': 'foo.tsv',
+               'length': 10, 'md5': 'abc'}],
+    'field_metadata': {'numrows': 10, 'field_definitions': [{'name': 'a'}]},
+    'ncipilot': {'data_type': 'Drug Response'},
+}
+
+
+def test_canonical_hash():
+    reordered = dict(reversed(list(RECORD.items())))
+    assert canonical_hash(reordered) == canonical_hash(RECORD)
+    hashed = dict(RECORD, **{CONTENT_HASH_KEY: 'stored'})
+    assert canonical_hash(hashed) == canonical_hash(RECORD)
+    assert get_content_hash(hashed) == 'stored'
+    assert get_content_hash(None) is None
+    assert canonical_hash(dict(RECORD, ncipilot={})) != canonical_hash(RECORD)
+
+
+def test_diff():
+    new = dict(RECORD, dc=dict(RECORD['dc'], version='2',
+                               dates=RECORD['dc']['dates'] + [{'d': 1}]))
+    del new['ncipilot']
+    new['extra'] = True
+    changes = diff(RECORD, new)
+    assert (CHANGED, 'dc.version', '1', '2') in changes
+    assert (ADDED, 'dc.dates[1]', None, {'d': 1}) in changes
+    assert (REMOVED, 'ncipilot', {'data_type': 'Drug Response'},
+            None) in changes
+    assert len(changes) == 4
+    assert diff(RECORD, dict(RECORD)) == []
+    assert '~ dc.version: "1" -> "2"' in format_diff(changes)
+
+
+def test_update_metadata_shares_untouched_subtrees():
+    scraped = dict(RECORD, files=[dict(RECORD['files'][0], md5='new')],
+                   field_metadata={})
+    metadata = update_metadata(scraped, RECORD, {'title': 'bar'})
+    assert RECORD['dc']['version'] == '1'
+    assert len(RECORD['dc']['dates']) == 1
+    assert RECORD['dc']['titles'] == [{'title': 'foo'}]
+    assert metadata['dc']['version'] == '2'
+    assert metadata['field_metadata'] is RECORD['field_metadata']
+    assert metadata[CONTENT_HASH_KEY] == canonical_hash(metadata)
@@ -0,0 +1,71 @@
+import io
+import json
+import threading
+from pilot.diff import canonical_hash
+from pilot.search import (gen_gmeta, relocate_record, relocate_field_table,
+                          GMetaBuilder, GMETA_LIST)
+
+RECORD = {
+    'dc': {'titles': [{'title': 'foo'}]},
+    'ncipilot': {'data_type': 'Drug Response', 'dataframe_type': 'Matrix'},
+    'files': [{'filename': 'foo.tsv', 'data_type': 'Drug Response',
+               'mime_type': 'text/tab-separated-values'}],
+}
+
+
+def test_gen_gmeta_is_fresh_each_call():
+    for _ in range(3):
+        gmeta = gen_gmeta('subject', 'group', RECORD)
+        entries = gmeta['ingest_data']['gmeta']
+        assert [e['id'] for e in entries] == ['metadata']
+    assert GMETA_LIST['ingest_data']['gmeta'] == []
+
+
+def test_builder_threads_and_streaming():
+    builder = GMetaBuilder('group')
+
+    def add(thread):
+        for i in range(50):
+            builder.add('subject-{}-{}'.format(thread, i), RECORD)
+    threads = [threading.Thread(target=add, args=(t,)) for t in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(builder) == 200
+    stream = io.StringIO()
+    builder.write(stream)
+    assert json.loads(stream.getvalue()) == builder.build()
+    assert json.loads(''.join(GMetaBuilder().iter_json())) == GMETA_LIST
+
+
+def test_relocate_record():
+    relocations = [('https://ep/test/', 'https://ep/prod/'),
+                   ('globus://ep/test/', 'globus://ep/prod/')]
+    reference = {'resource': 'globus://ep/test/metadata/drugs.tsv'}
+    record = {
+        'dc': {'titles': [{'title': 'foo'}]},
+        'files': [{'url': 'https://ep/test/foo/foo.tsv'}],
+        'field_metadata': {
+            'field_table_url': 'https://ep/test/foo/foo.tsv.fields.jsonl',
+            'field_definitions': [{'name': 'DRUG_ID', 'reference': reference},
+                                  {'name': 'value', 'reference': None}],
+        },
+    }
+    record['content_hash'] = canonical_hash(record)
+    moved = relocate_record(record, relocations)
+    assert moved['files'][0]['url'] == 'https://ep/prod/foo/foo.tsv'
+    field_metadata = moved['field_metadata']
+    assert field_metadata['field_table_url'] == \
+        'https://ep/prod/foo/foo.tsv.fields.jsonl'
+    assert field_metadata['field_definitions'][0]['reference'] == {
+        'resource': 'globus://ep/prod/metadata/drugs.tsv'}
+    assert moved['content_hash'] == canonical_hash(moved)
+    # The original is unchanged
+    assert record['files'][0]['url'] == 'https://ep/test/foo/foo.tsv'
+    assert reference['resource'] == 'globus://ep/test/metadata/drugs.tsv'
+    table = relocate_field_table({'name': ['DRUG_ID', 'value'],
+                                  'reference': [reference, None]},
+                                 relocations)
+    assert table['reference'] == [
+        {'resource': 'globus://ep/prod/metadata/drugs.tsv'}, None]
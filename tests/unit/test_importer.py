@@ -0,0 +1,69 @@
+import os
+from click.testing import CliRunner
+from pilot.importer import (read_value_files, iter_sheet, gen_record,
+                            validate_record, iter_batches, Checkpoint)
+from pilot.commands.search.import_commands import import_command
+
+SHEET = (
+    'LOCATION\tTITLE\tNAME\tDESCRIPTION\tDATA TYPE\tDATA FRAME TYPE\tSOURCE\n'
+    'foo/a.tsv\tA\ta.tsv\tFirst\tDrug Response\tMatrix\tNCI60, GDSC\n'
+    'foo/b.tsv\tB\tb.tsv\t\tRNA-seq\tList\t\n'
+    'foo/c.tsv\tC\tc.tsv\t\tNot A Type\tList\t\n'
+)
+
+
+def write_catalog(tmpdir):
+    sheet = tmpdir.join('sheet.tsv')
+    sheet.write(SHEET)
+    tmpdir.join('md5.txt').write('foo/a.tsv abc\nfoo/b.tsv def\n')
+    tmpdir.join('sizes.txt').write('foo/a.tsv 100\n')
+    tmpdir.join('rows.txt').write('foo/a.tsv 10\n')
+    return str(sheet)
+
+
+def test_gen_record(tmpdir):
+    sheet = write_catalog(tmpdir)
+    values = read_value_files(str(tmpdir))
+    rows = list(iter_sheet(sheet))
+    record = gen_record(rows[0], values, 'https://example.com/foo/a.tsv',
+                        'Doe, Jane')
+    validate_record(record)
+    assert record['files'][0]['md5'] == 'abc'
+    assert record['files'][0]['length'] == 100
+    assert record['ncipilot']['source'] == ['NCI60', 'GDSC']
+    assert record['field_metadata'] == {'numrows': 10}
+    assert 'field_metadata' not in gen_record(rows[1], values, 'u', 'Doe')
+
+
+def test_iter_batches():
+    entries = [(str(i), {'content': 'x' * 100}) for i in range(10)]
+    batches = list(iter_batches(entries, max_bytes=350))
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+    locations = [loc for b in batches for loc, _ in b]
+    assert locations == [str(i) for i in range(10)]
+
+
+def test_checkpoint(tmpdir):
+    filename = str(tmpdir.join('progress'))
+    Checkpoint(filename).add(['foo/a.tsv'])
+    cp = Checkpoint(filename)
+    assert 'foo/a.tsv' in cp and 'foo/b.tsv' not in cp
+    cp.clear()
+    assert not os.path.exists(filename)
+
+
+def test_import_command_resumes(tmpdir, mock_command_pilot_cli):
+    sheet = write_catalog(tmpdir)
+    runner = CliRunner()
+    result = runner.invoke(import_command, [sheet, '--creator', 'Doe, Jane',
+                                            '--batch-bytes', '10'])
+    assert result.exit_code == 0
+    assert '2 imported, 0 failed, 1 invalid' in result.output
+    assert 'foo/c.tsv' in result.output
+    assert mock_command_pilot_cli.ingest_entry.call_count == 2
+    gmeta = mock_command_pilot_cli.ingest_entry.call_args[0][0]
+    assert len(gmeta['ingest_data']['gmeta']) == 1
+
+    result = runner.invoke(import_command, [sheet, '--creator', 'Doe, Jane'])
+    assert 'Resuming, skipping 2' in result.output
+    assert mock_command_pilot_cli.ingest_entry.call_count == 2
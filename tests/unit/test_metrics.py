@@ -0,0 +1,75 @@
+import os
+import pytest
+from unittest.mock import Mock
+from pilot import metrics
+from pilot.retry import RequestPolicy
+from pilot.search import compute_checksum
+from tests.unit.mocks import ANALYSIS_FILE_BASE_DIR
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    reg = metrics.Registry()
+    monkeypatch.setattr(metrics, 'registry', reg)
+    return reg
+
+
+def test_render_counters_and_histograms(registry):
+    registry.inc('pilot_upload_bytes_total', 10, method='http')
+    registry.inc('pilot_upload_bytes_total', 5, method='http')
+    registry.observe('pilot_task_wait_seconds', .3)
+    registry.observe('pilot_task_wait_seconds', 120)
+    lines = registry.render().splitlines()
+    assert '# TYPE pilot_upload_bytes_total counter' in lines
+    assert 'pilot_upload_bytes_total{method="http"} 15' in lines
+    assert 'pilot_task_wait_seconds_bucket{le="0.25"} 0' in lines
+    assert 'pilot_task_wait_seconds_bucket{le="0.5"} 1' in lines
+    assert 'pilot_task_wait_seconds_bucket{le="300.0"} 2' in lines
+    assert 'pilot_task_wait_seconds_bucket{le="+Inf"} 2' in lines
+    assert 'pilot_task_wait_seconds_count 2' in lines
+    assert 'pilot_hash_bytes_total' not in registry.render()
+
+
+def test_label_values_are_escaped():
+    line = metrics.format_sample('m', (('path', 'a"b\\c'),), 1)
+    assert line == 'm{path="a\\"b\\\\c"} 1'
+
+
+def test_flush_is_opt_in(registry, tmpdir, monkeypatch):
+    path = str(tmpdir.join('pilot.prom'))
+    registry.inc('pilot_download_bytes_total', 7)
+    monkeypatch.delenv(metrics.METRICS_FILE_ENV, raising=False)
+    monkeypatch.delenv(metrics.METRICS_PUSHGATEWAY_ENV, raising=False)
+    metrics.flush()
+    assert not os.path.exists(path)
+
+    monkeypatch.setenv(metrics.METRICS_FILE_ENV, path)
+    metrics.flush()
+    with open(path) as fh:
+        assert 'pilot_download_bytes_total 7' in fh.read()
+    assert os.listdir(str(tmpdir)) == ['pilot.prom']
+
+
+def test_flush_pushgateway_errors_are_not_raised(registry, monkeypatch,
+                                                 capsys):
+    put = Mock(side_effect=metrics.requests.exceptions.ConnectionError('no'))
+    monkeypatch.setattr(metrics.requests, 'put', put)
+    monkeypatch.delenv(metrics.METRICS_FILE_ENV, raising=False)
+    monkeypatch.setenv(metrics.METRICS_PUSHGATEWAY_ENV, 'http://localhost:1')
+    metrics.flush()
+    assert put.called
+    assert 'Unable to export metrics' in capsys.readouterr().err
+
+
+def test_hooks_record_metrics(registry):
+    func = Mock(return_value='ok')
+    func.__name__ = 'get_subject'
+    RequestPolicy(rate_limit=None).call(func)
+    key = ('pilot_api_requests_total',
+           (('operation', 'get_subject'), ('outcome', 'success')))
+    assert registry.counters[key] == 1
+
+    filename = os.path.join(ANALYSIS_FILE_BASE_DIR, 'simple.tsv')
+    compute_checksum(filename, None)
+    key = ('pilot_hash_bytes_total', (('algorithm', 'sha256'),))
+    assert registry.counters[key] == os.path.getsize(filename)
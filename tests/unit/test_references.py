@@ -0,0 +1,98 @@
+import os
+import pandas
+import pytest
+import pilot.references
+from pilot.analysis import analyze_dataframe
+from pilot.references import (load_key_index, load_reference_indexes,
+                              check_references, file_checksum,
+                              get_reference_location)
+
+FOREIGN_KEYS = {
+    'drug': {'reference': {
+        'resource': 'globus://endpoint/restricted/dataframes/metadata/'
+                    'drugs.tsv',
+        'fields': 'drug_id'}},
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_memo():
+    pilot.references._indexes.clear()
+    pilot.references._checksums.clear()
+
+
+@pytest.fixture
+def reference_dir(tmpdir):
+    tmpdir.mkdir('metadata').join('drugs.tsv').write(
+        'drug_id\tname\n' + ''.join('D{}\tdrug {}\n'.format(i, i)
+                                    for i in range(100)))
+    return tmpdir
+
+
+@pytest.fixture
+def dataframe(tmpdir):
+    df = tmpdir.join('doses.tsv')
+    df.write('drug\tdose\n' + ''.join('D{}\t{}\n'.format(i, i)
+                                      for i in range(90, 110)) + '\t1\n')
+    return str(df)
+
+
+def test_key_index_cached_by_checksum(reference_dir, tmpdir):
+    filename = str(reference_dir.join('metadata', 'drugs.tsv'))
+    cache_dir = str(tmpdir.join('cache'))
+    index = load_key_index(filename, 'drug_id', cache_dir=cache_dir)
+    assert len(index) == 100
+    assert index.checksum == file_checksum(filename)
+    assert len(os.listdir(cache_dir)) == 1
+
+    # A new process loads the saved index instead of reading the table
+    pilot.references._indexes.clear()
+    reloaded = load_key_index(filename, 'drug_id', cache_dir=cache_dir)
+    assert list(reloaded.keys) == list(index.keys)
+
+    # Changing the table builds a new index
+    with open(filename, 'a') as fh:
+        fh.write('D100\tdrug 100\n')
+    os.utime(filename, (0, 0))
+    changed = load_key_index(filename, 'drug_id', cache_dir=cache_dir)
+    assert len(changed) == 101
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_get_reference_location():
+    ref = FOREIGN_KEYS['drug']['reference']
+    assert get_reference_location(ref, ['/restricted/dataframes']) == \
+        'metadata/drugs.tsv'
+
+
+@pytest.mark.parametrize('loaded', [True, False])
+def test_check_references(reference_dir, dataframe, tmpdir, loaded):
+    indexes = load_reference_indexes(FOREIGN_KEYS, str(reference_dir),
+                                     cache_dir=str(tmpdir.join('cache')))
+    df = pandas.read_csv(dataframe, sep='\t') if loaded else None
+    results = check_references(dataframe, indexes, df, chunk_rows=7)
+    assert results['drug']['checked'] == 20
+    assert results['drug']['unmatched'] == 10
+    assert results['drug']['match_rate'] == 0.5
+    assert results['drug']['unmatched_examples'] == \
+        ['D100', 'D101', 'D102', 'D103', 'D104']
+
+
+def test_missing_reference_tables_are_skipped(tmpdir, dataframe):
+    assert load_reference_indexes(FOREIGN_KEYS, str(tmpdir)) == {}
+    assert check_references(dataframe, {}) == {}
+
+
+def test_analyze_dataframe_reference_checks(reference_dir, dataframe,
+                                            tmpdir):
+    indexes = load_reference_indexes(FOREIGN_KEYS, str(reference_dir),
+                                     cache_dir=str(tmpdir.join('cache')))
+    ana = analyze_dataframe(dataframe, FOREIGN_KEYS,
+                            reference_indexes=indexes)
+    drug, dose = ana['field_definitions']
+    assert drug['reference']['fields'] == 'drug_id'
+    assert drug['reference']['unmatched'] == 10
+    assert dose['reference'] is None
+
+    plain = analyze_dataframe(dataframe, FOREIGN_KEYS)
+    assert 'unmatched' not in plain['field_definitions'][0]['reference']
@@ -0,0 +1,91 @@
+import time
+import pytest
+import globus_sdk
+from unittest.mock import Mock
+from pilot.batch import RateLimiter
+from pilot.client import PilotClient
+from pilot.exc import CircuitOpenError
+from pilot.retry import RequestPolicy, CircuitBreaker
+
+
+def api_error(status, headers=None):
+    response = Mock(status_code=status, headers=headers or {}, text='error')
+    return globus_sdk.exc.GlobusAPIError(response)
+
+
+def flaky(*errors, result='ok'):
+    func = Mock(side_effect=list(errors) + [result])
+    func.__name__ = 'get_subject'
+    return func
+
+
+def test_retries_with_backoff():
+    sleep = Mock()
+    policy = RequestPolicy(rate_limit=None, sleep=sleep)
+    func = flaky(api_error(503), api_error(429, {'Retry-After': '2'}))
+    assert policy.call(func, 'index', subject='foo') == 'ok'
+    func.assert_called_with('index', subject='foo')
+    assert sleep.call_args_list[1][0][0] == 2
+    assert policy.get_counters() == {('get_subject', 'retry'): 1,
+                                     ('get_subject', 'throttled'): 1,
+                                     ('get_subject', 'success'): 1}
+
+
+def test_retry_rules():
+    policy = RequestPolicy(rate_limit=None, max_retries=1, sleep=Mock())
+    with pytest.raises(globus_sdk.exc.GlobusAPIError):
+        policy.call(flaky(api_error(404)))
+    with pytest.raises(globus_sdk.exc.GlobusAPIError):
+        policy.call(flaky(api_error(503)), idempotent=False)
+    assert policy.call(flaky(api_error(429)), idempotent=False) == 'ok'
+    with pytest.raises(globus_sdk.exc.GlobusAPIError):
+        policy.call(flaky(api_error(503), api_error(503)))
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    policy = RequestPolicy(rate_limit=None, max_retries=0, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(globus_sdk.exc.GlobusAPIError):
+            policy.call(flaky(api_error(502)))
+    func = flaky()
+    with pytest.raises(CircuitOpenError):
+        policy.call(func)
+    assert not func.called
+    breaker.opened_at -= 60
+    assert policy.call(func) == 'ok'
+    assert breaker.opened_at is None
+
+
+def test_circuit_breaker_per_service():
+    policy = RequestPolicy(rate_limit=None, max_retries=0)
+    for _ in range(5):
+        with pytest.raises(globus_sdk.exc.GlobusAPIError):
+            policy.call(flaky(api_error(502)), service='search')
+    with pytest.raises(CircuitOpenError):
+        policy.call(flaky(), service='search')
+    assert policy.call(flaky(), service='transfer') == 'ok'
+
+
+def test_client_call_api_services_and_deletes(monkeypatch):
+    pc = PilotClient()
+    call = Mock()
+    monkeypatch.setattr(pc.policy, 'call', call)
+    search = globus_sdk.SearchClient()
+    pc._gsearch = search
+    pc.delete_subject_entry('subject', False, full_subject=True)
+    func, _, _ = call.call_args[0]
+    assert func == search.delete_subject
+    assert call.call_args[1] == {'idempotent': False, 'service': 'search'}
+    pc.call_api(globus_sdk.TransferClient().get_task, 'task')
+    assert call.call_args[1] == {'idempotent': True, 'service': 'transfer'}
+
+
+def test_rate_limiter_bursts():
+    limiter = RateLimiter(rate=20, burst=3)
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.wait()
+    assert time.monotonic() - start < 0.04
+    limiter.wait()
+    assert time.monotonic() - start >= 0.04
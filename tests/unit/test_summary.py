@@ -0,0 +1,51 @@
+import numpy
+import pandas
+import pytest
+from pilot.summary import (summarize_dataframe, summarize_rows,
+                           merge_summaries, get_summary_metadata,
+                           to_json, from_json, SKETCH_ACCURACY)
+
+
+@pytest.fixture
+def frame():
+    rand = numpy.random.RandomState(0)
+    return pandas.DataFrame({
+        'value': rand.lognormal(size=1000) * rand.choice([-1, 1], 1000),
+        'label': rand.choice(['a', 'b', 'c', None], 1000),
+    })
+
+
+def test_merged_summaries_match_whole(frame):
+    whole = summarize_dataframe(frame)
+    head = summarize_dataframe(frame.iloc[:600])
+    tail = summarize_rows(frame.iloc[600:], head)
+    merged = {name: merge_summaries(s, tail[name]) for name, s in
+              from_json(to_json(head)).items()}
+
+    value = get_summary_metadata('value', merged['value'])
+    described = frame['value'].describe()
+    assert value['count'] == 1000
+    assert value['mean'] == pytest.approx(described['mean'])
+    assert value['std'] == pytest.approx(described['std'])
+    assert value['min'] == described['min']
+    assert value['max'] == described['max']
+    for key in ['25', '50', '75']:
+        assert value[key] == pytest.approx(described[key + '%'],
+                                           rel=2 * SKETCH_ACCURACY)
+    assert merged['label'] == whole['label']
+    label = get_summary_metadata('label', merged['label'])
+    described = frame['label'].describe()
+    assert (label['count'], label['unique'], label['top'],
+            label['frequency']) == (described['count'], described['unique'],
+                                    described['top'], described['freq'])
+
+
+def test_summarize_rows_rejects_non_numbers(frame):
+    summaries = summarize_dataframe(frame)
+    with pytest.raises(ValueError):
+        summarize_rows(pandas.DataFrame({'value': ['x'], 'label': ['a']}),
+                       summaries)
+
+
+def test_unsupported_columns():
+    assert summarize_dataframe(pandas.DataFrame({'flag': [True]})) is None
@@ -0,0 +1,94 @@
+import time
+import threading
+from unittest.mock import Mock
+from pilot.tokens import TokenManager
+
+NOW = 1000000
+
+
+def token_set(rs, expires_at, refresh_token='refresh'):
+    return {'scope': 'all', 'access_token': '{}-old'.format(rs),
+            'refresh_token': refresh_token, 'token_type': 'Bearer',
+            'expires_at_seconds': expires_at, 'resource_server': rs}
+
+
+def native_client(tokens, delay=0):
+    def refresh_token(refresh_token):
+        time.sleep(delay)
+        return Mock(by_resource_server={
+            rs: {'access_token': '{}-new'.format(rs),
+                 'expires_at_seconds': NOW + 3600}
+            for rs in tokens})
+
+    nc = Mock()
+    nc.load_tokens.return_value = tokens
+    nc.client.oauth2_refresh_token = Mock(side_effect=refresh_token)
+    return nc
+
+
+def test_refresh_only_due_tokens():
+    nc = native_client({
+        'search': token_set('search', NOW + 60),
+        'transfer': token_set('transfer', NOW + 3600),
+        'petrel': token_set('petrel', NOW + 60, refresh_token=None),
+    })
+    tm = TokenManager(nc, refresh_margin=600, clock=lambda: NOW)
+    assert tm.get_next_refresh() == NOW + 60 - 600
+    assert tm.refresh() is True
+    assert nc.client.oauth2_refresh_token.call_count == 1
+    assert nc.token_storage.write_tokens.call_count == 1
+    assert tm.get_access_token('search') == 'search-new'
+    assert tm.get_access_token('transfer') == 'transfer-old'
+    assert tm.get_access_token('petrel') == 'petrel-old'
+    assert tm.refresh() is False
+
+
+def test_refresh_is_single_flight():
+    nc = native_client({'search': token_set('search', NOW + 3600)}, delay=.1)
+    tm = TokenManager(nc, clock=lambda: NOW)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        tm.refresh(['search'], force=True))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [True] * 5
+    assert nc.client.oauth2_refresh_token.call_count == 1
+    assert nc.token_storage.write_tokens.call_count == 1
+
+
+def test_requests_do_not_wait_on_refresh():
+    nc = native_client({'search': token_set('search', NOW + 3600)})
+    tm = TokenManager(nc, clock=lambda: NOW)
+    auth = tm.get_authorizers()['search']
+    headers = {}
+    with tm.refresh_lock:
+        auth.set_authorization_header(headers)
+    assert headers['Authorization'] == 'Bearer search-old'
+    assert auth.handle_missing_authorization() is True
+    auth.set_authorization_header(headers)
+    assert headers['Authorization'] == 'Bearer search-new'
+    tm.stop()
+
+
+def test_background_refresh():
+    nc = native_client({'search': token_set('search', NOW + 60)})
+    tm = TokenManager(nc, clock=lambda: NOW)
+    authorizers = tm.get_authorizers()
+    assert list(authorizers) == ['search']
+    for _ in range(100):
+        if nc.token_storage.write_tokens.called:
+            break
+        time.sleep(.01)
+    tm.stop()
+    assert nc.token_storage.write_tokens.call_count == 1
+    assert tm.thread is None
+
+
+def test_no_background_thread_without_refresh_tokens():
+    nc = native_client({'search': token_set('search', NOW + 60,
+                                            refresh_token=None)})
+    tm = TokenManager(nc, clock=lambda: NOW)
+    tm.get_authorizers()
+    assert tm.thread is None